@@ -0,0 +1,36 @@
+# run all benchmarks offline. json lines with --json
+#
+# $ python -m benchmarks --json >> bench.jsonl
+import argparse
+import logging
+from .common import print_results
+from . import recipe_bench, name_bench, extract_bench, download_bench, process_bench
+
+BENCHMARKS = {
+    "recipe": lambda args: recipe_bench.run(args.recipes),
+    "name": lambda args: name_bench.run(args.count),
+    "extract": lambda args: extract_bench.run(args.size),
+    "download": lambda args: download_bench.run(args.size),
+    "process": lambda args: process_bench.run(args.size),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="benchmarks")
+    parser.add_argument("names", nargs="*", help=", ".join(BENCHMARKS))
+    parser.add_argument("--json", action="store_true", help="json lines")
+    parser.add_argument("--size", type=float, default=16, help="archive MB")
+    parser.add_argument("--recipes", type=int, default=1000)
+    parser.add_argument("--count", type=int, default=100000)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark: {name}")
+
+    for name in args.names or BENCHMARKS:
+        print_results(BENCHMARKS[name](args), as_json=args.json)
+
+
+if __name__ == "__main__":
+    main()
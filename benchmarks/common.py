@@ -0,0 +1,48 @@
+from typing import List, Callable
+import sys
+import json
+import time
+import platform
+
+# every benchmark returns a list of dict. one json line per result
+#
+# {"benchmark": "extract", "case": ".tar.xz", "seconds": 0.1, ...}
+
+
+def measure(func: Callable[[], None], *, repeat: int = 1) -> float:
+    # best of repeat
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def result(benchmark: str, case: str, seconds: float, **values) -> dict:
+    return {"benchmark": benchmark, "case": case, "seconds": round(seconds, 6), **values}
+
+
+def environment() -> dict:
+    return {
+        "time": round(time.time()),
+        "python": platform.python_version(),
+        "platform": f"{platform.system()}-{platform.machine()}",
+    }
+
+
+def print_results(results: List[dict], *, as_json: bool):
+    env = environment()
+    for x in results:
+        if as_json:
+            print(json.dumps({**x, **env}))
+        else:
+            values = " ".join(
+                f"{k}={v}"
+                for k, v in x.items()
+                if k not in ("benchmark", "case", "seconds")
+            )
+            print(
+                f"{x['benchmark']:10} {x['case']:24} {x['seconds']:10.4f} s  {values}"
+            )
+    sys.stdout.flush()
@@ -0,0 +1,103 @@
+# download throughput from a local http server
+#
+# $ python -m benchmarks.download_bench --size 64
+from typing import List
+import os
+import gzip
+import shutil
+import argparse
+import pathlib
+import tempfile
+from tests.httpserver import Server
+from toprefix import runenv
+from toprefix.source import store, formats, download
+from .common import measure, result, print_results
+from .extract_bench import make_tar
+
+
+def run(size_mb: float) -> List[dict]:
+    results = []
+    local_src = runenv.LOCAL_SRC
+    with tempfile.TemporaryDirectory() as dname:
+        work = pathlib.Path(dname)
+        www = work / "www"
+        www.mkdir()
+        (www / "random.bin").write_bytes(os.urandom(int(size_mb * 1024 * 1024)))
+        make_tar(www / "bench.tar", int(size_mb * 1024 * 1024))
+        with (www / "bench.tar").open("rb") as src, gzip.open(
+            www / "bench.tar.gz", "wb", compresslevel=6
+        ) as dst:
+            shutil.copyfileobj(src, dst)
+
+        try:
+            with Server(www) as server:
+                for i, name in enumerate(["random.bin", "bench.tar.gz"]):
+                    size = (www / name).stat().st_size
+                    runenv.LOCAL_SRC = work / f"fetch{i}"
+                    seconds = measure(lambda: store.fetch(f"{server.url}/{name}"))
+                    results.append(
+                        result(
+                            "download",
+                            f"fetch:{name}",
+                            seconds,
+                            bytes=size,
+                            mb_per_second=round(size / seconds / 1024 / 1024, 2),
+                        )
+                    )
+
+                # single stream vs byte range segments
+                size = (www / "random.bin").stat().st_size
+                for connections in (1, download.CONNECTIONS):
+                    dst = work / f"random.{connections}"
+                    seconds = measure(
+                        lambda: download.download(
+                            f"{server.url}/random.bin", dst, connections=connections
+                        )
+                    )
+                    results.append(
+                        result(
+                            "download",
+                            f"connections={connections}:random.bin",
+                            seconds,
+                            bytes=size,
+                            mb_per_second=round(size / seconds / 1024 / 1024, 2),
+                        )
+                    )
+
+                # download and extract at once
+                size = (www / "bench.tar.gz").stat().st_size
+                runenv.LOCAL_SRC = work / "stream"
+                dst = work / "dst"
+                dst.mkdir()
+                seconds = measure(
+                    lambda: store.fetch_stream(
+                        f"{server.url}/bench.tar.gz",
+                        lambda f: formats.extract_stream(
+                            f, formats.FORMATS[".tar.gz"], dst
+                        ),
+                    )
+                )
+                results.append(
+                    result(
+                        "download",
+                        "fetch_stream:bench.tar.gz",
+                        seconds,
+                        bytes=size,
+                        mb_per_second=round(size / seconds / 1024 / 1024, 2),
+                    )
+                )
+        finally:
+            runenv.LOCAL_SRC = local_src
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=float, default=64, help="MB")
+    parser.add_argument("--json", action="store_true", help="json lines")
+    args = parser.parse_args()
+    print_results(run(args.size), as_json=args.json)
+
+
+if __name__ == "__main__":
+    main()
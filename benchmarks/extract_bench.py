@@ -0,0 +1,134 @@
+# extraction time per archive format. external decompressor vs python codec,
+# and Archive.extract from the store
+#
+# $ python -m benchmarks.extract_bench --size 64
+from typing import List
+import argparse
+import io
+import random
+import shutil
+import pathlib
+import tarfile
+import tempfile
+import zipfile
+import subprocess
+from toprefix import runenv
+from toprefix.source import formats, store, Archive
+from .common import measure, result, print_results
+
+COMPRESS = {
+    ".tar.gz": ["gzip", "-k", "-6"],
+    ".tar.xz": ["xz", "-k", "-T0", "-6"],
+    ".tar.bz2": ["bzip2", "-k"],
+    ".tar.zst": ["zstd", "-q", "-T0"],
+    ".tar.lz": ["lzip", "-k"],
+}
+
+
+def make_tar(path: pathlib.Path, size: int):
+    # source like text. compressible but not trivially
+    rng = random.Random(0)
+    words = [
+        "".join(rng.choice("abcdefghijklmnopqrstuvwxyz_") for _ in range(rng.randint(2, 12)))
+        for _ in range(2000)
+    ]
+    written = 0
+    i = 0
+    with tarfile.open(path, "w") as tar:
+        while written < size:
+            lines = []
+            for _ in range(400):
+                lines.append(" ".join(rng.choice(words) for _ in range(8)) + ";\n")
+            data = "".join(lines).encode()
+            info = tarfile.TarInfo(f"bench-1.0.0/src/{i // 100}/{i}.c")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+            written += len(data)
+            i += 1
+
+
+def make_zip(tar: pathlib.Path, path: pathlib.Path):
+    with tarfile.open(tar) as src, zipfile.ZipFile(
+        path, "w", zipfile.ZIP_DEFLATED
+    ) as dst:
+        for member in src:
+            f = src.extractfile(member)
+            if f:
+                dst.writestr(member.name, f.read())
+
+
+def make_archives(work: pathlib.Path, size: int) -> List[pathlib.Path]:
+    tar = work / "bench.tar"
+    make_tar(tar, size)
+    archives = []
+    for ext, compress in COMPRESS.items():
+        if not runenv.which(compress[0]):
+            continue
+        subprocess.run(compress + [str(tar)], check=True)
+        archives.append(work / f"bench{ext}")
+    make_zip(tar, work / "bench.zip")
+    archives.append(work / "bench.zip")
+    return archives
+
+
+def bench_format(path: pathlib.Path, use_tool: bool, work: pathlib.Path) -> dict:
+    _, format = formats.find_format(path.name)
+    dst = work / "dst"
+    seconds = measure(lambda: formats.extract_file(path, format, dst, use_tool=use_tool))
+    shutil.rmtree(dst)
+    tool = format.find_tool() if use_tool else None
+    return result(
+        "extract",
+        f"{format}:{pathlib.Path(tool[0]).name if tool else 'python'}",
+        seconds,
+        archive_bytes=path.stat().st_size,
+    )
+
+
+def bench_archive(path: pathlib.Path, work: pathlib.Path) -> dict:
+    # Archive.extract of an archive in the store. no network
+    _, format = formats.find_format(path.name)
+    local_src = runenv.LOCAL_SRC
+    runenv.LOCAL_SRC = work / "src"
+    try:
+        url = f"https://bench.invalid/bench-1.0.0{format}"
+        copy = work / "copy"
+        shutil.copyfile(path, copy)
+        store.add(copy, url=url)
+        archive = Archive.from_url(url)
+        seconds = measure(archive.extract)
+        shutil.rmtree(runenv.LOCAL_SRC)
+    finally:
+        runenv.LOCAL_SRC = local_src
+    return result("archive", format.ext, seconds, archive_bytes=path.stat().st_size)
+
+
+def run(size_mb: float) -> List[dict]:
+    results = []
+    with tempfile.TemporaryDirectory() as dname:
+        work = pathlib.Path(dname)
+        for path in make_archives(work, int(size_mb * 1024 * 1024)):
+            _, format = formats.find_format(path.name)
+            if format.find_tool():
+                results.append(bench_format(path, True, work))
+            try:
+                results.append(bench_format(path, False, work))
+            except NotImplementedError:
+                pass
+            try:
+                results.append(bench_archive(path, work))
+            except NotImplementedError:
+                pass
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=float, default=32, help="uncompressed MB")
+    parser.add_argument("--json", action="store_true", help="json lines")
+    args = parser.parse_args()
+    print_results(run(args.size), as_json=args.json)
+
+
+if __name__ == "__main__":
+    main()
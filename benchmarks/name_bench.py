@@ -0,0 +1,52 @@
+# archive name parsing throughput
+#
+# $ python -m benchmarks.name_bench --count 100000
+from typing import List
+import argparse
+from toprefix.source import name_version
+from toprefix.source.formats import archive_ext
+from .common import measure, result, print_results
+
+NAMES = [
+    "glib-2.76.1.tar.xz",
+    "libxml2-v2.10.3.tar.gz",
+    "gtkmm-4.9.3.tar.xz",
+    "libsigc++-3.4.0.tar.xz",
+    "xz-5.4.1.tar.bz2",
+    "neovim-0.9.0.zip",
+    "zstd-1.5.5.tar.zst",
+    "ed-1.19.tar.lz",
+]
+
+
+def run(count: int) -> List[dict]:
+    names = [NAMES[i % len(NAMES)] for i in range(count)]
+    stems = [archive_ext(name)[0] for name in names]
+
+    def ext():
+        for name in names:
+            archive_ext(name)
+
+    def parse():
+        for stem in stems:
+            name_version.get_name_version(stem)
+
+    results = []
+    for case, func in (("archive_ext", ext), ("get_name_version", parse)):
+        seconds = measure(func, repeat=3)
+        results.append(
+            result("name", case, seconds, count=count, per_second=round(count / seconds))
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--json", action="store_true", help="json lines")
+    args = parser.parse_args()
+    print_results(run(args.count), as_json=args.json)
+
+
+if __name__ == "__main__":
+    main()
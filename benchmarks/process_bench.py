@@ -0,0 +1,136 @@
+# end to end Pkg.process with stub meson and cmake. measures toprefix overhead:
+# download, extract, stamps and command dispatch
+#
+# $ python -m benchmarks.process_bench --size 8
+from typing import List
+import os
+import sys
+import gzip
+import shutil
+import argparse
+import pathlib
+import tempfile
+from tests.httpserver import Server
+from toprefix import runenv
+from toprefix import buildenv
+from toprefix import compiler_cache
+from toprefix.source import Archive
+from toprefix.package import MesonPkg, CMakePkg
+from .common import measure, result, print_results
+from .extract_bench import make_tar
+
+# meson setup BUILD --prefix P / meson compile -C BUILD / meson install -C BUILD
+STUB_MESON = """\
+import sys, pathlib
+args = sys.argv[1:]
+match args[0]:
+    case "setup":
+        build = pathlib.Path(args[1])
+        (build / "meson-private").mkdir(parents=True, exist_ok=True)
+        (build / "prefix").write_text(args[args.index("--prefix") + 1])
+    case "compile":
+        build = pathlib.Path(args[args.index("-C") + 1])
+        (build / "hoge").write_text("hoge")
+    case "install":
+        build = pathlib.Path(args[args.index("-C") + 1])
+        bin = pathlib.Path((build / "prefix").read_text()) / "bin"
+        bin.mkdir(parents=True, exist_ok=True)
+        (bin / "hoge").write_text((build / "hoge").read_text())
+"""
+
+# cmake -S . -B BUILD -DCMAKE_INSTALL_PREFIX=P / cmake --build BUILD / cmake --install BUILD
+STUB_CMAKE = """\
+import sys, pathlib
+args = sys.argv[1:]
+if args[0] == "--build":
+    (pathlib.Path(args[1]) / "hoge").write_text("hoge")
+elif args[0] == "--install":
+    build = pathlib.Path(args[1])
+    bin = pathlib.Path((build / "prefix").read_text()) / "bin"
+    bin.mkdir(parents=True, exist_ok=True)
+    (bin / "hoge").write_text((build / "hoge").read_text())
+else:
+    build = pathlib.Path(args[args.index("-B") + 1])
+    build.mkdir(parents=True, exist_ok=True)
+    (build / "CMakeCache.txt").write_text("")
+    prefix = [x for x in args if x.startswith("-DCMAKE_INSTALL_PREFIX=")][0]
+    (build / "prefix").write_text(prefix.split("=", 1)[1])
+"""
+
+
+def make_stub(bin: pathlib.Path, name: str, script: str):
+    path = bin / name
+    path.write_text(f"#!{sys.executable}\n{script}", encoding="utf-8")
+    os.chmod(path, 0o755)
+
+
+def run(size_mb: float) -> List[dict]:
+    if runenv.IS_WINDOWS:
+        return []
+    results = []
+    saved = (
+        runenv.LOCAL_SRC,
+        runenv.get_prefix(),
+        runenv.PATH_LIST,
+        buildenv.BUILD_ENV,
+        compiler_cache.get_cache(),
+    )
+    with tempfile.TemporaryDirectory() as dname:
+        work = pathlib.Path(dname)
+        bin = work / "bin"
+        bin.mkdir()
+        make_stub(bin, "meson", STUB_MESON)
+        make_stub(bin, "cmake", STUB_CMAKE)
+        www = work / "www"
+        www.mkdir()
+        make_tar(www / "bench.tar", int(size_mb * 1024 * 1024))
+        with (www / "bench.tar").open("rb") as src, gzip.open(
+            www / "bench-1.0.0.tar.gz", "wb"
+        ) as dst:
+            shutil.copyfileobj(src, dst)
+
+        runenv.PATH_LIST = [str(bin)] + runenv.PATH_LIST
+        buildenv.set_provider(
+            buildenv.StaticEnvProvider(
+                {"PATH": os.pathsep.join([str(bin), "/bin", "/usr/bin"])}
+            )
+        )
+        compiler_cache.set_cache(None)
+        try:
+            with Server(www) as server:
+                for pkg_class in (MesonPkg, CMakePkg):
+                    runenv.LOCAL_SRC = work / pkg_class.__name__ / "src"
+                    runenv.PREFIX = work / pkg_class.__name__ / "prefix"
+                    name = pkg_class.__name__
+                    pkg = pkg_class(
+                        Archive.from_url(f"{server.url}/bench-1.0.0.tar.gz")
+                    )
+                    process = lambda: pkg.process(clean=False, reconfigure=False)
+                    results.append(result("process", f"{name}:cold", measure(process)))
+                    assert (runenv.PREFIX / "bin/hoge").exists()
+                    # stamps are up to date
+                    results.append(
+                        result("process", f"{name}:noop", measure(process, repeat=3))
+                    )
+        finally:
+            (
+                runenv.LOCAL_SRC,
+                runenv.PREFIX,
+                runenv.PATH_LIST,
+                buildenv.BUILD_ENV,
+                cache,
+            ) = saved
+            compiler_cache.set_cache(cache)
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=float, default=8, help="uncompressed MB")
+    parser.add_argument("--json", action="store_true", help="json lines")
+    args = parser.parse_args()
+    print_results(run(args.size), as_json=args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# package.init_pkgs over a synthetic recipe tree
+#
+# $ python -m benchmarks.recipe_bench --recipes 1000
+from typing import List
+import argparse
+import pathlib
+import tempfile
+from toprefix import runenv
+from toprefix import package
+from .common import measure, result, print_results
+
+RECIPE = """\
+[{name}]
+source.url = "https://download.example.com/{name}/{name}-1.{i}.0.tar.gz"
+deps = [{deps}]
+pkg.meson = {{ args = "-Dtests=false" }}
+
+"""
+
+
+def make_tree(root: pathlib.Path, count: int):
+    # 10 recipes per toml, 10 toml per dir
+    for i in range(count):
+        f = root / f"group{i // 100}" / f"recipes{i // 10}.toml"
+        f.parent.mkdir(parents=True, exist_ok=True)
+        deps = f'"pkg{i - 1}"' if i % 10 else ""
+        with f.open("a", encoding="utf-8") as w:
+            w.write(RECIPE.format(name=f"pkg{i}", i=i, deps=deps))
+
+
+def run(count: int) -> List[dict]:
+    results = []
+    local_src = runenv.LOCAL_SRC
+    with tempfile.TemporaryDirectory() as dname:
+        work = pathlib.Path(dname)
+        root = work / "assets"
+        make_tree(root, count)
+        runenv.LOCAL_SRC = work / "src"
+        try:
+
+            def cold():
+                (runenv.LOCAL_SRC / ".index.json").unlink(missing_ok=True)
+                package.init_pkgs(root)
+
+            results.append(result("recipe", "init_pkgs:cold", measure(cold), recipes=count))
+            results.append(
+                result(
+                    "recipe",
+                    "init_pkgs:cached",
+                    measure(lambda: package.init_pkgs(root), repeat=5),
+                    recipes=count,
+                )
+            )
+
+            def load_all():
+                package.init_pkgs(root)
+                for pkg in package.iter_pkgs():
+                    pass
+
+            results.append(
+                result("recipe", "iter_pkgs", measure(load_all), recipes=count)
+            )
+        finally:
+            runenv.LOCAL_SRC = local_src
+            package.INDEX = None
+            package.PKG_MAP.clear()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipes", type=int, default=1000)
+    parser.add_argument("--json", action="store_true", help="json lines")
+    args = parser.parse_args()
+    print_results(run(args.recipes), as_json=args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import unittest
+import io
+import shutil
+import pathlib
+import tarfile
+import zipfile
+import hashlib
+import tempfile
+from httpserver import Server
+from toprefix import runenv
+from toprefix.source import Archive, store, formats
+
+
+def make_tar(path: pathlib.Path, root: str, mode: str):
+    with tarfile.open(path, mode) as tar:
+        for i in range(3):
+            data = f"{root} {i}\n".encode() * 1000
+            info = tarfile.TarInfo(f"{root}/src/{i}.c")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+def make_zip(path: pathlib.Path, root: str):
+    with zipfile.ZipFile(path, "w") as z:
+        for i in range(3):
+            z.writestr(f"{root}/src/{i}.c", f"{root} {i}\n" * 1000)
+
+
+class TestArchive(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        root = pathlib.Path(self.tmp.name)
+        self.www = root / "www"
+        self.www.mkdir()
+        self.local_src = runenv.LOCAL_SRC
+        runenv.LOCAL_SRC = root / "src"
+
+    def tearDown(self):
+        runenv.LOCAL_SRC = self.local_src
+        self.tmp.cleanup()
+
+    def check(self, extract: pathlib.Path, root: str):
+        self.assertEqual(extract, runenv.LOCAL_SRC / root)
+        self.assertEqual((extract / "src/2.c").read_text(), f"{root} 2\n" * 1000)
+        # no staging left
+        self.assertEqual(
+            [x.name for x in runenv.LOCAL_SRC.iterdir() if not x.name.startswith(".")],
+            [root],
+        )
+        self.assertEqual(
+            [x for x in runenv.LOCAL_SRC.glob(f".{root}.*")],
+            [],
+        )
+
+    def test_stream(self):
+        for ext, mode in ((".tar.gz", "w:gz"), (".tar.xz", "w:xz"), (".tar.bz2", "w:bz2")):
+            with self.subTest(ext=ext):
+                make_tar(self.www / f"hoge-1.0.0{ext}", "hoge-1.0.0", mode)
+                with Server(self.www) as server:
+                    archive = Archive.from_url(f"{server.url}/hoge-1.0.0{ext}")
+                    self.assertTrue(archive.can_stream(formats.FORMATS[ext]))
+                    self.check(archive.extract(), "hoge-1.0.0")
+                    # archive is kept in the store
+                    self.assertFalse(archive.can_stream(formats.FORMATS[ext]))
+                    self.assertEqual(
+                        archive.download_path.read_bytes(),
+                        (self.www / f"hoge-1.0.0{ext}").read_bytes(),
+                    )
+                    # remove extracted and extract from the store
+                    shutil.rmtree(runenv.LOCAL_SRC / "hoge-1.0.0")
+                    self.check(archive.extract(), "hoge-1.0.0")
+                    shutil.rmtree(runenv.LOCAL_SRC / "hoge-1.0.0")
+
+    def test_zip(self):
+        make_zip(self.www / "hoge-1.0.0.zip", "hoge-1.0.0")
+        with Server(self.www) as server:
+            archive = Archive.from_url(f"{server.url}/hoge-1.0.0.zip")
+            self.assertFalse(archive.can_stream(formats.FORMATS[".zip"]))
+            self.check(archive.extract(), "hoge-1.0.0")
+
+    def test_stream_checksum(self):
+        make_tar(self.www / "hoge-1.0.0.tar.gz", "hoge-1.0.0", "w:gz")
+        with Server(self.www) as server:
+            archive = Archive.from_url(f"{server.url}/hoge-1.0.0.tar.gz")
+            archive.sha256 = "0" * 64
+            with self.assertRaises(store.ChecksumError):
+                archive.extract()
+            self.assertFalse((runenv.LOCAL_SRC / "hoge-1.0.0").exists())
+
+            archive.sha256 = hashlib.sha256(
+                (self.www / "hoge-1.0.0.tar.gz").read_bytes()
+            ).hexdigest()
+            self.check(archive.extract(), "hoge-1.0.0")
+
+
+if __name__ == "__main__":
+    unittest.main()
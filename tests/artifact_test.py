@@ -0,0 +1,167 @@
+import unittest
+import io
+import os
+import pathlib
+import tarfile
+import tempfile
+from toprefix import runenv
+from toprefix import artifact
+from toprefix import manifest
+
+
+class FakeSource:
+    def __init__(self, name: str, fingerprint: str):
+        self.name = name
+        self.patches = []
+        self._fingerprint = fingerprint
+
+    def fetch(self) -> int:
+        return 0
+
+    def fingerprint(self) -> str:
+        return self._fingerprint
+
+
+class FakePkg:
+    def __init__(self, name: str, fingerprint: str = "abc", deps=[]):
+        self.source = FakeSource(name, fingerprint)
+        self.deps = deps
+        self.recipe = {"pkg": {"meson": {}}}
+        self.count = 0
+        # False: installs to PREFIX ignoring DESTDIR
+        self.staged = True
+
+    def process(self, *, clean: bool, reconfigure: bool):
+        self.count += 1
+        destdir = pathlib.Path(runenv.ENV.overlay["DESTDIR"])
+        self.destdir = destdir
+        if not self.staged:
+            destdir = pathlib.Path(runenv.PREFIX.anchor)
+        bin = destdir / runenv.PREFIX.relative_to(runenv.PREFIX.anchor) / "bin"
+        bin.mkdir(parents=True, exist_ok=True)
+        (bin / self.source.name).write_text(self.source._fingerprint)
+        link = bin / f"{self.source.name}-link"
+        link.unlink(missing_ok=True)
+        link.symlink_to(self.source.name)
+
+
+class TestArtifact(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        root = pathlib.Path(self.tmp.name)
+        self.prefix = runenv.PREFIX
+        runenv.PREFIX = root / "prefix"
+        self.local_src = runenv.LOCAL_SRC
+        runenv.LOCAL_SRC = root / "src"
+        self.cache_dir = root / "cache"
+
+    def tearDown(self):
+        runenv.PREFIX = self.prefix
+        runenv.LOCAL_SRC = self.local_src
+        self.tmp.cleanup()
+
+    def test_restore(self):
+        pkg = FakePkg("hoge")
+        artifact.ArtifactCache(self.cache_dir).process(pkg, clean=False, reconfigure=False)
+        self.assertEqual(pkg.count, 1)
+        self.assertEqual((runenv.PREFIX / "bin/hoge").read_text(), "abc")
+        self.assertTrue((runenv.PREFIX / "bin/hoge-link").is_symlink())
+        # staged locally. only the artifact in the cache
+        self.assertEqual(artifact.get_stage_dir(), pkg.destdir.parent)
+        self.assertEqual(1, len(list(self.cache_dir.iterdir())))
+
+        # installed. not unpacked again
+        cache = artifact.ArtifactCache(self.cache_dir)
+        [path] = self.cache_dir.glob("*.tar.gz")
+        path.rename(self.cache_dir.parent / path.name)
+        cache.process(pkg, clean=False, reconfigure=False)
+        self.assertEqual(pkg.count, 1)
+        installed = manifest.get_db().load("hoge")
+        assert installed
+        self.assertEqual(cache.keys["hoge"], installed["artifact"])
+        (self.cache_dir.parent / path.name).rename(path)
+
+        # fresh prefix
+        (runenv.PREFIX / "bin/hoge").unlink()
+        (runenv.PREFIX / "bin/hoge-link").unlink()
+        artifact.ArtifactCache(self.cache_dir).process(pkg, clean=False, reconfigure=False)
+        self.assertEqual(pkg.count, 1)
+        self.assertEqual((runenv.PREFIX / "bin/hoge").read_text(), "abc")
+        self.assertTrue((runenv.PREFIX / "bin/hoge-link").is_symlink())
+
+        # rebuild
+        artifact.ArtifactCache(self.cache_dir).process(pkg, clean=True, reconfigure=False)
+        self.assertEqual(pkg.count, 2)
+
+    def test_nothing_staged(self):
+        pkg = FakePkg("hoge")
+        artifact.process_staged(pkg, clean=False, reconfigure=False)
+        self.assertIsNotNone(manifest.get_db().load("hoge"))
+
+        # the installed files and the manifest are kept
+        pkg.staged = False
+        artifact.process_staged(pkg, clean=False, reconfigure=False)
+        self.assertEqual(2, pkg.count)
+        self.assertEqual("abc", (runenv.PREFIX / "bin/hoge").read_text())
+        self.assertIsNotNone(manifest.get_db().load("hoge"))
+
+    def make_tar(self, *members: tarfile.TarInfo) -> pathlib.Path:
+        path = self.cache_dir / "check.tar.gz"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tarfile.open(path, "w:gz") as tar:
+            for member in members:
+                tar.addfile(member, io.BytesIO(b"") if member.isfile() else None)
+        return path
+
+    def member(self, name: str, type=tarfile.REGTYPE, linkname: str = ""):
+        member = tarfile.TarInfo(name)
+        member.type = type
+        member.linkname = linkname
+        return member
+
+    def test_check_members(self):
+        prefix = runenv.PREFIX.relative_to(runenv.PREFIX.anchor).as_posix()
+        artifact.check_members(
+            self.make_tar(
+                self.member(f"{prefix}/bin/hoge"),
+                self.member(f"{prefix}/bin/link", tarfile.SYMTYPE, "hoge"),
+                self.member(f"{prefix}/lib/link", tarfile.SYMTYPE, "../bin/hoge"),
+                self.member(
+                    f"{prefix}/bin/abs", tarfile.SYMTYPE, f"{runenv.PREFIX}/bin/hoge"
+                ),
+                self.member(f"{prefix}/bin/hard", tarfile.LNKTYPE, f"{prefix}/bin/hoge"),
+            )
+        )
+        for member in (
+            self.member("/etc/passwd"),
+            self.member(f"{prefix}/../../../etc/passwd"),
+            self.member(f"{prefix}/bin/link", tarfile.SYMTYPE, "/etc/passwd"),
+            self.member(f"{prefix}/bin/link", tarfile.SYMTYPE, "../../../../etc"),
+            self.member(f"{prefix}/bin/hard", tarfile.LNKTYPE, "etc/passwd"),
+        ):
+            with self.assertRaises(Exception, msg=member.name):
+                artifact.check_members(self.make_tar(member))
+
+    def test_key(self):
+        dep = FakePkg("dep")
+        pkg = FakePkg("hoge", deps=["dep"])
+        key = artifact.artifact_key(pkg, {"dep": artifact.artifact_key(dep, {})})
+        dep.source._fingerprint = "def"
+        self.assertNotEqual(
+            key, artifact.artifact_key(pkg, {"dep": artifact.artifact_key(dep, {})})
+        )
+
+    def test_evict(self):
+        self.cache_dir.mkdir()
+        for i, name in enumerate(["a", "b", "c"]):
+            path = self.cache_dir / f"{name}.tar.gz"
+            path.write_bytes(b"x" * 100)
+            os.utime(path, (i, i))
+        artifact.evict(self.cache_dir, 250)
+        self.assertEqual(
+            sorted(x.name for x in self.cache_dir.iterdir()), ["b.tar.gz", "c.tar.gz"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import pathlib
+import tempfile
+import unittest
+from toprefix import runenv
+from benchmarks import (
+    recipe_bench,
+    name_bench,
+    extract_bench,
+    download_bench,
+    process_bench,
+)
+
+
+class TestBenchmarks(unittest.TestCase):
+    # smallest sizes. keep the suite runnable
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.local_src = runenv.LOCAL_SRC
+        runenv.LOCAL_SRC = pathlib.Path(self.tmp.name) / "src"
+
+    def tearDown(self):
+        runenv.LOCAL_SRC = self.local_src
+        self.tmp.cleanup()
+
+    def check(self, results):
+        self.assertTrue(results)
+        for x in results:
+            self.assertIn("benchmark", x)
+            self.assertIn("case", x)
+            self.assertGreaterEqual(x["seconds"], 0)
+
+    def test_recipe(self):
+        self.check(recipe_bench.run(20))
+
+    def test_name(self):
+        self.check(name_bench.run(100))
+
+    def test_extract(self):
+        self.check(extract_bench.run(0.1))
+
+    def test_download(self):
+        self.check(download_bench.run(0.1))
+
+    @unittest.skipIf(runenv.IS_WINDOWS, "stub scripts")
+    def test_process(self):
+        self.check(process_bench.run(0.1))
+
+
+if __name__ == "__main__":
+    unittest.main()
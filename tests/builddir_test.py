@@ -0,0 +1,72 @@
+import pathlib
+import tempfile
+import unittest
+from toprefix import runenv
+from toprefix import builddir
+
+
+class TestBuildDir(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmp.name)
+        self.saved = runenv.LOCAL_SRC, runenv.get_config(), builddir.BUILD_TYPE
+        runenv.LOCAL_SRC = self.root / "src"
+        self.source_dir = runenv.LOCAL_SRC / "hoge-1.0"
+        self.fast = self.root / "fast"
+
+    def tearDown(self):
+        runenv.LOCAL_SRC, runenv.CONFIG, builddir.BUILD_TYPE = self.saved
+        self.tmp.cleanup()
+
+    def test_default(self):
+        runenv.CONFIG = {}
+        self.assertEqual(
+            runenv.LOCAL_SRC / ".build/hoge-1.0/default",
+            builddir.get_build_dir(self.source_dir),
+        )
+
+    def test_build_root(self):
+        runenv.CONFIG = {"build_root": str(self.fast), "build_type": "debug"}
+        self.assertEqual(
+            self.fast / "hoge-1.0/debug", builddir.get_build_dir(self.source_dir)
+        )
+        self.assertEqual(" --buildtype=debug", builddir.meson_args())
+        self.assertEqual("Debug", builddir.cmake_build_type())
+
+        # variants coexist
+        builddir.BUILD_TYPE = "release"
+        self.assertEqual(
+            self.fast / "hoge-1.0/release", builddir.get_build_dir(self.source_dir)
+        )
+
+    def test_fallback(self):
+        # no root has 1 PB free
+        runenv.CONFIG = {"build_root": [str(self.fast)], "build_root_min_free": 2**30}
+        with self.assertLogs("toprefix.builddir", "WARNING"):
+            build_dir = builddir.get_build_dir(self.source_dir)
+        self.assertEqual(runenv.LOCAL_SRC / ".build/hoge-1.0/default", build_dir)
+
+        # configured tree is kept
+        (self.fast / "hoge-1.0/default").mkdir(parents=True)
+        self.assertEqual(
+            self.fast / "hoge-1.0/default", builddir.get_build_dir(self.source_dir)
+        )
+
+    def test_prepare(self):
+        runenv.CONFIG = {"build_root": str(self.fast)}
+        build_dir = builddir.prepare(self.source_dir, clean=False)
+        (build_dir / "hoge.o").write_text("")
+        builddir.prepare(self.source_dir, clean=False)
+        self.assertTrue((build_dir / "hoge.o").exists())
+        builddir.prepare(self.source_dir, clean=True)
+        self.assertFalse((build_dir / "hoge.o").exists())
+        self.assertTrue(build_dir.is_dir())
+
+    def test_invalid(self):
+        runenv.CONFIG = {"build_type": "fast"}
+        with self.assertRaises(Exception):
+            builddir.get_build_type()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+import pathlib
+import tempfile
+from toprefix import runenv
+from toprefix import buildenv
+
+
+class TestBuildEnv(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache_dir = pathlib.Path(self.tmp.name)
+        self.prefix = runenv.PREFIX
+        runenv.PREFIX = pathlib.Path("/opt/prefix")
+
+    def tearDown(self):
+        runenv.PREFIX = self.prefix
+        buildenv.BUILD_ENV = None
+        self.tmp.cleanup()
+
+    def test_session(self):
+        provider = buildenv.StaticEnvProvider({"PATH": "/usr/bin"})
+        buildenv.set_provider(provider)
+        env = buildenv.get_env()
+        buildenv.get_env()
+        self.assertEqual(provider.count, 1)
+        self.assertEqual(env["PATH"], "/usr/bin")
+        self.assertIn("/opt/prefix/lib/pkgconfig", env["PKG_CONFIG_PATH"])
+
+    def test_overlay(self):
+        buildenv.set_provider(buildenv.StaticEnvProvider({"PATH": "/usr/bin"}))
+        with runenv.setenv(CC="ccache cc"):
+            with runenv.setenv(DESTDIR="/tmp/stage"):
+                env = buildenv.get_env(runenv.get_overlay())
+        self.assertEqual(env["CC"], "ccache cc")
+        self.assertEqual(env["DESTDIR"], "/tmp/stage")
+        self.assertNotIn("CC", buildenv.get_env(runenv.get_overlay()))
+
+    def test_disk_cache(self):
+        provider = buildenv.StaticEnvProvider({"PATH": "/usr/bin"})
+        buildenv.BuildEnv(provider, self.cache_dir).get()
+        buildenv.BuildEnv(provider, self.cache_dir).get()
+        self.assertEqual(provider.count, 1)
+
+        # key changed
+        provider.env["PATH"] = "/bin"
+        self.assertEqual(buildenv.BuildEnv(provider, self.cache_dir).get()["PATH"], "/bin")
+        self.assertEqual(provider.count, 2)
+
+    def test_run(self):
+        buildenv.set_provider(
+            buildenv.StaticEnvProvider({"PATH": "/usr/bin:/bin", "HOGE": "fuga"})
+        )
+        out = pathlib.Path(self.tmp.name) / "out.txt"
+        runenv.run(f"echo $HOGE > {out}")
+        self.assertEqual(out.read_text().strip(), "fuga")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import json
+import pathlib
+import tempfile
+import unittest
+from toprefix import runenv
+from toprefix import compiler_cache
+
+
+CCACHE_STATS = """\
+stats_updated_timestamp\t1700000000
+direct_cache_hit\t7
+preprocessed_cache_hit\t2
+cache_miss\t3
+files_in_cache\t24
+"""
+
+SCCACHE_STATS = {
+    "stats": {
+        "compile_requests": 10,
+        "cache_hits": {"counts": {"C/C++": 4, "Rust": 1}},
+        "cache_misses": {"counts": {"C/C++": 2}},
+    }
+}
+
+# prints the stats in $CCACHE_DIR/stats. each call counts one more hit
+FAKE_CCACHE = """\
+#!/bin/sh
+n=$(cat "$CCACHE_DIR/stats")
+echo $((n + 1)) > "$CCACHE_DIR/stats"
+printf 'direct_cache_hit\\t%s\\ncache_miss\\t1\\n' "$n"
+"""
+
+
+class TestCompilerCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.local_src = runenv.LOCAL_SRC
+        runenv.LOCAL_SRC = pathlib.Path(self.tmp.name)
+
+    def tearDown(self):
+        compiler_cache.set_cache(None)
+        runenv.LOCAL_SRC = self.local_src
+        self.tmp.cleanup()
+
+    def test_parse(self):
+        self.assertEqual(compiler_cache.parse_ccache_stats(CCACHE_STATS), (9, 3))
+        self.assertEqual(
+            compiler_cache.parse_sccache_stats(json.dumps(SCCACHE_STATS)), (5, 2)
+        )
+
+    def test_args(self):
+        ccache = pathlib.Path("/usr/bin/ccache")
+        compiler_cache.set_cache(
+            compiler_cache.CompilerCache("ccache", ccache, runenv.LOCAL_SRC / "ccache")
+        )
+        self.assertEqual(
+            compiler_cache.cmake_args(),
+            " -DCMAKE_C_COMPILER_LAUNCHER=/usr/bin/ccache -DCMAKE_CXX_COMPILER_LAUNCHER=/usr/bin/ccache",
+        )
+        self.assertTrue(compiler_cache.compiler_env()["CC"].startswith("/usr/bin/ccache "))
+        self.assertEqual(compiler_cache.get_tool(), "ccache")
+
+        compiler_cache.set_cache(None)
+        self.assertEqual(compiler_cache.cmake_args(), "")
+        self.assertEqual(compiler_cache.compiler_env(), {})
+
+    @unittest.skipIf(runenv.IS_WINDOWS, "sh")
+    def test_measure(self):
+        tool = runenv.LOCAL_SRC / "ccache"
+        tool.write_text(FAKE_CCACHE, encoding="utf-8")
+        os.chmod(tool, 0o755)
+        dir = runenv.LOCAL_SRC / ".compiler_cache" / "ccache"
+        dir.mkdir(parents=True)
+        (dir / "stats").write_text("10", encoding="utf-8")
+        compiler_cache.set_cache(compiler_cache.CompilerCache("ccache", tool, dir))
+
+        with compiler_cache.measure("hoge"):
+            self.assertEqual(runenv.get_overlay()["CCACHE_DIR"], str(dir))
+
+        stats = compiler_cache.load_stats()["hoge"]
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 0)
+
+        # concurrent builds count the hits of each other
+        with compiler_cache.measure("fuga"):
+            with compiler_cache.measure("piyo"):
+                pass
+        with compiler_cache.measure("hogera"):
+            pass
+        self.assertEqual({"hoge", "hogera"}, set(compiler_cache.load_stats()))
+
+
+if __name__ == "__main__":
+    unittest.main()
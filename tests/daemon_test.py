@@ -0,0 +1,93 @@
+import io
+import socket
+import logging
+import pathlib
+import tempfile
+import unittest
+import contextlib
+import importlib.util
+from toprefix import runenv
+from toprefix import runner
+from toprefix import package
+from toprefix import daemon
+from toprefix import __main__
+
+
+@unittest.skipUnless(hasattr(socket, "AF_UNIX"), "unix socket")
+@unittest.skipUnless(
+    importlib.util.find_spec("toprefix._version"), "toprefix._version is generated"
+)
+class TestDaemon(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmp.name)
+        self.saved = runenv.LOCAL_SRC
+        runenv.LOCAL_SRC = self.root / "src"
+        self.path = self.root / "serve.sock"
+
+    def tearDown(self):
+        runenv.LOCAL_SRC = self.saved
+        self.tmp.cleanup()
+
+    def forward(self, *argv: str):
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            code = daemon.forward(list(argv), self.path)
+        return code, stdout.getvalue(), stderr.getvalue()
+
+    def test_forward(self):
+        stdout = io.StringIO()
+        parser = __main__.make_parser()
+        with contextlib.redirect_stdout(stdout):
+            __main__.dispatch(parser, parser.parse_args(["list"]))
+
+        with daemon.Daemon(self.path):
+            index = package.INDEX
+            self.assertEqual((0, stdout.getvalue(), ""), self.forward("-q", "list"))
+            # warm. not reloaded
+            self.forward("-v", "list")
+            self.assertIs(index, package.INDEX)
+
+            code, _, stderr = self.forward("owns")
+            self.assertEqual(2, code)
+            self.assertIn("usage:", stderr)
+
+            # run in-process
+            self.assertIsNone(self.forward("install", "glib")[0])
+        self.assertFalse(self.path.exists())
+
+    def test_verbosity(self):
+        root = logging.getLogger()
+        saved = runner.VERBOSITY, root.level
+        with daemon.Daemon(self.path):
+            # logs of the command with the -q / -v of the client
+            self.assertIn("INFO:toprefix.__main__:list", self.forward("-v", "list")[2])
+            self.assertEqual(saved, (runner.VERBOSITY, root.level))
+            self.assertEqual("", self.forward("-q", "list")[2])
+        self.assertEqual(saved, (runner.VERBOSITY, root.level))
+
+    def test_no_daemon(self):
+        self.assertIsNone(self.forward("list")[0])
+
+        # stale socket of a killed daemon
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.bind(str(self.path))
+        self.assertTrue(self.path.exists())
+        self.assertIsNone(self.forward("list")[0])
+        with daemon.Daemon(self.path):
+            self.assertEqual(0, self.forward("list")[0])
+            with self.assertRaises(Exception):
+                daemon.Daemon(self.path)
+
+    def test_forwarded(self):
+        self.assertTrue(daemon.is_forwarded(["-q", "owns", "list"]))
+        self.assertFalse(daemon.is_forwarded(["install", "list"]))
+        self.assertFalse(daemon.is_forwarded(["serve"]))
+        # network checks block the daemon
+        self.assertFalse(daemon.is_forwarded(["outdated"]))
+        self.assertFalse(daemon.is_forwarded([]))
+
+
+if __name__ == "__main__":
+    unittest.main()
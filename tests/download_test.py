@@ -0,0 +1,121 @@
+import os
+import unittest
+import pathlib
+import tempfile
+from httpserver import Server
+from toprefix.source import download
+
+WRITE_AT = download.write_at
+
+
+class TestSegmented(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        root = pathlib.Path(self.tmp.name)
+        self.www = root / "www"
+        self.www.mkdir()
+        self.dst = root / "dst" / "hoge.part"
+        self.data = os.urandom(100 * 1024 + 7)
+        (self.www / "hoge.tar.gz").write_bytes(self.data)
+        self.segment_size = download.SEGMENT_SIZE
+        download.SEGMENT_SIZE = 16 * 1024
+
+    def tearDown(self):
+        download.SEGMENT_SIZE = self.segment_size
+        self.tmp.cleanup()
+
+    def test_split(self):
+        self.assertEqual(download.split_segments(10, 16, 4), [(0, 9)])
+        segments = download.split_segments(100 * 1024 + 7, 16 * 1024, 2)
+        self.assertEqual(segments[0], (0, 16 * 1024 - 1))
+        self.assertEqual(segments[-1][1], 100 * 1024 + 6)
+        # contiguous
+        for (_, end), (start, _) in zip(segments, segments[1:]):
+            self.assertEqual(end + 1, start)
+
+    def test_segmented(self):
+        with Server(self.www) as server:
+            size = download.download(
+                f"{server.url}/hoge.tar.gz", self.dst, connections=3
+            )
+            self.assertEqual(size, len(self.data))
+            self.assertEqual(self.dst.read_bytes(), self.data)
+            self.assertFalse(self.dst.with_name("hoge.part.segments").exists())
+            self.assertGreater(len(server.ranges), 2)
+            self.assertTrue(all(server.ranges))
+
+    def test_weak_etag(self):
+        # If-Range with last-modified instead
+        with Server(self.www, etag='W/"hoge"') as server:
+            download.download(f"{server.url}/hoge.tar.gz", self.dst, connections=3)
+            self.assertEqual(self.dst.read_bytes(), self.data)
+            self.assertGreater(len(server.ranges), 2)
+            self.assertNotIn(None, server.ranges)
+
+    def test_range_ignored(self):
+        # the probe is 206 but the segments get 200. single stream
+        with Server(self.www) as server:
+            server.handler.max_ranges = 1
+            download.download(f"{server.url}/hoge.tar.gz", self.dst, connections=3)
+            self.assertEqual(self.dst.read_bytes(), self.data)
+            self.assertIn(None, server.ranges)
+            self.assertFalse(self.dst.with_name("hoge.part.segments").exists())
+
+    def test_resume(self):
+        with Server(self.www, etag='"hoge"') as server:
+            url = f"{server.url}/hoge.tar.gz"
+            server.handler.truncate_from = 64 * 1024
+            # connection reset by the client
+            server.server.handle_error = lambda *args: None
+            with self.assertRaises(Exception):
+                download.download(url, self.dst, connections=2)
+            self.assertFalse(self.dst.exists())
+            self.assertTrue(self.dst.with_name("hoge.part.segments").exists())
+
+            server.handler.truncate_from = None
+            server.ranges.clear()
+            size = download.download(url, self.dst, connections=2)
+            self.assertEqual(self.dst.read_bytes(), self.data)
+            self.assertLess(size, len(self.data))
+            # probe and the segments after 64k
+            starts = [int(x.removeprefix("bytes=").split("-")[0]) for x in server.ranges]
+            self.assertEqual(0, starts[0])
+            self.assertTrue(all(start >= 64 * 1024 for start in starts[1:]))
+            self.assertFalse(self.dst.with_name("hoge.part.segments.json").exists())
+
+    def test_interrupted(self):
+        def write_at(fd: int, data: bytes, pos: int):
+            raise KeyboardInterrupt()
+
+        with Server(self.www, etag='"hoge"') as server:
+            download.write_at = write_at
+            try:
+                with self.assertRaises(KeyboardInterrupt):
+                    download.download(
+                        f"{server.url}/hoge.tar.gz", self.dst, connections=2
+                    )
+            finally:
+                download.write_at = WRITE_AT
+            # stopped. no single stream fallback
+            self.assertFalse(self.dst.exists())
+            self.assertTrue(self.dst.with_name("hoge.part.segments").exists())
+
+    def test_no_range(self):
+        # the probe gets 200. single stream
+        with Server(self.www, no_range=True) as server:
+            size = download.download(
+                f"{server.url}/hoge.tar.gz", self.dst, connections=3
+            )
+            self.assertEqual(size, len(self.data))
+            self.assertEqual(self.dst.read_bytes(), self.data)
+            self.assertEqual(len(server.ranges), 1)
+
+    def test_single(self):
+        with Server(self.www) as server:
+            download.download(f"{server.url}/hoge.tar.gz", self.dst, connections=1)
+            self.assertEqual(self.dst.read_bytes(), self.data)
+            self.assertEqual(server.ranges, [None])
+
+
+if __name__ == "__main__":
+    unittest.main()
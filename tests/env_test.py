@@ -1,11 +1,31 @@
+import pathlib
+import tempfile
 import unittest
-from toprefix.envman import EnvMan
+from toprefix import runenv
 from toprefix import vcenv
 
 
 class TestEnv(unittest.TestCase):
-    def test_upper(self):
-        vcenv.get_env({})
+    def setUp(self):
+        # runenv.which caches LOCAL_SRC/.toolchain.json
+        self.tmp = tempfile.TemporaryDirectory()
+        self.local_src = runenv.LOCAL_SRC
+        runenv.LOCAL_SRC = pathlib.Path(self.tmp.name) / "src"
+
+    def tearDown(self):
+        runenv.LOCAL_SRC = self.local_src
+        self.tmp.cleanup()
+
+    def test_minimum_env(self):
+        env = runenv.minimum_env()
+        self.assertIn("PATH", env)
+        for k in env:
+            self.assertTrue(k == "PATH" or k in runenv.ENV_KEYS, k)
+
+    def test_vcenv(self):
+        env = vcenv.get_env({})
+        if not runenv.IS_WINDOWS:
+            self.assertEqual(env, {})
 
 
 if __name__ == "__main__":
@@ -0,0 +1,69 @@
+import unittest
+import pathlib
+import tempfile
+from httpserver import Server
+from gitrepository_test import git
+from toprefix import runenv
+from toprefix import fetch
+from toprefix.source import Archive, GitRepository, gitrepository
+from toprefix.package import CMakePkg
+
+
+class TestFetch(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        root = pathlib.Path(self.tmp.name)
+        self.www = root / "www"
+        self.www.mkdir()
+        self.src = root / "src"
+        self.local_src = runenv.LOCAL_SRC
+        runenv.LOCAL_SRC = self.src
+
+        self.server = Server(self.www).__enter__()
+        self.url = self.server.url
+
+    def tearDown(self):
+        gitrepository.UPDATE = False
+        self.server.__exit__()
+        runenv.LOCAL_SRC = self.local_src
+        self.tmp.cleanup()
+
+    def test_fetch_pkgs(self):
+        pkgs = []
+        for i in range(4):
+            (self.www / f"hoge{i}-1.0.{i}.tar.gz").write_bytes(b"x" * (1024 * (i + 1)))
+            source = Archive.from_url(f"{self.url}/hoge{i}-1.0.{i}.tar.gz")
+            pkgs.append(CMakePkg(source))
+
+        results = fetch.fetch_pkgs(pkgs, jobs=2)
+        self.assertEqual([x.size for x in results], [1024, 2048, 3072, 4096])
+        self.assertEqual(pkgs[3].source.download_path.read_bytes(), b"x" * 4096)
+
+        # second time is cached
+        results = fetch.fetch_pkgs(pkgs, jobs=2)
+        self.assertEqual([x.size for x in results], [0, 0, 0, 0])
+
+    def test_fetch_error(self):
+        source = Archive.from_url(f"{self.url}/notfound-1.0.0.tar.gz")
+        results = fetch.fetch_pkgs([CMakePkg(source)])
+        self.assertTrue(results[0].error)
+
+    def test_fetch_git(self):
+        upstream = self.src.parent / "upstream"
+        upstream.mkdir()
+        git(upstream, "init", "--quiet", "-b", "main")
+        git(upstream, "config", "uploadpack.allowFilter", "true")
+        git(upstream, "commit", "--quiet", "--allow-empty", "-m", "1")
+        pkg = CMakePkg(GitRepository("fuga", upstream.as_uri(), ref="main"))
+
+        self.assertEqual("cloned", fetch.fetch_pkgs([pkg])[0].git)
+        gitrepository.UPDATE = True
+        self.assertEqual("up to date", fetch.fetch_pkgs([pkg])[0].git)
+        git(upstream, "commit", "--quiet", "--allow-empty", "-m", "2")
+        results = fetch.fetch_pkgs([pkg])
+        self.assertEqual("updated", results[0].git)
+        self.assertEqual(0, results[0].size)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+import io
+import pathlib
+import tarfile
+import tempfile
+import subprocess
+from toprefix import runenv
+from toprefix.source import formats
+
+
+def make_tar(path: pathlib.Path):
+    with tarfile.open(path, "w") as tar:
+        for i in range(3):
+            data = f"hoge {i}\n".encode() * 1000
+            info = tarfile.TarInfo(f"hoge-1.0.0/src/{i}.c")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+class TestFormats(unittest.TestCase):
+    def setUp(self):
+        # not the .toolchain.json of HOME
+        self.tmp = tempfile.TemporaryDirectory()
+        self.local_src = runenv.LOCAL_SRC
+        runenv.LOCAL_SRC = pathlib.Path(self.tmp.name) / "src"
+
+    def tearDown(self):
+        runenv.LOCAL_SRC = self.local_src
+        self.tmp.cleanup()
+
+    def test_find_format(self):
+        self.assertEqual(formats.archive_ext("hoge-1.0.tar.gz"), ("hoge-1.0", ".tar.gz"))
+        self.assertEqual(formats.archive_ext("hoge-1.0.tgz"), ("hoge-1.0", ".tgz"))
+        self.assertEqual(formats.archive_ext("hoge-1.0.tar.zst"), ("hoge-1.0", ".tar.zst"))
+        self.assertEqual(formats.archive_ext("hoge-1.0.tar.lz"), ("hoge-1.0", ".tar.lz"))
+        self.assertEqual(formats.archive_ext("hoge-1.0.zip"), ("hoge-1.0", ".zip"))
+        with self.assertRaises(NotImplementedError):
+            formats.archive_ext("hoge-1.0.rar")
+
+    def test_extract(self):
+        with tempfile.TemporaryDirectory() as dname:
+            dir = pathlib.Path(dname)
+            tar = dir / "hoge.tar"
+            make_tar(tar)
+            for ext, compress in (
+                (".tar.gz", ["gzip", "-k"]),
+                (".tar.xz", ["xz", "-k"]),
+                (".tar.bz2", ["bzip2", "-k"]),
+                (".tar.zst", ["zstd", "-q"]),
+                (".tar.lz", ["lzip", "-k"]),
+            ):
+                format = formats.FORMATS[ext]
+                if not runenv.which(compress[0]):
+                    continue
+                subprocess.run(compress + [str(tar)], check=True)
+                path = dir / f"hoge{ext}"
+                for use_tool in (True, False):
+                    if not use_tool and format.codec in (None, formats.zstd_codec):
+                        continue
+                    with self.subTest(ext=ext, use_tool=use_tool):
+                        dst = dir / f"{ext}-{use_tool}"
+                        formats.extract_file(path, format, dst, use_tool=use_tool)
+                        self.assertEqual(
+                            (dst / "hoge-1.0.0/src/2.c").read_text(), "hoge 2\n" * 1000
+                        )
+
+    def test_tool_error(self):
+        with tempfile.TemporaryDirectory() as dname:
+            dir = pathlib.Path(dname)
+            path = dir / "broken.tar.xz"
+            path.write_bytes(b"broken" * 100)
+            format = formats.FORMATS[".tar.xz"]
+            if not format.find_tool():
+                self.skipTest("no xz")
+            with self.assertRaises(Exception):
+                formats.extract_file(path, format, dir / "dst")
+
+    def test_no_codec(self):
+        with tempfile.TemporaryDirectory() as dname:
+            dir = pathlib.Path(dname)
+            path = dir / "hoge.tar.lz"
+            path.write_bytes(b"LZIP")
+            with self.assertRaisesRegex(NotImplementedError, "plzip or lzip required"):
+                formats.extract_file(
+                    path, formats.FORMATS[".tar.lz"], dir / "dst", use_tool=False
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+import pathlib
+import tempfile
+import subprocess
+from toprefix import runenv
+from toprefix.source import gitrepository, GitRepository
+
+
+def git(cwd: pathlib.Path, *args: str) -> str:
+    return subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        cwd=cwd,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.strip()
+
+
+class TestGitRepository(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        root = pathlib.Path(self.tmp.name)
+        self.local_src = runenv.LOCAL_SRC
+        runenv.LOCAL_SRC = root / "src"
+        self.upstream = root / "upstream"
+        self.upstream.mkdir()
+        git(self.upstream, "init", "--quiet", "-b", "main")
+        git(self.upstream, "config", "uploadpack.allowFilter", "true")
+        self.commit("1")
+        git(self.upstream, "tag", "v1")
+        self.url = self.upstream.as_uri()
+
+    def tearDown(self):
+        gitrepository.UPDATE = False
+        runenv.LOCAL_SRC = self.local_src
+        self.tmp.cleanup()
+
+    def commit(self, content: str):
+        (self.upstream / "version.txt").write_text(content)
+        git(self.upstream, "add", ".")
+        git(self.upstream, "commit", "--quiet", "-m", content)
+
+    def test_ref(self):
+        tag = GitRepository("hoge", self.url, ref="v1")
+        self.commit("2")
+        main = GitRepository("hoge", self.url, ref="main", depth=1)
+
+        self.assertEqual((tag.extract() / "version.txt").read_text(), "1")
+        self.assertEqual((main.extract() / "version.txt").read_text(), "2")
+        # both are worktrees of one mirror
+        self.assertEqual(tag.mirror, main.mirror)
+        self.assertTrue((tag.worktree / ".git").is_file())
+        self.assertEqual(tag.fingerprint(), git(self.upstream, "rev-parse", "v1"))
+
+    def test_update(self):
+        main = GitRepository("hoge", self.url, ref="main")
+        self.assertEqual((main.extract() / "version.txt").read_text(), "1")
+
+        self.commit("2")
+        # no network without update
+        self.assertEqual((main.extract() / "version.txt").read_text(), "1")
+        gitrepository.UPDATE = True
+        self.assertEqual((main.extract() / "version.txt").read_text(), "2")
+        self.assertEqual(main.fingerprint(), git(self.upstream, "rev-parse", "main"))
+
+
+if __name__ == "__main__":
+    unittest.main()
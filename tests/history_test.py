@@ -0,0 +1,87 @@
+import pathlib
+import tempfile
+import threading
+import unittest
+from toprefix import runenv
+from toprefix import history
+from toprefix import stamp
+
+
+def entry(name: str, total: float, phases: dict, *, jobs: int = 8, status="ok"):
+    return {
+        "time": 0,
+        "name": name,
+        "version": "1.0",
+        "args": {},
+        "jobs": jobs,
+        "status": status,
+        "total": total,
+        "phases": phases,
+    }
+
+
+class TestHistory(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.local_src = runenv.LOCAL_SRC
+        runenv.LOCAL_SRC = pathlib.Path(self.tmp.name)
+
+    def tearDown(self):
+        runenv.LOCAL_SRC = self.local_src
+        self.tmp.cleanup()
+
+    def test_record(self):
+        stamps = stamp.Stamps(runenv.LOCAL_SRC)
+        with history.record("hoge", "1.0", args={"clean": True}, jobs=4):
+            with history.phase("download"):
+                pass
+            stamps.run("build", {}, lambda: None)
+
+            # a thread of the stream extract
+            run = history.current()
+
+            def producer():
+                with history.attach(run), history.phase("download"):
+                    pass
+
+            t = threading.Thread(target=producer)
+            t.start()
+            t.join()
+        self.assertIsNone(history.current())
+
+        with self.assertRaises(Exception):
+            with history.record("fuga", "2.0", args={}, jobs=4):
+                raise Exception("configure failed")
+
+        runs = history.load()
+        self.assertEqual([x["name"] for x in runs], ["hoge", "fuga"])
+        self.assertEqual(sorted(runs[0]["phases"]), ["compile", "download"])
+        self.assertEqual(runs[0]["status"], "ok")
+        self.assertEqual(runs[0]["jobs"], 4)
+        self.assertEqual(runs[1]["status"], "failed")
+
+    def test_report(self):
+        runs = [
+            entry("glib", 60, {"configure": 10, "compile": 50}),
+            entry("glib", 62, {"configure": 12, "compile": 50}),
+            entry("pango", 30, {"download": 2, "compile": 28}),
+            # compile skipped by the stamp
+            entry("glib", 40, {"configure": 40}),
+        ]
+        self.assertEqual(
+            [x["name"] for x in history.slowest_packages(runs, 10)], ["glib", "pango"]
+        )
+        self.assertEqual(
+            history.slowest_phases(runs, 2),
+            [("glib", "configure", 40), ("pango", "compile", 28)],
+        )
+        found = history.regressions(runs)
+        self.assertEqual(len(found), 1)
+        self.assertEqual(found[0].name, "glib")
+        self.assertEqual(found[0].phase, "configure")
+        self.assertEqual(found[0].baseline, 11)
+        self.assertFalse(found[0].jobs_changed)
+
+
+if __name__ == "__main__":
+    unittest.main()
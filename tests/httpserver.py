@@ -0,0 +1,110 @@
+from typing import Optional
+import pathlib
+import threading
+import functools
+import http.server
+
+
+class RangeHandler(http.server.SimpleHTTPRequestHandler):
+    # SimpleHTTPRequestHandler with keep-alive and "Range: bytes=N-"
+    protocol_version = "HTTP/1.1"
+    no_range = False
+    # Range header of each request
+    ranges: list = []
+    # ETag header. a range with another or a weak etag in If-Range gets 200
+    etag = None
+    # ranges from this offset are cut in the middle
+    truncate_from = None
+    # requests after this number get 200
+    max_ranges = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_head(self):
+        range = self.headers.get("Range")
+        self.ranges.append(range)
+        if_range = self.headers.get("If-Range")
+        if self.no_range or not range:
+            return super().send_head()
+        # If-Range is an etag or a date
+        is_etag = if_range and if_range.startswith(('"', "W/"))
+        if is_etag and (if_range != self.etag or if_range.startswith("W/")):
+            return super().send_head()
+        if self.max_ranges is not None and len(self.ranges) > self.max_ranges:
+            return super().send_head()
+        path = pathlib.Path(self.translate_path(self.path))
+        if not path.is_file():
+            self.send_error(404)
+            return None
+        size = path.stat().st_size
+        start, end = range.removeprefix("bytes=").split("-")
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+        if start >= size:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return None
+        f = path.open("rb")
+        f.seek(start)
+        self.send_response(206)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        if self.etag:
+            self.send_header("ETag", self.etag)
+        self.end_headers()
+        if self.truncate_from is not None and 0 < start and self.truncate_from <= start:
+            self.close_connection = True
+            return LimitedFile(f, (end - start + 1) // 2)
+        return LimitedFile(f, end - start + 1)
+
+
+class LimitedFile:
+    def __init__(self, f, size: int):
+        self.f = f
+        self.size = size
+
+    def read(self, n: int = -1) -> bytes:
+        if n < 0 or n > self.size:
+            n = self.size
+        data = self.f.read(n)
+        self.size -= len(data)
+        return data
+
+    def close(self):
+        self.f.close()
+
+
+class Server:
+    def __init__(
+        self,
+        directory: pathlib.Path,
+        *,
+        no_range: bool = False,
+        etag: Optional[str] = None,
+    ):
+        self.ranges = []
+        handler = type(
+            "Handler",
+            (RangeHandler,),
+            {"no_range": no_range, "ranges": self.ranges, "etag": etag},
+        )
+        # change the behavior between requests
+        self.handler = handler
+        self.server = http.server.ThreadingHTTPServer(
+            ("127.0.0.1", 0),
+            functools.partial(handler, directory=str(directory)),
+        )
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def __enter__(self) -> "Server":
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,61 @@
+import unittest
+import os
+import pathlib
+import tempfile
+from toprefix.package.index import PkgIndex
+
+
+class TestIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        root = pathlib.Path(self.tmp.name)
+        self.assets = root / "assets"
+        (self.assets / "sub").mkdir(parents=True)
+        (self.assets / "a.toml").write_text(
+            '[glib]\nsource.gnome.version = "2.75.2"\npkg.meson = {}\n'
+        )
+        (self.assets / "sub/b.toml").write_text(
+            '[gtk]\nsource.gnome.version = "4.9.3"\npkg.meson = {}\n'
+        )
+        self.cache = root / "index.json"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def load(self) -> PkgIndex:
+        index = PkgIndex(self.assets, self.cache)
+        index.load()
+        return index
+
+    def test_index(self):
+        index = self.load()
+        self.assertEqual(index.names, ["glib", "gtk"])
+        self.assertEqual(index.get_file("gtk"), self.assets / "sub/b.toml")
+        self.assertEqual(index.get_recipe("gtk")["source"]["gnome"]["version"], "4.9.3")
+        self.assertIsNone(index.get_recipe("nothing"))
+
+        # from cache. nothing parsed until requested
+        index = self.load()
+        self.assertEqual(index.names, ["glib", "gtk"])
+        self.assertEqual(index.parsed, {})
+        index.get_recipe("glib")
+        self.assertEqual(list(index.parsed), [self.assets / "a.toml"])
+
+    def test_invalidate(self):
+        self.load()
+        (self.assets / "sub/c.toml").write_text(
+            '[pango]\nsource.gnome.version = "1.50.12"\npkg.meson = {}\n'
+        )
+        # directory mtime may not change within the timestamp resolution
+        os.utime(self.assets / "sub", ns=(0, 0))
+        self.assertEqual(self.load().names, ["glib", "gtk", "pango"])
+
+        (self.assets / "a.toml").write_text(
+            '[glib2]\nsource.gnome.version = "2.75.2"\npkg.meson = {}\n'
+        )
+        os.utime(self.assets / "a.toml", ns=(0, 0))
+        self.assertEqual(self.load().names, ["glib2", "gtk", "pango"])
+
+
+if __name__ == "__main__":
+    unittest.main()
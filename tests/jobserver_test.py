@@ -0,0 +1,92 @@
+import os
+import time
+import shutil
+import pathlib
+import tempfile
+import threading
+import subprocess
+import unittest
+from toprefix import jobserver
+from toprefix import runenv
+
+
+class TestJobServer(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.local_src = runenv.LOCAL_SRC
+        runenv.LOCAL_SRC = pathlib.Path(self.tmp.name) / "src"
+
+    def tearDown(self):
+        runenv.LOCAL_SRC = self.local_src
+        self.tmp.cleanup()
+
+    def test_tokens(self):
+        # 4 packages share 2 tokens
+        with jobserver.JobServer(2, style="pipe") as server:
+            lock = threading.Lock()
+            running = [0]
+            peak = [0]
+
+            def work():
+                with server.client():
+                    with lock:
+                        running[0] += 1
+                        peak[0] = max(peak[0], running[0])
+                    time.sleep(0.05)
+                    with lock:
+                        running[0] -= 1
+
+            threads = [threading.Thread(target=work) for _ in range(4)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            self.assertEqual(peak[0], 2)
+
+            # all tokens returned
+            os.set_blocking(server.read_fd, False)
+            self.assertEqual(os.read(server.read_fd, 16), b"++")
+
+    def test_env(self):
+        with jobserver.JobServer(4, load=3.0, style="fifo") as server:
+            assert server.fifo
+            self.assertTrue(server.fifo.exists())
+            self.assertEqual(
+                server.env()["MAKEFLAGS"],
+                f" -j4 -l3.0 --jobserver-auth=fifo:{server.fifo}",
+            )
+            with server.client():
+                self.assertEqual(runenv.get_overlay(), server.env())
+            self.assertEqual(runenv.get_overlay(), {})
+        self.assertFalse(server.fifo.exists())
+
+    # not runenv.which. it caches to LOCAL_SRC on import
+    @unittest.skipIf(not shutil.which("make"), "make not found")
+    def test_make(self):
+        # make runs 2 jobs: the package token and one from the pool
+        with tempfile.TemporaryDirectory() as dir:
+            makefile = pathlib.Path(dir) / "Makefile"
+            makefile.write_text(
+                "all: a b c d\na b c d:\n\t@sleep 0.2\n", encoding="utf-8"
+            )
+            with jobserver.JobServer(2, style=jobserver.default_style()) as server:
+                with server.client():
+                    env = dict(os.environ)
+                    env.update(runenv.get_overlay())
+                    start = time.time()
+                    p = subprocess.run(
+                        ["make", "-s", "-C", dir],
+                        env=env,
+                        pass_fds=server.pass_fds(),
+                        capture_output=True,
+                        text=True,
+                    )
+                    elapsed = time.time() - start
+            self.assertEqual(p.returncode, 0, p.stderr)
+            self.assertNotIn("jobserver", p.stderr)
+            self.assertLess(elapsed, 0.7)
+            self.assertGreater(elapsed, 0.35)
+
+
+if __name__ == "__main__":
+    unittest.main()
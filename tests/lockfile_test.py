@@ -0,0 +1,129 @@
+import pathlib
+import tempfile
+import unittest
+from httpserver import Server
+from gitrepository_test import git
+from toprefix import runenv
+from toprefix import lockfile
+from toprefix.source import Archive, GitRepository, download
+from toprefix.package import CMakePkg
+
+
+def make_pkg(source, recipe: dict) -> CMakePkg:
+    pkg = CMakePkg(source)
+    pkg.recipe = {"source": recipe, "pkg": {"cmake": {}}}
+    return pkg
+
+
+class TestLockfile(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmp.name)
+        self.www = self.root / "www"
+        self.www.mkdir()
+        (self.www / "hoge-1.0.0.tar.gz").write_bytes(b"hoge")
+        self.local_src = runenv.LOCAL_SRC
+        runenv.LOCAL_SRC = self.root / "src"
+        self.path = self.root / "toprefix.lock"
+
+        self.upstream = self.root / "upstream"
+        self.upstream.mkdir()
+        git(self.upstream, "init", "--quiet", "-b", "main")
+        git(self.upstream, "config", "uploadpack.allowFilter", "true")
+        self.commit("1")
+
+    def tearDown(self):
+        download.OFFLINE = False
+        runenv.LOCAL_SRC = self.local_src
+        self.tmp.cleanup()
+
+    def commit(self, content: str):
+        (self.upstream / "version.txt").write_text(content)
+        git(self.upstream, "add", ".")
+        git(self.upstream, "commit", "--quiet", "-m", content)
+
+    def git_pkg(self) -> CMakePkg:
+        url = self.upstream.as_uri()
+        return make_pkg(
+            GitRepository("fuga", url, ref="main"), {"git": {"url": url, "ref": "main"}}
+        )
+
+    def test_archive(self):
+        with Server(self.www) as server:
+            url = f"{server.url}/hoge-1.0.0.tar.gz"
+            pkg = make_pkg(Archive.from_url(url), {"url": url})
+            self.assertTrue(lockfile.lock([pkg], path=self.path))
+        entry = lockfile.load(self.path)["hoge"]
+        self.assertEqual(url, entry["url"])
+        self.assertEqual(4, entry["size"])
+        self.assertEqual(pkg.source.download_path.name, entry["sha256"])
+
+        # the server is gone. from the store by sha256
+        download.OFFLINE = True
+        pkg = make_pkg(Archive.from_url(url), {"url": url})
+        lockfile.apply([pkg], lockfile.load(self.path))
+        self.assertEqual(entry["sha256"], pkg.source.sha256)
+        self.assertEqual(0, pkg.source.fetch())
+
+        # not in the store
+        url = f"{server.url}/fuga-1.0.0.tar.gz"
+        pkg = make_pkg(Archive.from_url(url), {"url": url})
+        pkg.source.sha256 = "0" * 64
+        with self.assertRaises(download.OfflineError):
+            pkg.source.fetch()
+
+    def test_moving_archive(self):
+        with Server(self.www) as server:
+            url = f"{server.url}/hoge-1.0.0.tar.gz"
+
+            def sha256(update: bool) -> str:
+                pkg = make_pkg(Archive.from_url(url), {"url": url})
+                pkg.source.moving = True
+                self.assertTrue(lockfile.lock([pkg], path=self.path, update=update))
+                return lockfile.load(self.path)["hoge"]["sha256"]
+
+            first = sha256(False)
+            # new snapshot on the same url
+            (self.www / "hoge-1.0.0.tar.gz").write_bytes(b"hoge2")
+            self.assertEqual(first, sha256(False))
+            self.assertNotEqual(first, sha256(True))
+
+    def test_git(self):
+        pkg = self.git_pkg()
+        self.assertTrue(lockfile.lock([pkg], path=self.path))
+        commit = git(self.upstream, "rev-parse", "main")
+        self.assertEqual(commit, lockfile.load(self.path)["fuga"]["commit"])
+
+        # upstream moved. the pinned commit without network
+        self.commit("2")
+        download.OFFLINE = True
+        pkg = self.git_pkg()
+        lockfile.apply([pkg], lockfile.load(self.path))
+        self.assertEqual("1", (pkg.source.extract() / "version.txt").read_text())
+
+        # a newer pin is fetched when online
+        download.OFFLINE = False
+        pkg.source.commit = git(self.upstream, "rev-parse", "main")
+        self.assertEqual("2", (pkg.source.extract() / "version.txt").read_text())
+        pkg.source.commit = commit
+        download.OFFLINE = True
+        self.assertEqual("1", (pkg.source.extract() / "version.txt").read_text())
+
+    def test_stale(self):
+        pkg = self.git_pkg()
+        lockfile.lock([pkg], path=self.path)
+        packages = lockfile.load(self.path)
+
+        pkg.recipe["source"]["git"]["ref"] = "v2"
+        with self.assertRaises(Exception):
+            lockfile.apply([pkg], packages)
+        # not locked
+        piyo = make_pkg(Archive.from_url("http://localhost/piyo-1.0.tar.gz"), {})
+        with self.assertRaises(Exception):
+            lockfile.apply([piyo], packages)
+        with self.assertRaises(Exception):
+            lockfile.load(self.root / "none.lock")
+
+
+if __name__ == "__main__":
+    unittest.main()
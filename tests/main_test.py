@@ -0,0 +1,51 @@
+import io
+import pathlib
+import tempfile
+import unittest
+import contextlib
+from toprefix import runenv
+from toprefix import __main__
+from toprefix.source import download
+
+
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmp.name)
+        self.saved = runenv.get_prefix(), runenv.LOCAL_SRC, runenv.get_config()
+        runenv.PREFIX = self.root / "prefix"
+        runenv.LOCAL_SRC = self.root / "src"
+        runenv.CONFIG = {"lockfile": str(self.root / "toprefix.lock")}
+
+    def tearDown(self):
+        download.OFFLINE = False
+        runenv.PREFIX, runenv.LOCAL_SRC, runenv.CONFIG = self.saved
+        self.tmp.cleanup()
+
+    def run_main(self, *argv: str) -> str:
+        stdout = io.StringIO()
+        parser = __main__.make_parser()
+        with contextlib.redirect_stdout(stdout):
+            __main__.dispatch(parser, parser.parse_args(list(argv)))
+        return stdout.getvalue()
+
+    def test_install_failed(self):
+        # glib is not fetched. pango is skipped
+        download.OFFLINE = True
+        with self.assertRaises(SystemExit) as cm:
+            self.run_main("install", "--no-artifact", "pango")
+        self.assertEqual(1, cm.exception.code)
+
+    def test_install_locked(self):
+        # no lockfile
+        for option in ("--locked", "--offline"):
+            with self.subTest(option=option), self.assertRaises(SystemExit) as cm:
+                self.run_main("install", option, "glib")
+            self.assertEqual(1, cm.exception.code)
+        with self.assertRaises(SystemExit) as cm:
+            self.run_main("fetch", "--locked", "glib")
+        self.assertEqual(1, cm.exception.code)
+
+
+if __name__ == "__main__":
+    unittest.main()
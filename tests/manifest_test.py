@@ -0,0 +1,88 @@
+import unittest
+import pathlib
+import tempfile
+from toprefix import runenv
+from toprefix import manifest
+
+
+class TestManifest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmp.name)
+        self.prefix = runenv.PREFIX
+        runenv.PREFIX = self.root / "prefix"
+        self.db = manifest.Db()
+
+    def tearDown(self):
+        runenv.PREFIX = self.prefix
+        self.tmp.cleanup()
+
+    def stage(self, name: str, files: dict) -> pathlib.Path:
+        stage = self.root / "stage" / name
+        prefix = stage / runenv.PREFIX.relative_to(runenv.PREFIX.anchor)
+        for rel, content in files.items():
+            path = prefix / rel
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(content)
+        return stage
+
+    def test_install(self):
+        prefix = runenv.PREFIX
+        stage = self.stage(
+            "hoge1", {"bin/hoge": "1", "lib/libhoge.so": "1", "share/hoge/a": "a"}
+        )
+        result = self.db.install("hoge", "1.0", stage)
+        self.assertEqual(result.copied, 3)
+        self.assertEqual(self.db.owner(prefix / "bin/hoge"), "hoge")
+        self.assertIsNone(self.db.owner(prefix / "bin"))
+
+        # reinstall. only the changed file is copied
+        result = self.db.install(
+            "hoge", "1.1", self.stage("hoge2", {"bin/hoge": "2", "lib/libhoge.so": "1"})
+        )
+        self.assertEqual(result, manifest.InstallResult(1, 1, 1))
+        self.assertEqual((prefix / "bin/hoge").read_text(), "2")
+        self.assertFalse((prefix / "share").exists())
+
+        # persisted
+        self.assertEqual(manifest.Db().owner(prefix / "lib/libhoge.so"), "hoge")
+
+    def test_is_installed(self):
+        prefix = runenv.PREFIX
+        self.db.install("hoge", "1.0", self.stage("hoge", {"bin/hoge": "1"}), key="k1")
+        self.assertTrue(self.db.is_installed("hoge", "k1"))
+        self.assertFalse(self.db.is_installed("hoge", "k2"))
+        self.assertFalse(self.db.is_installed("fuga", "k1"))
+
+        # changed after the install
+        (prefix / "bin/hoge").write_text("changed")
+        self.assertFalse(self.db.is_installed("hoge", "k1"))
+        (prefix / "bin/hoge").unlink()
+        self.assertFalse(self.db.is_installed("hoge", "k1"))
+
+        # not from the artifact cache
+        self.db.install("fuga", "1.0", self.stage("fuga", {"bin/fuga": "1"}))
+        self.assertFalse(self.db.is_installed("fuga", ""))
+
+    def test_uninstall(self):
+        prefix = runenv.PREFIX
+        hoge = self.stage("hoge", {"bin/hoge": "h", "bin/x": "h"})
+        self.db.install("hoge", "1.0", hoge)
+        fuga = self.stage("fuga", {"bin/fuga": "f", "bin/x": "f"})
+        self.db.install("fuga", "1.0", fuga)
+        self.assertEqual(self.db.owner(prefix / "bin/x"), "fuga")
+
+        self.assertEqual(self.db.uninstall("hoge"), 1)
+        self.assertFalse((prefix / "bin/hoge").exists())
+        # overwritten by fuga
+        self.assertEqual((prefix / "bin/x").read_text(), "f")
+        self.assertEqual(self.db.installed(), ["fuga"])
+
+        self.db.uninstall("fuga")
+        self.assertFalse((prefix / "bin").exists())
+        with self.assertRaises(KeyError):
+            self.db.uninstall("fuga")
+
+
+if __name__ == "__main__":
+    unittest.main()
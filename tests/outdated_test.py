@@ -0,0 +1,118 @@
+import json
+import pathlib
+import tempfile
+import unittest
+from httpserver import Server
+from toprefix import runenv
+from toprefix import outdated
+
+
+class TestVersion(unittest.TestCase):
+    def test_split(self):
+        self.assertEqual(("", (1, 2, 3)), outdated.split_version("v1.2.3"))
+        self.assertEqual(("libdrm-", (2, 4, 114)), outdated.split_version("libdrm-2.4.114"))
+        self.assertEqual(("r_", (2, 5, 0)), outdated.split_version("R_2_5_0"))
+        self.assertIsNone(outdated.split_version("1.0-rc1"))
+        self.assertIsNone(outdated.split_version("v2.0.0-beta.1"))
+        self.assertIsNone(outdated.split_version("3.0b2"))
+        self.assertIsNone(outdated.split_version("nightly"))
+
+    def test_digit_in_name(self):
+        for tag, prefix, version in (
+            ("libxml2-2.11.4", "libxml2-", (2, 11, 4)),
+            ("gtk4-4.10.0", "gtk4-", (4, 10, 0)),
+            ("w3m-0.5.3", "w3m-", (0, 5, 3)),
+            ("lz4-1.9.4", "lz4-", (1, 9, 4)),
+            ("xfce4-terminal-1.0.4", "xfce4-terminal-", (1, 0, 4)),
+        ):
+            self.assertEqual((prefix, version), outdated.split_version(tag))
+        self.assertIsNone(outdated.split_version("libxml2-2.12.0-rc1"))
+
+        stems = ["libxml2-2.11.4", "libxml2-2.11.5", "libxml2-2.12.0-rc1", "lz4-1.10.0"]
+        self.assertEqual("libxml2-2.11.5", outdated.latest_version("libxml2-2.11.4", stems))
+        tags = ["xfce4-terminal-1.0.4", "xfce4-terminal-1.1.0"]
+        self.assertEqual(
+            "xfce4-terminal-1.1.0", outdated.latest_version("xfce4-terminal-1.0.4", tags)
+        )
+
+    def test_latest(self):
+        tags = ["v1.9.0", "v1.10.0", "v2.0.0-rc1", "nightly", "other-3.0"]
+        self.assertEqual("v1.10.0", outdated.latest_version("1.9.0", tags))
+        self.assertTrue(outdated.is_outdated("1.9.0", "v1.10.0"))
+        self.assertFalse(outdated.is_outdated("1.10.0", "v1.10.0"))
+        self.assertEqual("", outdated.latest_version("nightly", tags))
+
+
+class TestOutdated(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        root = pathlib.Path(self.tmp.name)
+        www = root / "www"
+        gnome = www / "gnome" / "glib"
+        gnome.mkdir(parents=True)
+        (gnome / "cache.json").write_text(
+            json.dumps(
+                [
+                    4,
+                    {"glib": {}},
+                    {"glib": ["2.74.0", "2.74.1", "2.75.2"]},
+                    [],
+                ]
+            )
+        )
+        github = www / "github" / "user" / "hoge"
+        github.mkdir(parents=True)
+        (github / "tags").write_text(
+            json.dumps([{"name": "v1.0.0"}, {"name": "v1.1.0-rc1"}])
+        )
+        dist = www / "dist"
+        dist.mkdir()
+        for name in ("fuga-1.2.tar.gz", "fuga-1.10.tar.xz", "fuga-1.10.tar.xz.sig"):
+            (dist / name).write_bytes(b"")
+
+        self.saved = (
+            runenv.LOCAL_SRC,
+            outdated.GNOME_CACHE_URL,
+            outdated.GITHUB_TAGS_URL,
+        )
+        runenv.LOCAL_SRC = root / "src"
+        self.server = Server(www).__enter__()
+        outdated.GNOME_CACHE_URL = self.server.url + "/gnome/{name}/cache.json"
+        outdated.GITHUB_TAGS_URL = self.server.url + "/github/{user}/{name}/tags"
+        self.items = [
+            ("glib", {"gnome": {"version": "2.74.0"}}),
+            ("hoge", {"github": {"user": "user", "tag": "v1.0.0"}}),
+            ("fuga", {"url": f"{self.server.url}/dist/fuga-1.2.tar.gz"}),
+            ("piyo", {"github": {"user": "user", "ref": "main"}}),
+            ("missing", {"gnome": {"version": "1.0.0"}}),
+        ]
+
+    def tearDown(self):
+        self.server.__exit__()
+        (
+            runenv.LOCAL_SRC,
+            outdated.GNOME_CACHE_URL,
+            outdated.GITHUB_TAGS_URL,
+        ) = self.saved
+        self.tmp.cleanup()
+
+    def test_check(self):
+        results = {x.name: x for x in outdated.check(self.items, jobs=4)}
+        # git ref has no feed
+        self.assertNotIn("piyo", results)
+        self.assertEqual("2.75.2", results["glib"].latest)
+        self.assertEqual("v1.0.0", results["hoge"].latest)
+        self.assertFalse(outdated.is_outdated("v1.0.0", results["hoge"].latest))
+        self.assertEqual("fuga-1.10", results["fuga"].latest)
+        self.assertTrue(results["missing"].error)
+        self.assertFalse(any(x.cached for x in results.values()))
+
+        # conditional requests
+        results = {x.name: x for x in outdated.check(self.items, jobs=4)}
+        self.assertTrue(results["glib"].cached)
+        self.assertTrue(results["hoge"].cached)
+        self.assertEqual("2.75.2", results["glib"].latest)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+import io
+import pathlib
+import tarfile
+import tempfile
+import unittest
+from httpserver import Server
+from toprefix import runenv
+from toprefix.source import Archive
+from toprefix.source import patch
+
+PATCH_A = """\
+--- hoge.c
++++ hoge.c
+@@ -1,2 +1,2 @@
+ int a;
+-int b;
++int b = 1;
+"""
+
+PATCH_B = """\
+--- fuga.c
++++ fuga.c
+@@ -1 +1 @@
+-int c;
++int c = 2;
+"""
+
+BROKEN = """\
+--- fuga.c
++++ fuga.c
+@@ -1 +1 @@
+-int none;
++int none = 3;
+"""
+
+
+def make_tar(path: pathlib.Path):
+    with tarfile.open(path, "w:gz") as tar:
+        for name, data in (("hoge.c", b"int a;\nint b;\n"), ("fuga.c", b"int c;\n")):
+            info = tarfile.TarInfo(f"hoge-1.0.0/{name}")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+class TestPatch(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmp.name)
+        self.tree = self.root / "tree"
+        self.tree.mkdir()
+        (self.tree / "hoge.c").write_text("int a;\nint b;\n")
+        (self.tree / "fuga.c").write_text("int c;\n")
+        self.a = self.write("a.patch", PATCH_A)
+        self.b = self.write("b.patch", PATCH_B)
+        # runenv.which caches LOCAL_SRC/.toolchain.json
+        self.local_src = runenv.LOCAL_SRC
+        runenv.LOCAL_SRC = self.root / "src"
+
+    def tearDown(self):
+        runenv.LOCAL_SRC = self.local_src
+        self.tmp.cleanup()
+
+    def write(self, name: str, text: str) -> pathlib.Path:
+        path = self.root / name
+        path.write_text(text)
+        return path
+
+    def test_once(self):
+        patch.apply(self.tree, "base", [self.a])
+        patch.apply(self.tree, "base", [self.a])
+        self.assertEqual("int a;\nint b = 1;\n", (self.tree / "hoge.c").read_text())
+        self.assertFalse(patch.needs_reextract(self.tree, "base", [self.a]))
+
+        # appended patch is pending
+        self.assertFalse(patch.needs_reextract(self.tree, "base", [self.a, self.b]))
+        patch.apply(self.tree, "base", [self.a, self.b])
+        self.assertEqual("int c = 2;\n", (self.tree / "fuga.c").read_text())
+        self.assertEqual(2, len(patch.load_record(self.tree)["patches"]))
+
+        # removed, reordered or changed
+        self.assertTrue(patch.needs_reextract(self.tree, "base", [self.b]))
+        self.assertTrue(patch.needs_reextract(self.tree, "base", [self.b, self.a]))
+        self.write("a.patch", PATCH_A + "\n")
+        self.assertTrue(patch.needs_reextract(self.tree, "base", [self.a, self.b]))
+        self.assertTrue(patch.needs_reextract(self.tree, "other", [self.a, self.b]))
+
+    def test_dry_run(self):
+        broken = self.write("broken.patch", BROKEN)
+        with self.assertRaises(Exception):
+            patch.apply(self.tree, "base", [self.a, broken])
+        # the batch is not applied
+        self.assertEqual("int a;\nint b;\n", (self.tree / "hoge.c").read_text())
+        self.assertIsNone(patch.load_record(self.tree))
+
+    def test_unknown(self):
+        # extracted without a record
+        self.assertFalse(patch.needs_reextract(self.tree, "base", []))
+        self.assertTrue(patch.needs_reextract(self.tree, "base", [self.a]))
+
+
+class TestArchivePatch(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmp.name)
+        self.www = self.root / "www"
+        self.www.mkdir()
+        make_tar(self.www / "hoge-1.0.0.tar.gz")
+        self.local_src = runenv.LOCAL_SRC
+        runenv.LOCAL_SRC = self.root / "src"
+
+    def tearDown(self):
+        runenv.LOCAL_SRC = self.local_src
+        self.tmp.cleanup()
+
+    def test_reextract(self):
+        a = self.root / "a.patch"
+        a.write_text(PATCH_A)
+        b = self.root / "b.patch"
+        b.write_text(PATCH_B)
+        with Server(self.www) as server:
+            archive = Archive.from_url(f"{server.url}/hoge-1.0.0.tar.gz")
+            archive.patches = [a, b]
+            extract = archive.extract()
+            assert extract
+            (extract / "build.o").write_text("")
+            # up to date. not patched twice
+            archive.extract()
+            self.assertEqual("int a;\nint b = 1;\n", (extract / "hoge.c").read_text())
+            self.assertTrue((extract / "build.o").exists())
+
+            # patch removed. pristine tree from the store
+            archive.patches = [b]
+            archive.extract()
+            self.assertEqual("int a;\nint b;\n", (extract / "hoge.c").read_text())
+            self.assertEqual("int c = 2;\n", (extract / "fuga.c").read_text())
+            self.assertFalse((extract / "build.o").exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
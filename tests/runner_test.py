@@ -0,0 +1,85 @@
+import io
+import os
+import pathlib
+import tempfile
+import threading
+import unittest
+import contextlib
+import subprocess
+from toprefix import runenv
+from toprefix import runner
+
+
+@unittest.skipIf(runenv.IS_WINDOWS, "sh")
+class TestRunner(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmp.name)
+        self.saved = runenv.LOCAL_SRC, runner.VERBOSITY
+        runenv.LOCAL_SRC = self.root
+        runner.VERBOSITY = runner.NORMAL
+
+    def tearDown(self):
+        runenv.LOCAL_SRC, runner.VERBOSITY = self.saved
+        self.tmp.cleanup()
+
+    def run_cmd(self, cmd: str, **kw):
+        return runner.run(cmd, env=dict(os.environ), cwd=self.root, **kw)
+
+    def test_log(self):
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            with runner.log("hoge") as package_log:
+                self.run_cmd("echo out; echo err >&2")
+        # nothing on the terminal
+        self.assertEqual("", stdout.getvalue())
+        lines = package_log.path.read_text().splitlines()
+        self.assertEqual("$ echo out; echo err >&2", lines[0])
+        self.assertEqual(["err", "out"], sorted(lines[1:]))
+
+    def test_failure(self):
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            with runner.log("hoge") as package_log:
+                with self.assertRaises(subprocess.CalledProcessError):
+                    self.run_cmd(f"seq 1 {runner.TAIL_LINES + 10}; exit 3")
+                self.assertEqual(3, self.run_cmd("exit 3", check=False))
+        self.assertEqual(runner.TAIL_LINES, len(package_log.tail))
+        output = stdout.getvalue()
+        self.assertIn("hoge failed", output)
+        self.assertIn(f"| {runner.TAIL_LINES + 10}", output)
+        self.assertNotIn("| 1\n", output)
+        # the log has all lines
+        self.assertIn("1", package_log.path.read_text().splitlines())
+
+    def test_concurrent(self):
+        runner.VERBOSITY = runner.ECHO
+        stdout = io.StringIO()
+
+        def build(name: str):
+            with runner.log(name):
+                self.run_cmd(f"for i in 1 2 3; do echo {name}$i; done")
+
+        with contextlib.redirect_stdout(stdout):
+            threads = [
+                threading.Thread(target=build, args=(name,)) for name in ("a", "b")
+            ]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        for name in ("a", "b"):
+            self.assertEqual(
+                [f"$ for i in 1 2 3; do echo {name}$i; done"]
+                + [f"{name}{i}" for i in (1, 2, 3)],
+                (self.root / f".logs/{name}.log").read_text().splitlines(),
+            )
+        # whole lines with the package name
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual(8, len(lines))
+        self.assertEqual(4, sum(1 for line in lines if "[a]" in line))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+import threading
+import time
+from toprefix import scheduler
+from toprefix.source import Archive
+from toprefix.package import CMakePkg
+
+
+def make_pkgs(deps: dict) -> dict:
+    pkgs = {}
+    for name, pkg_deps in deps.items():
+        pkg = CMakePkg(Archive(name, "1.0", f"https://example.com/{name}-1.0.tar.gz"))
+        pkg.deps = pkg_deps
+        pkgs[name] = pkg
+    return pkgs
+
+
+class TestScheduler(unittest.TestCase):
+    def test_resolve(self):
+        pkgs = make_pkgs(
+            {
+                "gtkmm": ["gtk", "glibmm"],
+                "glibmm": ["glib", "libsigc++"],
+                "gtk": ["glib"],
+                "glib": [],
+                "libsigc++": [],
+            }
+        )
+        order = [x.source.name for x in scheduler.resolve(["gtkmm"], pkgs.get)]
+        self.assertEqual(order, ["glib", "gtk", "libsigc++", "glibmm", "gtkmm"])
+
+        order = [x.source.name for x in scheduler.resolve(["gtk"], pkgs.get)]
+        self.assertEqual(order, ["glib", "gtk"])
+
+    def test_resolve_error(self):
+        pkgs = make_pkgs({"a": ["b"], "b": ["a"], "c": ["nothing"], "d": ["a"]})
+        with self.assertRaises(scheduler.CycleError) as cm:
+            scheduler.resolve(["d"], pkgs.get)
+        self.assertEqual(["a", "b", "a"], cm.exception.cycle)
+        self.assertEqual("dependency cycle: a => b => a", str(cm.exception))
+        with self.assertRaises(KeyError):
+            scheduler.resolve(["c"], pkgs.get)
+
+    def test_build(self):
+        pkgs = make_pkgs({"glib": [], "xz": [], "gtk": ["glib"], "libxml2": ["xz"]})
+        lock = threading.Lock()
+        done = []
+        active = [0, 0]
+
+        def process(pkg):
+            with lock:
+                for dep in pkg.deps:
+                    self.assertIn(dep, done)
+                active[0] += 1
+                active[1] = max(active[0], active[1])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+                done.append(pkg.source.name)
+
+        order = scheduler.resolve(["gtk", "libxml2"], pkgs.get)
+        status = scheduler.build(order, slots=2, process=process)
+        self.assertEqual(set(status.values()), {scheduler.OK})
+        self.assertEqual(active[1], 2)
+
+    def test_build_failed(self):
+        pkgs = make_pkgs({"glib": [], "xz": [], "gtk": ["glib"]})
+
+        def process(pkg):
+            if pkg.source.name == "glib":
+                raise Exception("error")
+
+        status = scheduler.build(list(pkgs.values()), slots=2, process=process)
+        self.assertEqual(status["glib"], scheduler.FAILED)
+        self.assertEqual(status["gtk"], scheduler.SKIPPED)
+        self.assertEqual(status["xz"], scheduler.OK)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+import pathlib
+import tempfile
+from toprefix import stamp
+
+
+class TestStamps(unittest.TestCase):
+    def test_run(self):
+        with tempfile.TemporaryDirectory() as dname:
+            dir = pathlib.Path(dname)
+            called = []
+
+            def process(inputs: dict, *, force=False):
+                stamps = stamp.Stamps(dir)
+                configured = stamps.run(
+                    "configure",
+                    inputs,
+                    lambda: called.append("configure"),
+                    force=force,
+                )
+                stamps.run("build", {"configure": configured}, lambda: called.append("build"))
+
+            process({"source": "abc", "args": ""})
+            self.assertEqual(called, ["configure", "build"])
+
+            called.clear()
+            process({"source": "abc", "args": ""})
+            self.assertEqual(called, [])
+
+            called.clear()
+            process({"source": "abc", "args": "-Dtests=false"})
+            self.assertEqual(called, ["configure", "build"])
+
+            # reconfigure invalidates later stages
+            called.clear()
+            process({"source": "abc", "args": "-Dtests=false"}, force=True)
+            self.assertEqual(called, ["configure", "build"])
+
+    def test_why(self):
+        with tempfile.TemporaryDirectory() as dname:
+            stamps = stamp.Stamps(pathlib.Path(dname))
+            self.assertEqual(stamps.why("configure", {}), "no stamp")
+            stamps.run("configure", {"source": "a", "prefix": "/p"}, lambda: None)
+            self.assertEqual(stamps.why("configure", {"source": "a", "prefix": "/p"}), "")
+            self.assertEqual(
+                stamps.why("configure", {"source": "b", "prefix": "/q"}),
+                "prefix, source changed",
+            )
+
+    def test_failed(self):
+        with tempfile.TemporaryDirectory() as dname:
+            dir = pathlib.Path(dname)
+
+            def error():
+                raise Exception()
+
+            with self.assertRaises(Exception):
+                stamp.Stamps(dir).run("configure", {}, error)
+            self.assertEqual(stamp.Stamps(dir).why("configure", {}), "no stamp")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+import os
+import re
+import sys
+import pathlib
+import subprocess
+import importlib.util
+
+ROOT = pathlib.Path(__file__).absolute().parent.parent
+
+# TOPREFIX_STARTUP_BUDGET_MS overrides
+BUDGET_MS = int(os.environ.get("TOPREFIX_STARTUP_BUDGET_MS", "50"))
+
+HEAVY = ["requests", "urllib3", "tqdm", "toml", "colorama"]
+
+PATTERN = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def importtime(*args: str) -> dict:
+    # top level module => cumulative us
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        m = PATTERN.match(line)
+        if m:
+            modules[m.group(4)] = (int(m.group(2)), len(m.group(3)) - 1)
+    return modules
+
+
+@unittest.skipUnless(
+    importlib.util.find_spec("toprefix._version"), "toprefix._version is generated"
+)
+class TestStartup(unittest.TestCase):
+    def test_version(self):
+        baseline = importtime("-c", "pass")
+        modules = importtime("-m", "toprefix", "version")
+
+        for heavy in HEAVY:
+            self.assertNotIn(heavy, modules)
+
+        total = sum(
+            us
+            for name, (us, indent) in modules.items()
+            if indent == 0 and name not in baseline
+        )
+        print(f"toprefix version: import {total / 1000:.1f} ms")
+        self.assertLess(total / 1000, BUDGET_MS)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import unittest
+import pathlib
+import hashlib
+import tempfile
+import threading
+from httpserver import Server
+from toprefix import runenv
+from toprefix.source import store, Archive
+
+
+class TestStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        root = pathlib.Path(self.tmp.name)
+        self.www = root / "www"
+        self.www.mkdir()
+        self.local_src = runenv.LOCAL_SRC
+        runenv.LOCAL_SRC = root / "src"
+        self.data = bytes(range(256)) * 1024
+        self.sha256 = hashlib.sha256(self.data).hexdigest()
+        (self.www / "hoge-1.0.0.tar.gz").write_bytes(self.data)
+
+    def tearDown(self):
+        runenv.LOCAL_SRC = self.local_src
+        self.tmp.cleanup()
+
+    def test_fetch(self):
+        with Server(self.www) as server:
+            url = f"{server.url}/hoge-1.0.0.tar.gz"
+            path, size = store.fetch(url, sha256=self.sha256)
+            self.assertEqual(size, len(self.data))
+            self.assertEqual(path, store.object_path(self.sha256))
+            self.assertEqual(path.read_bytes(), self.data)
+
+            # cached
+            self.assertEqual(store.fetch(url), (path, 0))
+
+    def test_resume(self):
+        with Server(self.www) as server:
+            url = f"{server.url}/hoge-1.0.0.tar.gz"
+            # interrupted download
+            part = store.get_store() / "tmp" / f"{store.url_key(url)}.part"
+            part.parent.mkdir(parents=True)
+            part.write_bytes(self.data[0:1000])
+
+            path, size = store.fetch(url, sha256=self.sha256)
+            self.assertEqual(size, len(self.data) - 1000)
+            self.assertEqual(path.read_bytes(), self.data)
+            self.assertFalse(part.exists())
+
+    def test_part_lock(self):
+        with Server(self.www) as server:
+            url = f"{server.url}/hoge-1.0.0.tar.gz"
+            results = []
+            # another process is downloading
+            with store.part_lock(url):
+                thread = threading.Thread(
+                    target=lambda: results.append(store.fetch(url))
+                )
+                thread.start()
+                thread.join(0.5)
+                self.assertTrue(thread.is_alive())
+                part = store.get_part_path(url)
+                part.write_bytes(self.data)
+                store.add(part, url=url)
+            thread.join()
+            self.assertEqual([(store.object_path(self.sha256), 0)], results)
+            self.assertEqual([], server.ranges)
+
+    def test_fetch_stream(self):
+        with Server(self.www) as server:
+            url = f"{server.url}/hoge-1.0.0.tar.gz"
+            path, size = store.fetch_stream(url, lambda f: f.read(1000))
+            self.assertEqual((path.read_bytes(), size), (self.data, len(self.data)))
+
+    def test_fetch_stream_error(self):
+        # larger than the ChunkPipe queue
+        data = bytes(range(256)) * 4096 * 32
+        (self.www / "fuga-1.0.0.tar.gz").write_bytes(data)
+
+        def consume(f):
+            f.read(1000)
+            raise Exception("broken archive")
+
+        with Server(self.www) as server:
+            url = f"{server.url}/fuga-1.0.0.tar.gz"
+            with self.assertRaisesRegex(Exception, "broken archive"):
+                store.fetch_stream(url, consume)
+            # abandoned
+            self.assertLess(store.get_part_path(url).stat().st_size, len(data))
+            self.assertIsNone(store.lookup(url))
+
+    def test_no_range(self):
+        with Server(self.www, no_range=True) as server:
+            url = f"{server.url}/hoge-1.0.0.tar.gz"
+            part = store.get_store() / "tmp" / f"{store.url_key(url)}.part"
+            part.parent.mkdir(parents=True)
+            part.write_bytes(b"broken")
+
+            path, size = store.fetch(url, sha256=self.sha256)
+            self.assertEqual(size, len(self.data))
+            self.assertEqual(path.read_bytes(), self.data)
+
+    def test_checksum(self):
+        with Server(self.www) as server:
+            url = f"{server.url}/hoge-1.0.0.tar.gz"
+            with self.assertRaises(store.ChecksumError):
+                store.fetch(url, sha256="0" * 64)
+            self.assertIsNone(store.lookup(url))
+
+    def test_same_archive_name(self):
+        (self.www / "a").mkdir()
+        (self.www / "b").mkdir()
+        (self.www / "a/master.zip").write_bytes(b"a")
+        (self.www / "b/master.zip").write_bytes(b"b")
+        with Server(self.www) as server:
+            a = Archive("hoge", "head", f"{server.url}/a/master.zip", "hoge.zip")
+            b = Archive("hoge", "head", f"{server.url}/b/master.zip", "hoge.zip")
+            a.fetch()
+            b.fetch()
+            self.assertEqual(a.download_path.read_bytes(), b"a")
+            self.assertEqual(b.download_path.read_bytes(), b"b")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import os
+import pathlib
+import tempfile
+import unittest
+from toprefix import runenv
+from toprefix import toolchain
+
+STUB = """#!/bin/sh
+echo "{name} version {version}"
+echo "$0" >> "{log}"
+"""
+
+
+def make_stub(dir: pathlib.Path, name: str, version: str, log: pathlib.Path):
+    path = dir / name
+    path.write_text(STUB.format(name=name, version=version, log=log))
+    path.chmod(0o755)
+    return path
+
+
+@unittest.skipIf(runenv.IS_WINDOWS, "sh stub")
+class TestToolchain(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmp.name)
+        self.first = self.root / "first"
+        self.second = self.root / "second"
+        self.first.mkdir()
+        self.second.mkdir()
+        self.log = self.root / "log"
+        self.cache = self.root / ".toolchain.json"
+        self.path_list = [str(self.first), str(self.second), str(self.root / "none")]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def probes(self) -> int:
+        return len(self.log.read_text().splitlines()) if self.log.exists() else 0
+
+    def test_which(self):
+        make_stub(self.first, "meson", "1.0", self.log)
+        make_stub(self.second, "meson", "0.9", self.log)
+        make_stub(self.second, "ninja", "1.11", self.log)
+        (self.second / "dir").mkdir()
+
+        tools = toolchain.Toolchain(self.path_list, self.cache)
+        self.assertEqual(self.first / "meson", tools.which("meson"))
+        self.assertEqual(self.second / "ninja", tools.which("ninja"))
+        self.assertIsNone(tools.which("dir"))
+        self.assertIsNone(tools.which("cmake"))
+
+    def test_version_cache(self):
+        make_stub(self.first, "meson", "1.0", self.log)
+
+        tools = toolchain.Toolchain(self.path_list, self.cache)
+        self.assertEqual("meson version 1.0", tools.version("meson"))
+        self.assertEqual("meson version 1.0", tools.version("meson"))
+        self.assertEqual("", tools.version("cmake"))
+        self.assertEqual(1, self.probes())
+
+        # next process
+        tools = toolchain.Toolchain(self.path_list, self.cache)
+        self.assertEqual("meson version 1.0", tools.version("meson"))
+        self.assertEqual(1, self.probes())
+
+    def test_invalidate(self):
+        make_stub(self.first, "meson", "1.0", self.log)
+        tools = toolchain.Toolchain(self.path_list, self.cache)
+        self.assertEqual("meson version 1.0", tools.version("meson"))
+
+        # new tool in PATH
+        make_stub(self.second, "cmake", "3.25", self.log)
+        os.utime(self.second, ns=(0, 1))
+        tools = toolchain.Toolchain(self.path_list, self.cache)
+        self.assertEqual(self.second / "cmake", tools.which("cmake"))
+
+        # upgraded in place
+        make_stub(self.first, "meson", "1.1", self.log)
+        os.utime(self.first / "meson", ns=(0, 1))
+        tools = toolchain.Toolchain(self.path_list, self.cache)
+        self.assertEqual("meson version 1.1", tools.version("meson"))
+
+        # PATH changed
+        tools = toolchain.Toolchain([str(self.second)], self.cache)
+        self.assertIsNone(tools.which("meson"))
+
+    def test_get_toolchain(self):
+        make_stub(self.first, "meson", "1.0", self.log)
+        saved = runenv.PATH_LIST, runenv.LOCAL_SRC
+        try:
+            runenv.LOCAL_SRC = self.root
+            runenv.PATH_LIST = self.path_list
+            self.assertEqual(self.first / "meson", runenv.which("meson"))
+            self.assertIs(toolchain.get_toolchain(), toolchain.get_toolchain())
+            runenv.PATH_LIST = [str(self.second)]
+            self.assertIsNone(runenv.which("meson"))
+        finally:
+            runenv.PATH_LIST, runenv.LOCAL_SRC = saved
+        self.assertTrue(self.cache.exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
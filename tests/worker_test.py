@@ -0,0 +1,192 @@
+import socket
+import pathlib
+import tempfile
+import unittest
+from toprefix import runenv
+from toprefix import artifact
+from toprefix import scheduler
+from toprefix import builddir
+from toprefix import compiler_cache
+from toprefix import worker
+
+
+class FakeSource:
+    def __init__(self, name: str):
+        self.name = name
+        self.patches = []
+
+    def fetch(self) -> int:
+        return 0
+
+    def fingerprint(self) -> str:
+        return self.name
+
+
+class FakePkg:
+    def __init__(self, name: str, deps=[]):
+        self.source = FakeSource(name)
+        self.deps = deps
+        self.recipe = {"pkg": {"meson": {}}}
+        self.built = 0
+        self.build_types = []
+        self.ccache_dirs = []
+
+    def process(self, *, clean: bool, reconfigure: bool):
+        # deps are installed to PREFIX before
+        for dep in self.deps:
+            assert (runenv.PREFIX / "bin" / dep).exists(), dep
+        self.built += 1
+        self.build_types.append(builddir.get_build_type())
+        self.ccache_dirs.append(runenv.get_overlay().get("CCACHE_DIR"))
+        destdir = pathlib.Path(runenv.get_overlay()["DESTDIR"])
+        bin = destdir / runenv.PREFIX.relative_to(runenv.PREFIX.anchor) / "bin"
+        bin.mkdir(parents=True)
+        (bin / self.source.name).write_text(self.source.name)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class TestWorker(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmp.name)
+        self.saved = runenv.get_prefix(), runenv.LOCAL_SRC
+        runenv.PREFIX = self.root / "prefix"
+        runenv.LOCAL_SRC = self.root / "src"
+        self.pkgs = {
+            "a": FakePkg("a"),
+            "b": FakePkg("b"),
+            "c": FakePkg("c", deps=["a"]),
+            "d": FakePkg("d", deps=["c", "b"]),
+        }
+        self.workers = [
+            worker.Worker(
+                self.pkgs.get,
+                port=0,
+                cache=artifact.ArtifactCache(self.root / f"worker{i}"),
+                token="secret",
+            ).__enter__()
+            for i in range(2)
+        ]
+
+    def tearDown(self):
+        for x in self.workers:
+            x.__exit__()
+        runenv.PREFIX, runenv.LOCAL_SRC = self.saved
+        self.tmp.cleanup()
+
+    def coordinator(self, addresses, token="secret") -> worker.Coordinator:
+        return worker.Coordinator(
+            addresses,
+            self.pkgs.get,
+            cache=artifact.ArtifactCache(self.root / "local"),
+            token=token,
+        )
+
+    def process(self, coordinator: worker.Coordinator):
+        return lambda pkg: coordinator.process(pkg, clean=False, reconfigure=False)
+
+    def test_build(self):
+        coordinator = self.coordinator([x.address for x in self.workers])
+        self.assertEqual(2, coordinator.slots)
+        pkgs = scheduler.resolve(["d"], self.pkgs.get)
+        status = scheduler.build(pkgs, slots=2, process=self.process(coordinator))
+        self.assertEqual({"a": "ok", "b": "ok", "c": "ok", "d": "ok"}, status)
+        for name, pkg in self.pkgs.items():
+            self.assertEqual(1, pkg.built, name)
+            self.assertEqual(name, (runenv.PREFIX / "bin" / name).read_text())
+            # shipped back to the local cache
+            self.assertTrue(coordinator.cache.path(coordinator.cache.keys[name]).exists())
+
+        # local cache hit. no remote build
+        coordinator = self.coordinator([x.address for x in self.workers])
+        scheduler.build(pkgs, slots=2, process=self.process(coordinator))
+        self.assertEqual(1, self.pkgs["d"].built)
+
+    def test_ship_deps(self):
+        coordinator = self.coordinator([self.workers[0].address])
+        coordinator.process(self.pkgs["a"], clean=False, reconfigure=False)
+        # a is not in the cache of the other worker
+        other = self.workers[1]
+        key = artifact.artifact_key(self.pkgs["c"], coordinator.cache.keys)
+        coordinator.remote_build(
+            other.address, self.pkgs["c"], key, clean=False, reconfigure=False
+        )
+        self.assertTrue(other.cache.path(coordinator.cache.keys["a"]).exists())
+        self.assertTrue(coordinator.cache.path(key).exists())
+
+    def test_build_type(self):
+        coordinator = self.coordinator([self.workers[0].address])
+        # the worker thread has the default build type
+        with builddir.use("release"):
+            coordinator.process(self.pkgs["a"], clean=False, reconfigure=False)
+        self.assertEqual(["release"], self.pkgs["a"].build_types)
+        coordinator.process(self.pkgs["b"], clean=False, reconfigure=False)
+        self.assertEqual([None], self.pkgs["b"].build_types)
+
+    def test_compiler_cache(self):
+        dir = self.root / "ccache"
+        compiler_cache.set_cache(
+            compiler_cache.CompilerCache("ccache", self.root / "none/ccache", dir)
+        )
+        try:
+            coordinator = self.coordinator([self.workers[0].address])
+            coordinator.process(self.pkgs["a"], clean=False, reconfigure=False)
+        finally:
+            compiler_cache.set_cache(None)
+        self.assertEqual([str(dir)], self.pkgs["a"].ccache_dirs)
+
+    def test_fallback(self):
+        # no worker. built here
+        coordinator = self.coordinator([f"127.0.0.1:{free_port()}"])
+        self.assertEqual(0, coordinator.slots)
+        coordinator.process(self.pkgs["a"], clean=False, reconfigure=False)
+        self.assertEqual("a", (runenv.PREFIX / "bin/a").read_text())
+
+    def test_token(self):
+        coordinator = self.coordinator([self.workers[0].address], token="wrong")
+        self.assertEqual(0, coordinator.slots)
+
+    def test_error(self):
+        coordinator = self.coordinator([self.workers[0].address])
+        # recipe differs from the worker
+        pkg = FakePkg("a")
+        pkg.recipe = {"pkg": {"cmake": {}}}
+        with self.assertRaises(Exception):
+            coordinator.process(pkg, clean=False, reconfigure=False)
+        # the slot is returned
+        self.assertEqual(1, coordinator.idle.qsize())
+
+    def test_invalid_key(self):
+        coordinator = self.coordinator([self.workers[0].address])
+        pkg = self.pkgs["a"]
+        request = {
+            "op": "build",
+            "name": "a",
+            "key": "../../../outside",
+            "recipe": worker.recipe_fingerprint(pkg),
+            "deps": [],
+            "clean": False,
+            "reconfigure": False,
+        }
+        response = coordinator.request(self.workers[0].address, request)
+        self.assertEqual("error", response["status"])
+        request["key"] = "0" * 64
+        request["deps"] = [["b", "../b"]]
+        response = coordinator.request(self.workers[0].address, request)
+        self.assertEqual("error", response["status"])
+        self.assertEqual(0, pkg.built)
+        self.assertFalse((self.root / "outside.tar.gz").exists())
+
+    def test_bind_without_token(self):
+        with self.assertRaises(Exception):
+            worker.Worker(self.pkgs.get, host="0.0.0.0", port=0)
+        worker.Worker(self.pkgs.get, host="127.0.0.1", port=0).server.server_close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,56 +1,429 @@
+from typing import List, Optional
+import os
+import sys
+import pathlib
 import argparse
 import logging
-from . import package
-from . import _version
-from . import runenv
-import colorama
-from colorama import Fore
+
+# subcommand modules are imported in each case.
+# `toprefix version` should not pay for requests, toml and the recipes
 
 LOGGER = logging.getLogger(__name__)
 
+# read-only commands answered by `toprefix serve` when it is running.
+# install, fetch and worker need the terminal, the environment of the caller
+# and a jobserver. they always run in-process.
+# outdated takes minutes on the network and would block the daemon, which runs
+# one command at a time
+FORWARD = ("list", "owns", "stats")
 
-def main():
-    logging.basicConfig(level=logging.DEBUG)
-    # handler = colorlog.StreamHandler()
-    # handler.setFormatter(colorlog.ColoredFormatter(
-    #     '%(log_color)s%(levelname)s:%(name)s:%(message)s'))
-    # logging.root.handlers=[handler]
-    colorama.init(autoreset=True)
 
+def make_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         prog="toprefix", description="Build automation to prefix"
     )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="count",
+        default=0,
+        help="-v prints command output, -vv debug log",
+    )
+    parser.add_argument(
+        "-q", "--quiet", action="store_true", help="warnings and failures only"
+    )
     subparsers = parser.add_subparsers(dest="subparser_name")
 
     parser_version = subparsers.add_parser("version")
 
     parser_list = subparsers.add_parser("list")
 
+    parser_fetch = subparsers.add_parser("fetch")
+    parser_fetch.add_argument("packages", nargs="*")
+    parser_fetch.add_argument("--jobs", type=int, default=8)
+    parser_fetch.add_argument(
+        "--update", action="store_true", help="fetch git refs of existing worktrees"
+    )
+    parser_fetch.add_argument(
+        "--locked", action="store_true", help="fetch the sources of the lockfile"
+    )
+
+    parser_lock = subparsers.add_parser(
+        "lock", help="write the resolved sources to the lockfile"
+    )
+    parser_lock.add_argument("packages", nargs="*", help="and the deps. default: all")
+    parser_lock.add_argument("--jobs", type=int, default=8)
+    parser_lock.add_argument(
+        "--update",
+        action="store_true",
+        help="fetch git refs of existing worktrees and moving archives",
+    )
+
     parser_build = subparsers.add_parser("install")
-    parser_build.add_argument("package")
+    parser_build.add_argument("packages", nargs="+")
     parser_build.add_argument("--clean", action=argparse.BooleanOptionalAction)
     parser_build.add_argument("--reconfigure", action=argparse.BooleanOptionalAction)
+    parser_build.add_argument("--prefetch", action=argparse.BooleanOptionalAction)
+    parser_build.add_argument(
+        "--update", action="store_true", help="fetch git refs of existing worktrees"
+    )
+    parser_build.add_argument(
+        "--locked", action="store_true", help="sources of the lockfile"
+    )
+    parser_build.add_argument(
+        "--offline",
+        action="store_true",
+        help="--locked without network. sources from the store and the git mirrors",
+    )
+    parser_build.add_argument(
+        "--slots", type=int, default=1, help="packages to build concurrently"
+    )
+    parser_build.add_argument(
+        "--jobs",
+        type=int,
+        help="job tokens shared by all builds. default: config jobs or cpu count",
+    )
+    parser_build.add_argument(
+        "--load",
+        type=float,
+        help="do not start jobs above this load average. default: config load",
+    )
+    parser_build.add_argument(
+        "--build-type",
+        choices=("debug", "debugoptimized", "release", "minsize"),
+        help="meson and cmake build type. separate build dirs. default: config build_type",
+    )
+    parser_build.add_argument(
+        "--worker",
+        action="append",
+        help="HOST:PORT of a toprefix worker. repeatable. default: config workers",
+    )
+    parser_build.add_argument(
+        "--artifact",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="restore built packages from the artifact cache",
+    )
 
-    args = parser.parse_args()
+    parser_worker = subparsers.add_parser(
+        "worker", help="build packages for install --worker"
+    )
+    parser_worker.add_argument("--bind", default="127.0.0.1")
+    parser_worker.add_argument("--port", type=int, default=8765)
+    parser_worker.add_argument(
+        "--slots", type=int, default=1, help="packages to build concurrently"
+    )
+    parser_worker.add_argument(
+        "--jobs", type=int, help="job tokens. default: config jobs or cpu count"
+    )
 
-    package.init_pkgs()
-    match args.subparser_name:
-        case "version":
-            print(_version.version)
+    parser_owns = subparsers.add_parser("owns", help="package installed the file")
+    parser_owns.add_argument("paths", nargs="+")
+
+    parser_uninstall = subparsers.add_parser("uninstall")
+    parser_uninstall.add_argument("packages", nargs="+")
+
+    parser_stats = subparsers.add_parser("stats")
+    parser_stats.add_argument("packages", nargs="*")
+    parser_stats.add_argument("--limit", type=int, default=10)
+
+    parser_outdated = subparsers.add_parser(
+        "outdated", help="check upstream releases of the recipes"
+    )
+    parser_outdated.add_argument("packages", nargs="*")
+    parser_outdated.add_argument("--jobs", type=int, default=8)
+    parser_outdated.add_argument(
+        "--all", action="store_true", help="list up to date packages too"
+    )
+
+    parser_serve = subparsers.add_parser(
+        "serve", help=f"answer {', '.join(FORWARD)} from a warm process"
+    )
+    parser_serve.add_argument(
+        "--socket", help="unix socket. default: LOCAL_SRC/.serve.sock"
+    )
+
+    return parser
+
+
+def get_command(argv: List[str]) -> Optional[str]:
+    for arg in argv:
+        if not arg.startswith("-"):
+            return arg
+    return None
+
+
+def main(argv: Optional[List[str]] = None):
+    if argv is None:
+        argv = sys.argv[1:]
+        # thin client of toprefix serve. falls back to in-process
+        if get_command(argv) in FORWARD:
+            from . import daemon
+
+            code = daemon.forward(argv)
+            if code is not None:
+                sys.exit(code)
+
+    parser = make_parser()
+    args = parser.parse_args(argv)
 
+    if args.subparser_name == "version":
+        from . import _version
+
+        print(_version.version)
+        return
+
+    import colorama
+    from . import runner
+
+    colorama.init(autoreset=True)
+    runner.setup(get_verbosity(args))
+    dispatch(parser, args)
+
+
+def get_verbosity(args: argparse.Namespace) -> int:
+    from . import runner
+    from . import runenv
+
+    if args.quiet:
+        return runner.QUIET
+    if args.verbose:
+        return runner.NORMAL + args.verbose
+    return int(runenv.get_config().get("verbosity", runner.NORMAL))
+
+
+def dispatch(parser: argparse.ArgumentParser, args: argparse.Namespace):
+    # also called by toprefix serve with sys.stdout of the client
+    from colorama import Fore
+    from . import package
+    from . import runner
+    from . import runenv
+
+    if getattr(args, "update", False):
+        from .source import gitrepository
+
+        gitrepository.UPDATE = True
+
+    match args.subparser_name:
         case "list":
             LOGGER.info("list")
+            package.init_pkgs()
             package.list_pkgs()
 
+        case "fetch":
+            from . import fetch
+
+            package.init_pkgs()
+            if args.packages:
+                pkgs = []
+                for name in args.packages:
+                    pkg = package.get_pkg(name)
+                    if not pkg:
+                        print(f"{name} {Fore.RED}not found{Fore.RESET}")
+                        return
+                    pkgs.append(pkg)
+            else:
+                pkgs = list(package.iter_pkgs())
+            if args.locked:
+                from . import lockfile
+
+                try:
+                    lockfile.apply(pkgs, lockfile.load())
+                except Exception as e:
+                    print(f"{Fore.RED}{e}{Fore.RESET}")
+                    sys.exit(1)
+            if not fetch.fetch(pkgs, jobs=args.jobs):
+                sys.exit(1)
+
+        case "lock":
+            from . import lockfile
+            from . import scheduler
+
+            package.init_pkgs()
+            try:
+                pkgs = (
+                    scheduler.resolve(args.packages, package.get_pkg)
+                    if args.packages
+                    else list(package.iter_pkgs())
+                )
+            except KeyError as e:
+                print(f"{e.args[0]} {Fore.RED}not found{Fore.RESET}")
+                return
+            except scheduler.CycleError as e:
+                print(f"{Fore.RED}{e}{Fore.RESET}")
+                sys.exit(1)
+            if not lockfile.lock(pkgs, jobs=args.jobs, update=args.update):
+                sys.exit(1)
+            print(f"lock: {lockfile.get_path()}")
+
         case "install":
-            pkg = package.get_pkg(args.package)
-            if not pkg:
-                print(f"{args.package} {Fore.RED}not found{Fore.RESET}")
+            from . import fetch
+            from . import scheduler
+            from . import artifact
+            from . import jobserver
+            from . import compiler_cache
+            from . import history
+            from . import builddir
+
+            builddir.BUILD_TYPE = args.build_type
+            package.init_pkgs()
+            try:
+                pkgs = scheduler.resolve(args.packages, package.get_pkg)
+            except KeyError as e:
+                print(f"{e.args[0]} {Fore.RED}not found{Fore.RESET}")
                 return
-            pkg.process(
-                clean=args.clean,
-                reconfigure=args.reconfigure,
+            except scheduler.CycleError as e:
+                print(f"{Fore.RED}{e}{Fore.RESET}")
+                sys.exit(1)
+            if args.locked or args.offline:
+                from . import lockfile
+                from .source import download
+
+                try:
+                    lockfile.apply(pkgs, lockfile.load())
+                except Exception as e:
+                    print(f"{Fore.RED}{e}{Fore.RESET}")
+                    sys.exit(1)
+                download.OFFLINE = args.offline
+            if args.prefetch:
+                fetch.fetch(pkgs)
+            config = runenv.get_config()
+            slots = args.slots
+            workers = args.worker or config.get("workers") or []
+            if workers:
+                from . import worker
+
+                if not args.artifact:
+                    print(f"--worker {Fore.RED}needs the artifact cache{Fore.RESET}")
+                    return
+                coordinator = worker.Coordinator(
+                    workers, package.get_pkg, token=worker.get_token()
+                )
+                process = coordinator.process
+                if slots == 1:
+                    # one package per worker slot
+                    slots = max(1, coordinator.slots)
+            elif args.artifact:
+                process = artifact.ArtifactCache().process
+            else:
+                process = artifact.process_staged
+            server = jobserver.start(
+                args.jobs or config.get("jobs") or os.cpu_count() or 1,
+                load=args.load or config.get("load"),
+                slots=slots,
+            )
+
+            def run(pkg):
+                with server.client(), history.record(
+                    pkg.source.name,
+                    history.get_version(pkg.source),
+                    args={
+                        "clean": bool(args.clean),
+                        "reconfigure": bool(args.reconfigure),
+                        "artifact": args.artifact,
+                        "slots": slots,
+                        "recipe": pkg.recipe.get("pkg", {}),
+                    },
+                    jobs=server.jobs,
+                ), runner.log(pkg.source.name), compiler_cache.measure(
+                    pkg.source.name
+                ):
+                    process(pkg, clean=args.clean, reconfigure=args.reconfigure)
+
+            try:
+                status = scheduler.build(pkgs, slots=slots, process=run)
+            finally:
+                jobserver.stop()
+            scheduler.print_status(status)
+            if any(result != scheduler.OK for result in status.values()):
+                sys.exit(1)
+
+        case "worker":
+            from . import worker
+            from . import jobserver
+
+            package.init_pkgs()
+            config = runenv.get_config()
+            try:
+                server = worker.Worker(
+                    package.get_pkg,
+                    host=args.bind,
+                    port=args.port,
+                    slots=args.slots,
+                    token=worker.get_token(),
+                )
+            except Exception as e:
+                print(f"{Fore.RED}{e}{Fore.RESET}")
+                sys.exit(1)
+            jobserver.start(
+                args.jobs or config.get("jobs") or os.cpu_count() or 1,
+                load=config.get("load"),
+                slots=args.slots,
             )
+            print(f"worker: {server.address}")
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                jobserver.stop()
+
+        case "serve":
+            from . import daemon
+
+            import signal
+
+            server = daemon.Daemon(pathlib.Path(args.socket) if args.socket else None)
+            # the socket is removed on kill
+            signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+            print(f"serve: {server.path}")
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+
+        case "owns":
+            from . import manifest
+
+            manifest.print_owners(args.paths)
+
+        case "uninstall":
+            from . import manifest
+
+            db = manifest.get_db()
+            for name in args.packages:
+                try:
+                    count = db.uninstall(name)
+                except KeyError:
+                    print(f"{name} {Fore.RED}not installed{Fore.RESET}")
+                    continue
+                print(f"{name}: {count} files removed")
+            package.init_pkgs()
+            for name in db.installed():
+                pkg = package.get_pkg(name)
+                missing = [dep for dep in pkg.deps if dep in args.packages] if pkg else []
+                if missing:
+                    print(f"{name} {Fore.YELLOW}depends on{Fore.RESET} {', '.join(missing)}")
+
+        case "stats":
+            from . import history
+
+            history.print_stats(args.packages, limit=args.limit)
+
+        case "outdated":
+            from . import outdated
+
+            package.init_pkgs()
+            assert package.INDEX
+            names = args.packages or package.INDEX.names
+            items = []
+            for name in names:
+                recipe = package.INDEX.get_recipe(name)
+                if recipe is None:
+                    print(f"{name} {Fore.RED}not found{Fore.RESET}")
+                    return
+                items.append((name, recipe["source"]))
+            outdated.outdated(items, jobs=args.jobs, all=args.all)
 
         case _:
             parser.print_help()
@@ -0,0 +1,218 @@
+from typing import Dict, Optional
+import os
+import json
+import hashlib
+import logging
+import posixpath
+import pathlib
+import platform
+import tarfile
+import tempfile
+from . import runenv
+from . import stamp
+from . import history
+from . import manifest
+from . import builddir
+from .package import Pkg
+
+LOGGER = logging.getLogger(__name__)
+
+# MB
+DEFAULT_CACHE_SIZE = 10 * 1024
+
+
+def get_cache_dir() -> pathlib.Path:
+    dir = runenv.CONFIG.get("artifact_cache")
+    if dir:
+        return pathlib.Path(dir).expanduser()
+    return runenv.LOCAL_SRC / ".artifacts"
+
+
+def get_cache_size() -> int:
+    return int(runenv.CONFIG.get("artifact_cache_size", DEFAULT_CACHE_SIZE)) * 1024 * 1024
+
+
+def get_stage_dir() -> pathlib.Path:
+    dir = runenv.LOCAL_SRC / ".stage"
+    dir.mkdir(parents=True, exist_ok=True)
+    return dir
+
+
+def get_platform() -> str:
+    return f"{platform.system()}-{platform.machine()}".lower()
+
+
+def artifact_key(pkg: Pkg, dep_keys: Dict[str, str]) -> str:
+    # source must be fetched
+    inputs = stamp.source_inputs(pkg.source)
+    inputs["name"] = pkg.source.name
+    inputs["recipe"] = pkg.recipe
+    inputs["deps"] = {dep: dep_keys.get(dep, "") for dep in pkg.deps}
+    inputs["platform"] = get_platform()
+    build_type = builddir.get_build_type()
+    if build_type:
+        inputs["build_type"] = build_type
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def pack(stage: pathlib.Path, dst: pathlib.Path) -> int:
+    # returns number of files. member names are relative to the filesystem root
+    count = 0
+    tmp = dst.with_name(f"{dst.name}.{os.getpid()}.tmp")
+    with tarfile.open(tmp, "w:gz") as tar:
+        for dirpath, dirnames, filenames in os.walk(stage):
+            dir = pathlib.Path(dirpath)
+            dirnames.sort()
+            names = sorted(filenames + [d for d in dirnames if (dir / d).is_symlink()])
+            if not names and not dirnames and dir != stage:
+                # keep empty directory
+                names = [""]
+            for name in names:
+                path = dir / name if name else dir
+                tar.add(
+                    path, arcname=path.relative_to(stage).as_posix(), recursive=False
+                )
+                count += 1
+    if count:
+        os.replace(tmp, dst)
+    else:
+        os.remove(tmp)
+    return count
+
+
+def check_members(src: pathlib.Path):
+    # artifacts from workers are installed to PREFIX. nothing outside of it
+    prefix = runenv.get_prefix()
+    prefix_rel = prefix.relative_to(prefix.anchor).as_posix()
+
+    def in_prefix(rel: str) -> bool:
+        return rel == prefix_rel or rel.startswith(prefix_rel + "/")
+
+    with tarfile.open(src, "r:*") as tar:
+        for member in tar.getmembers():
+            name = member.name
+            if name.startswith("/") or os.path.isabs(name):
+                raise Exception(f"{src.name}: absolute path {name}")
+            if ".." in name.split("/"):
+                raise Exception(f"{src.name}: {name} has ..")
+            norm = posixpath.normpath(name)
+            if member.issym():
+                target = member.linkname
+                if target.startswith("/") or os.path.isabs(target):
+                    target = pathlib.Path(target)
+                    if target.anchor != prefix.anchor:
+                        raise Exception(f"{src.name}: {name} => {target} is outside")
+                    target = target.relative_to(target.anchor).as_posix()
+                else:
+                    target = posixpath.join(posixpath.dirname(norm), target)
+                if not in_prefix(posixpath.normpath(target)):
+                    raise Exception(f"{src.name}: {name} => {member.linkname} is outside")
+            elif member.islnk():
+                if not in_prefix(posixpath.normpath(member.linkname)):
+                    raise Exception(f"{src.name}: {name} => {member.linkname} is outside")
+
+
+def unpack(src: pathlib.Path, root: pathlib.Path):
+    with tarfile.open(src, "r:*") as tar:
+        if hasattr(tarfile, "tar_filter"):
+            tar.extractall(root, filter="tar")
+        else:
+            tar.extractall(root)
+
+
+def evict(cache_dir: pathlib.Path, max_size: int):
+    # least recently used first. mtime is updated on restore
+    items = []
+    total = 0
+    for path in cache_dir.glob("*.tar.gz"):
+        st = path.stat()
+        items.append((st.st_mtime, st.st_size, path))
+        total += st.st_size
+    items.sort()
+    for _, size, path in items:
+        if total <= max_size:
+            break
+        LOGGER.info(f"evict: {path.name}")
+        path.unlink(missing_ok=True)
+        total -= size
+
+
+class ArtifactCache:
+    def __init__(self, dir: Optional[pathlib.Path] = None) -> None:
+        self.dir = dir or get_cache_dir()
+        self.max_size = get_cache_size()
+        # name => artifact key of this session
+        self.keys: Dict[str, str] = {}
+
+    def path(self, key: str) -> pathlib.Path:
+        return self.dir / f"{key}.tar.gz"
+
+    def restore(self, pkg: Pkg, key: str) -> bool:
+        path = self.path(key)
+        if manifest.get_db().is_installed(pkg.source.name, key):
+            LOGGER.info(f"restore: {pkg.source.name} is installed")
+            if path.exists():
+                os.utime(path)
+            return True
+        if not path.exists():
+            return False
+        LOGGER.info(f"restore: {pkg.source.name} <= {path}")
+        check_members(path)
+        with history.phase("restore"), tempfile.TemporaryDirectory(
+            dir=get_stage_dir()
+        ) as dname:
+            stage = pathlib.Path(dname)
+            unpack(path, stage)
+            install_stage(pkg, stage, key=key)
+        os.utime(path)
+        return True
+
+    def process(self, pkg: Pkg, *, clean: bool, reconfigure: bool):
+        name = pkg.source.name
+        pkg.source.fetch()
+        key = artifact_key(pkg, self.keys)
+        self.keys[name] = key
+        if not clean and not reconfigure and self.restore(pkg, key):
+            return
+
+        self.dir.mkdir(parents=True, exist_ok=True)
+        # the cache may be a network mount. only the packed artifact is written there
+        with tempfile.TemporaryDirectory(dir=get_stage_dir()) as dname:
+            stage = pathlib.Path(dname)
+            with runenv.setenv(DESTDIR=str(stage)):
+                pkg.process(clean=clean, reconfigure=reconfigure)
+            count = pack(stage, self.path(key))
+            if count:
+                LOGGER.info(f"artifact: {name} {count} files => {self.path(key)}")
+                install_stage(pkg, stage, key=key)
+        if count:
+            evict(self.dir, self.max_size)
+        else:
+            LOGGER.info(f"artifact: {name} nothing staged")
+
+
+def install_stage(pkg: Pkg, stage: pathlib.Path, *, key: str = ""):
+    # stage => PREFIX with a manifest
+    manifest.get_db().install(
+        pkg.source.name, history.get_version(pkg.source), stage, key=key
+    )
+
+
+def is_empty(stage: pathlib.Path) -> bool:
+    # no file or link. directories only
+    return not any(
+        path.is_symlink() or not path.is_dir() for path in stage.rglob("*")
+    )
+
+
+def process_staged(pkg: Pkg, *, clean: bool, reconfigure: bool):
+    # install --no-artifact. staged for the manifest but not cached
+    with tempfile.TemporaryDirectory(dir=get_stage_dir()) as dname:
+        stage = pathlib.Path(dname)
+        with runenv.setenv(DESTDIR=str(stage)):
+            pkg.process(clean=clean, reconfigure=reconfigure)
+        if is_empty(stage):
+            # DESTDIR is ignored by the recipe. an empty manifest uninstalls
+            LOGGER.warning(f"{pkg.source.name}: nothing staged. manifest is kept")
+            return
+        install_stage(pkg, stage)
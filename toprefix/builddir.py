@@ -0,0 +1,112 @@
+from typing import List, Optional
+import shutil
+import logging
+import pathlib
+import threading
+import contextlib
+from . import runenv
+
+LOGGER = logging.getLogger(__name__)
+
+# out of tree build directories of meson and cmake. the source tree is not modified
+#
+# toprefix.toml
+# build_root = "/dev/shm/toprefix" # or ["/dev/shm/toprefix", "/mnt/nvme/build"]
+# build_root_min_free = 4096 # MB. a smaller root is skipped
+# build_type = "release" # debug, debugoptimized, release, minsize
+#
+# {build_root}/{source dir name}/{build_type or default}
+# LOCAL_SRC/.build is the last fallback
+
+MB = 1024 * 1024
+MIN_FREE_MB = 1024
+
+BUILD_TYPES = ("debug", "debugoptimized", "release", "minsize")
+CMAKE_BUILD_TYPES = {
+    "debug": "Debug",
+    "debugoptimized": "RelWithDebInfo",
+    "release": "Release",
+    "minsize": "MinSizeRel",
+}
+
+# --build-type. toprefix.toml build_type if None
+BUILD_TYPE: Optional[str] = None
+
+# per thread. a worker builds requests of different build types concurrently
+CURRENT = threading.local()
+
+
+@contextlib.contextmanager
+def use(build_type: Optional[str]):
+    # None is the default build type, not the config
+    last = getattr(CURRENT, "build_type", ())
+    CURRENT.build_type = (build_type,)
+    try:
+        yield
+    finally:
+        CURRENT.build_type = last
+
+
+def get_build_type() -> Optional[str]:
+    current = getattr(CURRENT, "build_type", ())
+    if current:
+        build_type = current[0]
+    else:
+        build_type = BUILD_TYPE or runenv.get_config().get("build_type")
+    if build_type and build_type not in BUILD_TYPES:
+        raise Exception(f"build_type: {build_type} is not one of {BUILD_TYPES}")
+    return build_type
+
+
+def get_roots() -> List[pathlib.Path]:
+    roots = runenv.get_config().get("build_root") or []
+    if isinstance(roots, str):
+        roots = [roots]
+    return [pathlib.Path(root).expanduser() for root in roots] + [
+        runenv.LOCAL_SRC / ".build"
+    ]
+
+
+def get_free(path: pathlib.Path) -> int:
+    # the root may not exist yet
+    for dir in [path, *path.parents]:
+        if dir.exists():
+            return shutil.disk_usage(dir).free
+    return 0
+
+
+def get_build_dir(source_dir: pathlib.Path) -> pathlib.Path:
+    # per package, version and build type
+    key = pathlib.Path(source_dir.name) / (get_build_type() or "default")
+    roots = get_roots()
+    for root in roots:
+        if (root / key).exists():
+            # keep the configured tree
+            return root / key
+    min_free = int(runenv.get_config().get("build_root_min_free", MIN_FREE_MB)) * MB
+    for root in roots[:-1]:
+        free = get_free(root)
+        if free >= min_free:
+            return root / key
+        LOGGER.warning(
+            f"build_root: {root}: {free // MB} MB free < {min_free // MB} MB. skip"
+        )
+    return roots[-1] / key
+
+
+def prepare(source_dir: pathlib.Path, *, clean: bool) -> pathlib.Path:
+    build_dir = get_build_dir(source_dir)
+    if clean and build_dir.exists():
+        shutil.rmtree(build_dir)
+    build_dir.mkdir(parents=True, exist_ok=True)
+    LOGGER.info(f"build dir: {build_dir}")
+    return build_dir
+
+
+def meson_args() -> str:
+    build_type = get_build_type()
+    return f" --buildtype={build_type}" if build_type else ""
+
+
+def cmake_build_type() -> str:
+    return CMAKE_BUILD_TYPES[get_build_type() or "release"]
@@ -0,0 +1,128 @@
+from typing import Dict, Optional, Protocol, Any
+import os
+import json
+import hashlib
+import logging
+import pathlib
+import threading
+from . import runenv
+from . import vcenv
+
+LOGGER = logging.getLogger(__name__)
+
+
+class EnvProvider(Protocol):
+    def key(self) -> Dict[str, Any]:
+        # inputs of get_env. the cache is invalidated when this changes
+        ...
+
+    def get_env(self) -> Dict[str, str]:
+        ...
+
+
+def mtime(path: pathlib.Path) -> int:
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:
+        return 0
+
+
+class HostEnvProvider(EnvProvider):
+    # minimum_env + vcvars64 on Windows
+    def key(self) -> Dict[str, Any]:
+        return {
+            "PATH": os.environ.get("PATH", ""),
+            "env": {k: os.environ.get(k) for k in runenv.ENV_KEYS},
+            "files": {str(path): mtime(path) for path in [vcenv.get_kits()]},
+        }
+
+    def get_env(self) -> Dict[str, str]:
+        env = runenv.minimum_env()
+        env.update(vcenv.get_env(env))
+        return env
+
+
+class StaticEnvProvider(EnvProvider):
+    def __init__(self, env: Dict[str, str]) -> None:
+        self.env = env
+        self.count = 0
+
+    def key(self) -> Dict[str, Any]:
+        return {"env": self.env}
+
+    def get_env(self) -> Dict[str, str]:
+        self.count += 1
+        return dict(self.env)
+
+
+def prefix_overlay() -> Dict[str, str]:
+    prefix = runenv.get_prefix()
+    if runenv.IS_WINDOWS:
+        dirs = ["lib/pkgconfig", "share/pkgconfig"]
+    else:
+        dirs = ["lib64/pkgconfig", "lib/pkgconfig", "share/pkgconfig"]
+    return {"PKG_CONFIG_PATH": os.pathsep.join(str(prefix / dir) for dir in dirs)}
+
+
+class BuildEnv:
+    def __init__(
+        self, provider: EnvProvider, cache_dir: Optional[pathlib.Path] = None
+    ) -> None:
+        self.provider = provider
+        self.cache_dir = cache_dir
+        self.lock = threading.Lock()
+        self.env: Optional[Dict[str, str]] = None
+
+    def load(self) -> Dict[str, str]:
+        key = hashlib.sha256(
+            json.dumps(self.provider.key(), sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        cache = self.cache_dir / f"{key}.json" if self.cache_dir else None
+        if cache and cache.exists():
+            try:
+                return json.loads(cache.read_text(encoding="utf-8"))
+            except json.JSONDecodeError:
+                pass
+
+        env = self.provider.get_env()
+        if cache:
+            cache.parent.mkdir(parents=True, exist_ok=True)
+            tmp = cache.with_name(f"{cache.name}.{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(env), encoding="utf-8")
+            os.replace(tmp, cache)
+        return env
+
+    def get(self, overlay: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        with self.lock:
+            if self.env is None:
+                self.env = self.load()
+        env = dict(self.env)
+        env.update(prefix_overlay())
+        if overlay:
+            env.update(overlay)
+        return env
+
+
+BUILD_ENV: Optional[BuildEnv] = None
+BUILD_ENV_LOCK = threading.Lock()
+
+
+def get_build_env() -> BuildEnv:
+    global BUILD_ENV
+    with BUILD_ENV_LOCK:
+        if not BUILD_ENV:
+            BUILD_ENV = BuildEnv(HostEnvProvider(), runenv.LOCAL_SRC / ".buildenv")
+        return BUILD_ENV
+
+
+def set_provider(
+    provider: EnvProvider, cache_dir: Optional[pathlib.Path] = None
+) -> BuildEnv:
+    global BUILD_ENV
+    with BUILD_ENV_LOCK:
+        BUILD_ENV = BuildEnv(provider, cache_dir)
+        return BUILD_ENV
+
+
+def get_env(overlay: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    return get_build_env().get(overlay)
@@ -0,0 +1,232 @@
+from typing import Optional, Dict, List, Tuple
+import json
+import time
+import logging
+import pathlib
+import threading
+import contextlib
+import subprocess
+from colorama import Fore
+from . import runenv
+
+LOGGER = logging.getLogger(__name__)
+
+# toprefix.toml
+# compiler_cache = "ccache" # or "sccache"
+#
+# LOCAL_SRC/.compiler_cache/{ccache,sccache} : cache
+# LOCAL_SRC/.compiler_cache/stats.json : hit rate of the last build of each package
+
+TOOLS = ("ccache", "sccache")
+
+
+def parse_ccache_stats(output: str) -> Tuple[int, int]:
+    # ccache >= 4: `ccache --print-stats`. key<TAB>value
+    values: Dict[str, int] = {}
+    for line in output.splitlines():
+        key, _, value = line.partition("\t")
+        if value.strip().isdigit():
+            values[key] = int(value)
+    hits = values.get("direct_cache_hit", 0) + values.get("preprocessed_cache_hit", 0)
+    return hits, values.get("cache_miss", 0)
+
+
+def count(counts: dict) -> int:
+    return sum(counts.get("counts", {}).values())
+
+
+def parse_sccache_stats(output: str) -> Tuple[int, int]:
+    # `sccache --show-stats --stats-format=json`
+    stats = json.loads(output)["stats"]
+    return count(stats.get("cache_hits", {})), count(stats.get("cache_misses", {}))
+
+
+class Measuring:
+    def __init__(self) -> None:
+        # another build ran at the same time
+        self.overlapped = False
+
+
+# the stats of ccache and sccache are global. builds measured now
+MEASURING: List[Measuring] = []
+MEASURING_LOCK = threading.Lock()
+
+
+class CompilerCache:
+    def __init__(self, tool: str, path: pathlib.Path, dir: pathlib.Path) -> None:
+        self.tool = tool
+        self.path = path
+        self.dir = dir
+
+    def __str__(self) -> str:
+        return self.tool
+
+    def env(self) -> Dict[str, str]:
+        match self.tool:
+            case "ccache":
+                return {
+                    "CCACHE_DIR": str(self.dir),
+                    # hit across source dirs
+                    "CCACHE_BASEDIR": str(runenv.LOCAL_SRC),
+                }
+            case "sccache":
+                return {"SCCACHE_DIR": str(self.dir)}
+        return {}
+
+    def cmake_args(self) -> str:
+        return " ".join(
+            f"-DCMAKE_{lang}_COMPILER_LAUNCHER={self.path.as_posix()}"
+            for lang in ("C", "CXX")
+        )
+
+    def compiler_env(self) -> Dict[str, str]:
+        # meson, configure and make take CC with a launcher
+        cc, cxx = ("cl", "cl") if runenv.IS_WINDOWS else ("cc", "c++")
+        return {
+            "CC": f"{self.path.as_posix()} {cc}",
+            "CXX": f"{self.path.as_posix()} {cxx}",
+        }
+
+    def stats(self) -> Optional[Tuple[int, int]]:
+        # (hits, misses)
+        match self.tool:
+            case "ccache":
+                cmd = [str(self.path), "--print-stats"]
+                parse = parse_ccache_stats
+            case _:
+                cmd = [str(self.path), "--show-stats", "--stats-format=json"]
+                parse = parse_sccache_stats
+        env = runenv.minimum_env()
+        env.update(self.env())
+        try:
+            p = subprocess.run(cmd, env=env, capture_output=True, text=True, timeout=60)
+            if p.returncode != 0:
+                LOGGER.debug(f"{self.tool}: {p.stderr.strip()}")
+                return None
+            return parse(p.stdout)
+        except (OSError, subprocess.SubprocessError, ValueError, KeyError) as e:
+            LOGGER.debug(f"{self.tool}: {e}")
+            return None
+
+    @contextlib.contextmanager
+    def measure(self, name: str):
+        measuring = Measuring()
+        with MEASURING_LOCK:
+            for x in MEASURING:
+                x.overlapped = True
+            measuring.overlapped = bool(MEASURING)
+            MEASURING.append(measuring)
+        try:
+            before = self.stats()
+            with runenv.setenv(**self.env()):
+                yield
+        finally:
+            with MEASURING_LOCK:
+                MEASURING.remove(measuring)
+        if measuring.overlapped:
+            # the counters include the hits of the other builds
+            LOGGER.info(f"{name}: {self.tool} hit rate is not recorded. parallel build")
+            return
+        after = self.stats()
+        if before and after:
+            hits = after[0] - before[0]
+            misses = after[1] - before[1]
+            record(name, self.tool, hits, misses)
+            print_rate(name, self.tool, hits, misses)
+
+
+def print_rate(name: str, tool: str, hits: int, misses: int):
+    total = hits + misses
+    if not total:
+        print(f"  {name}: {tool} no compilation")
+        return
+    rate = hits / total
+    color = Fore.GREEN if rate >= 0.5 else Fore.YELLOW
+    print(f"  {name}: {tool} {hits}/{total} hits ({color}{rate:.0%}{Fore.RESET})")
+
+
+STATS_LOCK = threading.Lock()
+
+
+def get_stats_path() -> pathlib.Path:
+    return runenv.LOCAL_SRC / ".compiler_cache" / "stats.json"
+
+
+def load_stats() -> Dict[str, dict]:
+    try:
+        return json.loads(get_stats_path().read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def record(name: str, tool: str, hits: int, misses: int):
+    with STATS_LOCK:
+        stats = load_stats()
+        stats[name] = {
+            "tool": tool,
+            "hits": hits,
+            "misses": misses,
+            "time": time.time(),
+        }
+        path = get_stats_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(stats, indent=2), encoding="utf-8")
+        tmp.replace(path)
+
+
+CACHE: Optional[CompilerCache] = None
+LOADED = False
+
+
+def load() -> Optional[CompilerCache]:
+    tool = runenv.get_config().get("compiler_cache")
+    if not tool:
+        return None
+    if tool not in TOOLS:
+        raise Exception(f"compiler_cache: {tool} is not one of {TOOLS}")
+    path = runenv.which(tool)
+    if not path:
+        LOGGER.warning(f"compiler_cache: {tool} not found")
+        return None
+    return CompilerCache(tool, path, runenv.LOCAL_SRC / ".compiler_cache" / tool)
+
+
+def get_cache() -> Optional[CompilerCache]:
+    global CACHE, LOADED
+    if not LOADED:
+        CACHE = load()
+        LOADED = True
+    return CACHE
+
+
+def set_cache(cache: Optional[CompilerCache]):
+    global CACHE, LOADED
+    CACHE = cache
+    LOADED = True
+
+
+def get_tool() -> str:
+    # configure input. switching the cache reconfigures
+    cache = get_cache()
+    return cache.tool if cache else ""
+
+
+def cmake_args() -> str:
+    cache = get_cache()
+    return f" {cache.cmake_args()}" if cache else ""
+
+
+def compiler_env() -> Dict[str, str]:
+    cache = get_cache()
+    return cache.compiler_env() if cache else {}
+
+
+@contextlib.contextmanager
+def measure(name: str):
+    cache = get_cache()
+    if not cache:
+        yield
+        return
+    with cache.measure(name):
+        yield
@@ -0,0 +1,270 @@
+from typing import List, Optional, BinaryIO
+import os
+import sys
+import json
+import socket
+import logging
+import pathlib
+import contextlib
+
+# toprefix serve. keeps the package index and the parsed recipes warm.
+# the toprefix entry point forwards read-only commands over a unix socket and
+# runs them in-process when no daemon is running.
+#
+# client => daemon
+#   {"argv", "cwd", "version"}
+#   <= {"stdout": text} or {"stderr": text} ... {"exit": code}
+#   <= {"fallback": reason}. run in-process
+#
+# the forwarded commands are __main__.FORWARD.
+# this module is imported by the client. keep the imports light.
+# runenv, package and the commands are imported by the daemon only.
+
+LOGGER = logging.getLogger(__name__)
+
+SOCKET_NAME = ".serve.sock"
+
+# stdout of a command is sent in chunks of this size
+CHUNK_SIZE = 64 * 1024
+
+
+def get_socket_path() -> pathlib.Path:
+    # runenv.LOCAL_SRC / SOCKET_NAME without importing runenv
+    path = os.environ.get("TOPREFIX_SOCKET")
+    if path:
+        return pathlib.Path(path)
+    home = os.environ["USERPROFILE"] if os.name == "nt" else os.environ["HOME"]
+    return pathlib.Path(home) / "local/src" / SOCKET_NAME
+
+
+def is_forwarded(argv: List[str]) -> bool:
+    from .__main__ import FORWARD, get_command
+
+    return get_command(argv) in FORWARD
+
+
+def send_json(f: BinaryIO, data: dict):
+    f.write(json.dumps(data).encode("utf-8") + b"\n")
+    f.flush()
+
+
+def forward(argv: List[str], path: Optional[pathlib.Path] = None) -> Optional[int]:
+    # exit code of the command. None if no daemon answered
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    path = path or get_socket_path()
+    if not path.exists():
+        return None
+    from . import _version
+
+    try:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(str(path))
+    except OSError:
+        # stale socket
+        sock.close()
+        return None
+    with sock, sock.makefile("rwb") as f:
+        send_json(
+            f,  # type: ignore
+            {"argv": argv, "cwd": os.getcwd(), "version": _version.version},
+        )
+        for line in f:
+            message = json.loads(line)
+            match message:
+                case {"stdout": text}:
+                    sys.stdout.write(text)
+                    sys.stdout.flush()
+                case {"stderr": text}:
+                    sys.stderr.write(text)
+                    sys.stderr.flush()
+                case {"exit": code}:
+                    return code
+                case {"fallback": _}:
+                    return None
+    # the daemon died. the output may be partial
+    return 1
+
+
+def is_running(path: pathlib.Path) -> bool:
+    if not path.exists():
+        return False
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(path))
+        except OSError:
+            return False
+    return True
+
+
+class Output:
+    # sys.stdout / sys.stderr of a forwarded command
+    def __init__(self, f: BinaryIO, key: str) -> None:
+        self.f = f
+        self.key = key
+        self.buffer: List[str] = []
+        self.size = 0
+
+    def write(self, text: str) -> int:
+        self.buffer.append(text)
+        self.size += len(text)
+        if self.size >= CHUNK_SIZE:
+            self.flush()
+        return len(text)
+
+    def flush(self):
+        if self.buffer:
+            send_json(self.f, {self.key: "".join(self.buffer)})
+            self.buffer.clear()
+            self.size = 0
+
+    def isatty(self) -> bool:
+        return False
+
+
+class LogHandler(logging.StreamHandler):
+    # logs of a forwarded command. Output is flushed when the command ends
+    def __init__(self, output: Output) -> None:
+        super().__init__(output)  # type: ignore
+        self.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+
+    def flush(self):
+        pass
+
+
+class Daemon:
+    def __init__(self, path: Optional[pathlib.Path] = None) -> None:
+        import socketserver
+
+        self.path = path or get_socket_path()
+        if is_running(self.path):
+            raise Exception(f"{self.path}: toprefix serve is running")
+        self.path.unlink(missing_ok=True)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                daemon.handle(self.rfile, self.wfile)  # type: ignore
+
+        # one command at a time. sys.stdout and the cwd are per process
+        self.server = socketserver.UnixStreamServer(str(self.path), Handler)
+        self.config_mtime = self.get_config_mtime()
+
+    def get_config_mtime(self) -> int:
+        from . import runenv
+
+        try:
+            return runenv.CONFIG_TOML.stat().st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def warm(self):
+        from . import package
+
+        package.init_pkgs()
+        for _ in package.iter_pkgs():
+            pass
+
+    def refresh(self):
+        # state changed by other toprefix processes
+        from . import runenv
+        from . import manifest
+
+        config_mtime = self.get_config_mtime()
+        if config_mtime != self.config_mtime:
+            self.config_mtime = config_mtime
+            runenv.CONFIG = None  # type: ignore
+            runenv.PREFIX = None  # type: ignore
+        # owners.json is written by install and uninstall
+        manifest.DBS.clear()
+        # package.init_pkgs keeps the index while the recipes are unchanged
+
+    def serve_forever(self):
+        self.warm()
+        try:
+            self.server.serve_forever()
+        finally:
+            self.close()
+
+    def close(self):
+        self.server.server_close()
+        self.path.unlink(missing_ok=True)
+
+    def __enter__(self) -> "Daemon":
+        import threading
+
+        self.warm()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.close()
+
+    @contextlib.contextmanager
+    def verbosity(self, verbosity: int, stderr: Output):
+        # -q / -v of the client. the logs of the command are sent to the client
+        from . import runner
+
+        root = logging.getLogger()
+        saved = runner.VERBOSITY, root.level
+        handler = LogHandler(stderr)
+        runner.set_verbosity(verbosity)
+        root.addHandler(handler)
+        try:
+            yield
+        finally:
+            root.removeHandler(handler)
+            runner.VERBOSITY = saved[0]
+            root.setLevel(saved[1])
+
+    def handle(self, r: BinaryIO, w: BinaryIO):
+        import traceback
+        from . import _version
+        from . import __main__
+
+        try:
+            request = json.loads(r.readline())
+        except json.JSONDecodeError:
+            return
+        if request.get("version") != _version.version:
+            send_json(w, {"fallback": f"version {_version.version}"})
+            return
+        argv = request["argv"]
+        if not is_forwarded(argv):
+            send_json(w, {"fallback": f"{' '.join(argv)} is not forwarded"})
+            return
+        if not os.path.isdir(request["cwd"]):
+            send_json(w, {"fallback": f"{request['cwd']} not found"})
+            return
+
+        LOGGER.info(f"serve: {' '.join(argv)}")
+        self.refresh()
+        stdout = Output(w, "stdout")
+        stderr = Output(w, "stderr")
+        cwd = os.getcwd()
+        code = 0
+        try:
+            os.chdir(request["cwd"])
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(
+                stderr
+            ):
+                try:
+                    parser = __main__.make_parser()
+                    args = parser.parse_args(argv)
+                    with self.verbosity(__main__.get_verbosity(args), stderr):
+                        __main__.dispatch(parser, args)
+                except SystemExit as e:
+                    code = e.code if isinstance(e.code, int) else 1
+                except Exception:
+                    traceback.print_exc()
+                    code = 1
+            stdout.flush()
+            stderr.flush()
+            send_json(w, {"exit": code})
+        except OSError:
+            # the client went away
+            pass
+        finally:
+            os.chdir(cwd)
@@ -0,0 +1,90 @@
+from typing import List, Dict, NamedTuple, Iterable
+import time
+import logging
+import concurrent.futures
+from colorama import Fore
+from .package import Pkg
+from .source import download, GitRepository
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_JOBS = 8
+
+
+class FetchResult(NamedTuple):
+    name: str
+    host: str
+    size: int
+    start: float
+    end: float
+    error: str = ""
+    # cloned, updated or up to date. git sources have no size
+    git: str = ""
+
+
+def fetch_one(pkg: Pkg) -> FetchResult:
+    source = pkg.source
+    host = download.get_host(getattr(source, "url", ""))
+    start = time.perf_counter()
+    before = source.fingerprint() if isinstance(source, GitRepository) else ""
+    try:
+        size = source.fetch()
+    except Exception as e:
+        LOGGER.error(f"{source.name}: {e}")
+        return FetchResult(source.name, host, 0, start, time.perf_counter(), str(e))
+    git = ""
+    if isinstance(source, GitRepository):
+        after = source.fingerprint()
+        if not before:
+            git = "cloned"
+        elif after != before:
+            git = "updated"
+        else:
+            git = "up to date"
+    return FetchResult(source.name, host, size, start, time.perf_counter(), git=git)
+
+
+def fetch_pkgs(pkgs: Iterable[Pkg], *, jobs: int = DEFAULT_JOBS) -> List[FetchResult]:
+    pkgs = list(pkgs)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        return list(executor.map(fetch_one, pkgs))
+
+
+def print_report(results: List[FetchResult], elapsed: float):
+    hosts: Dict[str, List[FetchResult]] = {}
+    for result in results:
+        if result.size:
+            hosts.setdefault(result.host, []).append(result)
+
+    print()
+    print("fetch:")
+    for host, items in sorted(hosts.items()):
+        size = sum(x.size for x in items)
+        # wall time while this host had a transfer in flight
+        span = max(x.end for x in items) - min(x.start for x in items)
+        rate = size / span if span > 0 else 0
+        print(
+            f"  {host}: {len(items)} files, {size / 1024 / 1024:.1f} MB, {span:.1f} s, {Fore.CYAN}{rate / 1024 / 1024:.2f} MB/s{Fore.RESET}"
+        )
+
+    cached = sum(1 for x in results if not x.size and not x.error and not x.git)
+    errors = [x for x in results if x.error]
+    total = sum(x.size for x in results)
+    print(f"  cached: {cached}")
+    for git in ("cloned", "updated", "up to date"):
+        count = sum(1 for x in results if x.git == git)
+        if count:
+            print(f"  git {git}: {count}")
+    for x in errors:
+        print(f"  {x.name}: {Fore.RED}{x.error}{Fore.RESET}")
+    print(
+        f"  total: {total / 1024 / 1024:.1f} MB in {elapsed:.1f} s ({len(results)} packages)"
+    )
+    print()
+
+
+def fetch(pkgs: Iterable[Pkg], *, jobs: int = DEFAULT_JOBS) -> bool:
+    start = time.perf_counter()
+    results = fetch_pkgs(pkgs, jobs=jobs)
+    print_report(results, time.perf_counter() - start)
+    return not any(x.error for x in results)
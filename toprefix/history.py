@@ -0,0 +1,221 @@
+from typing import Optional, List, Dict, Any, Tuple, NamedTuple
+import json
+import time
+import logging
+import pathlib
+import threading
+import statistics
+import contextlib
+from . import runenv
+
+LOGGER = logging.getLogger(__name__)
+
+# LOCAL_SRC/.history.jsonl : one line per package build
+#
+# phases: download, extract, patch, configure, compile, install, restore, remote
+# stamp stage => phase
+STAGE_PHASES = {"build": "compile"}
+
+# regression: latest > baseline * RATIO and slower by MIN_SECONDS
+RATIO = 1.5
+MIN_SECONDS = 5.0
+
+HISTORY_LOCK = threading.Lock()
+CURRENT = threading.local()
+
+
+def get_history_path() -> pathlib.Path:
+    return runenv.LOCAL_SRC / ".history.jsonl"
+
+
+class Run:
+    def __init__(self, name: str, version: str, args: Dict[str, Any], jobs: int):
+        self.name = name
+        self.version = version
+        self.args = args
+        self.jobs = jobs
+        self.phases: Dict[str, float] = {}
+        # download runs in a thread of the stream extract
+        self.lock = threading.Lock()
+
+    def add(self, phase: str, seconds: float):
+        with self.lock:
+            self.phases[phase] = self.phases.get(phase, 0) + seconds
+
+
+def current() -> Optional[Run]:
+    return getattr(CURRENT, "run", None)
+
+
+@contextlib.contextmanager
+def attach(run: Optional[Run]):
+    # record phases of another thread into run
+    last = current()
+    CURRENT.run = run
+    try:
+        yield
+    finally:
+        CURRENT.run = last
+
+
+@contextlib.contextmanager
+def phase(name: str):
+    run = current()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if run:
+            run.add(STAGE_PHASES.get(name, name), time.perf_counter() - start)
+
+
+def get_version(source) -> str:
+    return getattr(source, "version", None) or getattr(source, "ref", None) or ""
+
+
+@contextlib.contextmanager
+def record(name: str, version: str, *, args: Dict[str, Any], jobs: int):
+    run = Run(name, version, args, jobs)
+    status = "failed"
+    start = time.perf_counter()
+    try:
+        with attach(run):
+            yield run
+        status = "ok"
+    finally:
+        append(
+            {
+                "time": time.time(),
+                "name": run.name,
+                "version": run.version,
+                "args": run.args,
+                "jobs": run.jobs,
+                "status": status,
+                "total": time.perf_counter() - start,
+                "phases": run.phases,
+            }
+        )
+
+
+def append(entry: dict, path: Optional[pathlib.Path] = None):
+    path = path or get_history_path()
+    with HISTORY_LOCK:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+
+def load(path: Optional[pathlib.Path] = None) -> List[dict]:
+    path = path or get_history_path()
+    runs = []
+    try:
+        with path.open(encoding="utf-8") as f:
+            for line in f:
+                try:
+                    runs.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # interrupted append
+                    LOGGER.warning(f"broken: {path}: {line[:40]}")
+    except FileNotFoundError:
+        pass
+    return runs
+
+
+def latest(runs: List[dict]) -> Dict[str, dict]:
+    result: Dict[str, dict] = {}
+    for run in runs:
+        result[run["name"]] = run
+    return result
+
+
+def slowest_packages(runs: List[dict], limit: int) -> List[dict]:
+    return sorted(latest(runs).values(), key=lambda x: x["total"], reverse=True)[
+        :limit
+    ]
+
+
+def slowest_phases(runs: List[dict], limit: int) -> List[Tuple[str, str, float]]:
+    # (name, phase, seconds) of the latest runs
+    items = [
+        (run["name"], phase, seconds)
+        for run in latest(runs).values()
+        for phase, seconds in run["phases"].items()
+    ]
+    return sorted(items, key=lambda x: x[2], reverse=True)[:limit]
+
+
+class Regression(NamedTuple):
+    name: str
+    phase: str
+    seconds: float
+    baseline: float
+    jobs_changed: bool
+
+
+def regressions(
+    runs: List[dict], *, ratio: float = RATIO, min_seconds: float = MIN_SECONDS
+) -> List[Regression]:
+    # latest run of each package against the median of its earlier ok runs
+    found = []
+    for name, last in latest(runs).items():
+        earlier = [
+            run
+            for run in runs
+            if run["name"] == name and run is not last and run["status"] == "ok"
+        ]
+        for phase, seconds in last["phases"].items():
+            # the phase was skipped by the stamp in some runs
+            history = [run for run in earlier if phase in run["phases"]]
+            if not history:
+                continue
+            baseline = statistics.median(run["phases"][phase] for run in history)
+            if seconds > baseline * ratio and seconds - baseline > min_seconds:
+                found.append(
+                    Regression(
+                        name,
+                        phase,
+                        seconds,
+                        baseline,
+                        any(run["jobs"] != last["jobs"] for run in history),
+                    )
+                )
+    return sorted(found, key=lambda x: x.seconds - x.baseline, reverse=True)
+
+
+def print_stats(names: List[str], *, limit: int):
+    from colorama import Fore
+
+    runs = load()
+    if names:
+        runs = [run for run in runs if run["name"] in names]
+    if not runs:
+        print("no history")
+        return
+
+    print()
+    print("slowest packages:")
+    for run in slowest_packages(runs, limit):
+        status = "" if run["status"] == "ok" else f" {Fore.RED}{run['status']}{Fore.RESET}"
+        phases = ", ".join(
+            f"{phase} {seconds:.1f}" for phase, seconds in run["phases"].items()
+        )
+        print(
+            f"  {run['name']}-{run['version']}: {Fore.CYAN}{run['total']:.1f} s{Fore.RESET}{status} ({phases})"
+        )
+
+    print()
+    print("slowest phases:")
+    for name, phase, seconds in slowest_phases(runs, limit):
+        print(f"  {name} {phase}: {Fore.CYAN}{seconds:.1f} s{Fore.RESET}")
+
+    print()
+    print("regressions:")
+    found = regressions(runs)
+    for x in found:
+        jobs = " (jobs changed)" if x.jobs_changed else ""
+        print(
+            f"  {x.name} {x.phase}: {Fore.RED}{x.seconds:.1f} s{Fore.RESET} (was {x.baseline:.1f} s){jobs}"
+        )
+    if not found:
+        print(f"  {Fore.GREEN}none{Fore.RESET}")
+    print()
@@ -0,0 +1,184 @@
+from typing import Optional, Dict, Tuple
+import os
+import re
+import time
+import shutil
+import logging
+import pathlib
+import tempfile
+import threading
+import contextlib
+from . import runenv
+
+LOGGER = logging.getLogger(__name__)
+
+# GNU make jobserver shared by all packages in a build.
+# the pool holds `jobs` tokens. each package build takes one before it starts
+# (the implicit token of the child make/ninja) and its children take the rest.
+#
+# fifo: make >= 4.4, ninja >= 1.13. --jobserver-auth=fifo:PATH
+# pipe: older make. --jobserver-auth=R,W and the fds are inherited
+
+LOAD_POLL = 1.0
+
+
+def parse_version(version: str) -> Tuple[int, ...]:
+    m = re.search(r"(\d+)\.(\d+)", version)
+    if not m:
+        return ()
+    return (int(m.group(1)), int(m.group(2)))
+
+
+def default_style() -> Optional[str]:
+    if runenv.IS_WINDOWS:
+        # make on windows uses a named semaphore. not supported
+        return None
+    make = runenv.tool_version("make")
+    if make and parse_version(make) < (4, 4):
+        return "pipe"
+    return "fifo"
+
+
+def get_load() -> float:
+    try:
+        return os.getloadavg()[0]
+    except (OSError, AttributeError):
+        return 0.0
+
+
+class JobServer:
+    def __init__(
+        self,
+        jobs: int,
+        *,
+        load: Optional[float] = None,
+        slots: int = 1,
+        style: Optional[str] = "",
+    ) -> None:
+        self.jobs = max(1, jobs)
+        self.load = load
+        # fallback -j for tools without jobserver support
+        self.share = max(1, self.jobs // max(1, slots))
+        self.style = default_style() if style == "" else style
+        self.clients = 0
+        self.lock = threading.Lock()
+        self.tmp: Optional[pathlib.Path] = None
+        self.fifo: Optional[pathlib.Path] = None
+        match self.style:
+            case "fifo":
+                self.tmp = pathlib.Path(tempfile.mkdtemp(prefix="toprefix-jobserver."))
+                self.fifo = self.tmp / "fifo"
+                os.mkfifo(self.fifo, 0o600)
+                # O_RDWR never blocks on open and keeps the fifo alive
+                self.read_fd = os.open(self.fifo, os.O_RDWR)
+                self.write_fd = self.read_fd
+            case "pipe":
+                self.read_fd, self.write_fd = os.pipe()
+                os.set_inheritable(self.read_fd, True)
+                os.set_inheritable(self.write_fd, True)
+            case _:
+                self.read_fd, self.write_fd = os.pipe()
+        os.write(self.write_fd, b"+" * self.jobs)
+        LOGGER.info(f"jobserver: {self.style}: -j{self.jobs} load={self.load}")
+
+    def close(self):
+        os.close(self.read_fd)
+        if self.write_fd != self.read_fd:
+            os.close(self.write_fd)
+        if self.tmp:
+            shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def auth(self) -> str:
+        match self.style:
+            case "fifo":
+                return f"fifo:{self.fifo}"
+            case "pipe":
+                return f"{self.read_fd},{self.write_fd}"
+        return ""
+
+    def env(self) -> Dict[str, str]:
+        auth = self.auth()
+        flags = f"-j{self.jobs}"
+        if self.load:
+            flags += f" -l{self.load}"
+        if auth:
+            flags += f" --jobserver-auth={auth}"
+        return {"MAKEFLAGS": f" {flags}"}
+
+    def pass_fds(self) -> Tuple[int, ...]:
+        if self.style == "pipe":
+            return (self.read_fd, self.write_fd)
+        return ()
+
+    def limits(self) -> Tuple[Optional[int], Optional[float]]:
+        # -j and -l for ninja, meson and cmake. (None, None) if they read MAKEFLAGS
+        if self.style == "fifo" and ninja_has_jobserver():
+            return None, None
+        return self.share, self.load
+
+    def wait_load(self):
+        if not self.load:
+            return
+        while True:
+            with self.lock:
+                # never starve. one package always runs
+                if self.clients == 0 or get_load() < self.load:
+                    return
+            time.sleep(LOAD_POLL)
+
+    @contextlib.contextmanager
+    def client(self):
+        self.wait_load()
+        token = os.read(self.read_fd, 1)
+        with self.lock:
+            self.clients += 1
+        try:
+            with runenv.setenv(**self.env()):
+                yield
+        finally:
+            with self.lock:
+                self.clients -= 1
+            os.write(self.write_fd, token)
+
+
+def ninja_has_jobserver() -> bool:
+    return parse_version(runenv.tool_version("ninja")) >= (1, 13)
+
+
+JOBSERVER: Optional[JobServer] = None
+
+
+def start(jobs: int, *, load: Optional[float] = None, slots: int = 1) -> JobServer:
+    global JOBSERVER
+    JOBSERVER = JobServer(jobs, load=load, slots=slots)
+    return JOBSERVER
+
+
+def stop():
+    global JOBSERVER
+    if JOBSERVER:
+        JOBSERVER.close()
+        JOBSERVER = None
+
+
+def pass_fds() -> Tuple[int, ...]:
+    return JOBSERVER.pass_fds() if JOBSERVER else ()
+
+
+def parallel_args(*, load: bool = True) -> str:
+    # `-j N -l L` for meson compile / ninja. cmake --build has no -l
+    if not JOBSERVER:
+        return ""
+    jobs, limit = JOBSERVER.limits()
+    args = ""
+    if jobs:
+        args += f" -j {jobs}"
+    if load and limit:
+        args += f" -l {limit}"
+    return args
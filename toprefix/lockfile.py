@@ -0,0 +1,159 @@
+from typing import Dict, Iterable, List, Optional
+import os
+import json
+import logging
+import pathlib
+import concurrent.futures
+from colorama import Fore
+from . import runenv
+from . import stamp
+from .package import Pkg
+from .source import Archive, GitRepository
+from .source import store
+
+LOGGER = logging.getLogger(__name__)
+
+# toprefix lock. resolved sources of the recipes
+#
+# {
+#   "version": 1,
+#   "packages": {
+#     "glib": {"recipe", "url", "size", "sha256"},
+#     "neovim": {"recipe", "url", "ref", "commit"},
+#   }
+# }
+#
+# recipe: fingerprint of the source table. the entry is stale when it changes
+#
+# install --locked uses the lockfile. archives are looked up in the store by sha256
+# and git commits in the mirrors, so there is no request when they are there.
+# install --offline also fails instead of downloading.
+# lock --update fetches git refs and moving archives (github head) again.
+#
+# toprefix.toml
+# lockfile = "~/dotfiles/toprefix.lock" # default: next to toprefix.toml
+
+LOCK_VERSION = 1
+LOCK_NAME = "toprefix.lock"
+DEFAULT_JOBS = 8
+
+
+def get_path() -> pathlib.Path:
+    path = runenv.get_config().get("lockfile")
+    if path:
+        return pathlib.Path(path).expanduser()
+    return runenv.CONFIG_TOML.with_name(LOCK_NAME)
+
+
+def recipe_key(pkg: Pkg) -> str:
+    return stamp.fingerprint(pkg.recipe.get("source", {}))
+
+
+def resolve(pkg: Pkg, *, update: bool = False) -> dict:
+    # downloads or fetches what is not local yet.
+    # update: download a moving archive without sha256 again
+    source = pkg.source
+    match source:
+        case Archive():
+            if update and source.moving and not source.sha256:
+                store.forget(source.url)
+            path, _ = store.fetch(source.url, sha256=source.sha256, desc=source.name)
+            return {
+                "recipe": recipe_key(pkg),
+                "url": source.url,
+                "size": path.stat().st_size,
+                "sha256": path.name,
+            }
+        case GitRepository():
+            source.fetch()
+            commit = source.fingerprint()
+            if not commit:
+                raise Exception(f"{source.name}: no commit")
+            return {
+                "recipe": recipe_key(pkg),
+                "url": source.url,
+                "ref": source.ref,
+                "commit": commit,
+            }
+    raise NotImplementedError(source)
+
+
+def load(path: Optional[pathlib.Path] = None) -> Dict[str, dict]:
+    path = path or get_path()
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        raise Exception(f"{path} not found. run toprefix lock")
+    if data.get("version") != LOCK_VERSION:
+        raise Exception(f"{path}: version {data.get('version')}. run toprefix lock")
+    return data["packages"]
+
+
+def save(packages: Dict[str, dict], path: Optional[pathlib.Path] = None):
+    path = path or get_path()
+    data = {
+        "version": LOCK_VERSION,
+        "packages": {name: packages[name] for name in sorted(packages)},
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    # reviewed and committed with the dotfiles
+    tmp.write_text(json.dumps(data, indent=2) + "\n", encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def lock(
+    pkgs: Iterable[Pkg],
+    *,
+    jobs: int = DEFAULT_JOBS,
+    path: Optional[pathlib.Path] = None,
+    update: bool = False,
+) -> bool:
+    # entries of other packages are kept
+    pkgs = list(pkgs)
+    try:
+        packages = load(path)
+    except Exception:
+        packages = {}
+
+    def resolve_one(pkg: Pkg) -> Optional[dict]:
+        try:
+            return resolve(pkg, update=update)
+        except Exception as e:
+            LOGGER.error(f"{pkg.source.name}: {e}")
+            return None
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        results = list(executor.map(resolve_one, pkgs))
+
+    errors: List[str] = []
+    for pkg, entry in zip(pkgs, results):
+        name = pkg.source.name
+        if entry is None:
+            errors.append(name)
+            continue
+        if packages.get(name) != entry:
+            pin = entry.get("commit") or entry["sha256"]
+            print(f"{name}: {Fore.CYAN}{pin[:12]}{Fore.RESET}")
+        packages[name] = entry
+    save(packages, path)
+    for name in errors:
+        print(f"{name} {Fore.RED}not locked{Fore.RESET}")
+    return not errors
+
+
+def apply(pkgs: Iterable[Pkg], packages: Dict[str, dict]):
+    # pin the sources. raises on a missing or stale entry
+    for pkg in pkgs:
+        source = pkg.source
+        entry = packages.get(source.name)
+        if not entry:
+            raise Exception(f"{source.name}: not in the lockfile. run toprefix lock")
+        if entry["recipe"] != recipe_key(pkg):
+            raise Exception(f"{source.name}: recipe changed. run toprefix lock")
+        match source:
+            case Archive():
+                source.url = entry["url"]
+                source.sha256 = entry["sha256"]
+            case GitRepository():
+                source.commit = entry["commit"]
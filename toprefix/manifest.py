@@ -0,0 +1,257 @@
+from typing import Dict, Optional, List, NamedTuple
+import os
+import json
+import shutil
+import logging
+import pathlib
+import threading
+from . import runenv
+from .source import store
+
+LOGGER = logging.getLogger(__name__)
+
+# PREFIX/.toprefix/manifests/{name}.json : files installed by the package
+# PREFIX/.toprefix/owners.json : path => package
+#
+# paths are relative to the filesystem root, same as the artifact members.
+# directories are listed in the manifest but not owned. packages share them
+
+MANIFEST_VERSION = 1
+
+# concurrent installs update owners.json
+LOCK = threading.Lock()
+
+
+def get_db_dir() -> pathlib.Path:
+    return runenv.get_prefix() / ".toprefix"
+
+
+def write_json(path: pathlib.Path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(data, indent=1, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def scan(stage: pathlib.Path) -> Dict[str, dict]:
+    # relative path => entry
+    entries: Dict[str, dict] = {}
+    for dirpath, dirnames, filenames in os.walk(stage):
+        dir = pathlib.Path(dirpath)
+        for name in dirnames + filenames:
+            path = dir / name
+            rel = path.relative_to(stage).as_posix()
+            if path.is_symlink():
+                entries[rel] = {"type": "link", "target": os.readlink(path)}
+            elif path.is_dir():
+                entries[rel] = {"type": "dir"}
+            else:
+                entries[rel] = {"type": "file", "sha256": store.hash_file(path)}
+    return entries
+
+
+def stat_key(path: pathlib.Path) -> Optional[List[int]]:
+    try:
+        st = path.lstat()
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def is_same(dst: pathlib.Path, old: Optional[dict], new: dict) -> bool:
+    # the installed file is the old entry and has the new content
+    if not old or old["type"] != new["type"]:
+        return False
+    match new["type"]:
+        case "file":
+            return old["sha256"] == new["sha256"] and stat_key(dst) == old.get("stat")
+        case "link":
+            return dst.is_symlink() and os.readlink(dst) == new["target"]
+    return dst.is_dir()
+
+
+def remove(path: pathlib.Path):
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path)
+    elif path.exists() or path.is_symlink():
+        path.unlink()
+
+
+def copy_atomic(src: pathlib.Path, dst: pathlib.Path):
+    tmp = dst.with_name(f".{dst.name}.{os.getpid()}.tmp")
+    shutil.copy2(src, tmp)
+    if dst.is_dir() and not dst.is_symlink():
+        shutil.rmtree(dst)
+    os.replace(tmp, dst)
+
+
+class InstallResult(NamedTuple):
+    copied: int
+    skipped: int
+    removed: int
+
+
+class Db:
+    def __init__(self, dir: Optional[pathlib.Path] = None) -> None:
+        self.dir = dir or get_db_dir()
+        prefix = runenv.get_prefix()
+        self.root = pathlib.Path(prefix.anchor)
+        # PREFIX and its parents are not part of a package
+        self.prefix_dirs = {
+            path.relative_to(self.root).as_posix()
+            for path in [prefix, *prefix.parents]
+            if path != self.root
+        }
+        self.owners: Dict[str, str] = {}
+        try:
+            self.owners = json.loads(
+                (self.dir / "owners.json").read_text(encoding="utf-8")
+            )
+        except (OSError, json.JSONDecodeError):
+            pass
+
+    def manifest_path(self, name: str) -> pathlib.Path:
+        return self.dir / "manifests" / f"{name}.json"
+
+    def load(self, name: str) -> Optional[dict]:
+        try:
+            return json.loads(self.manifest_path(name).read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def installed(self) -> List[str]:
+        return sorted(path.stem for path in (self.dir / "manifests").glob("*.json"))
+
+    def rel(self, path: pathlib.Path) -> str:
+        return pathlib.Path(os.path.abspath(path)).relative_to(self.root).as_posix()
+
+    def owner(self, path: pathlib.Path) -> Optional[str]:
+        return self.owners.get(self.rel(path))
+
+    def save_owners(self):
+        write_json(self.dir / "owners.json", self.owners)
+
+    def remove_entries(self, name: str, files: Dict[str, dict]) -> int:
+        # deepest first. directories only when empty
+        count = 0
+        for rel in sorted(files, reverse=True):
+            path = self.root / rel
+            if files[rel]["type"] == "dir":
+                try:
+                    path.rmdir()
+                except OSError:
+                    pass
+                continue
+            if self.owners.get(rel) != name:
+                # overwritten by another package
+                continue
+            remove(path)
+            del self.owners[rel]
+            count += 1
+        return count
+
+    def is_installed(self, name: str, key: str) -> bool:
+        # the artifact of key is installed and no file was changed or removed
+        manifest = self.load(name)
+        if not manifest or not key or manifest.get("artifact") != key:
+            return False
+        return all(
+            is_same(self.root / rel, entry, entry)
+            for rel, entry in manifest["files"].items()
+        )
+
+    def install(
+        self, name: str, version: str, stage: pathlib.Path, *, key: str = ""
+    ) -> InstallResult:
+        # stage => root. unchanged files are kept
+        # key: artifact key of the stage. empty if not from the artifact cache
+        files = {k: v for k, v in scan(stage).items() if k not in self.prefix_dirs}
+        old = (self.load(name) or {}).get("files", {})
+        copied = 0
+        skipped = 0
+        # parent directory first
+        for rel in sorted(files):
+            entry = files[rel]
+            dst = self.root / rel
+            if is_same(dst, old.get(rel), entry):
+                match entry["type"]:
+                    case "file":
+                        entry["stat"] = old[rel]["stat"]
+                        skipped += 1
+                    case "link":
+                        skipped += 1
+                continue
+            owner = self.owners.get(rel)
+            if owner and owner != name:
+                LOGGER.warning(f"{rel}: overwrite {owner} => {name}")
+            match entry["type"]:
+                case "dir":
+                    if dst.is_symlink() or dst.is_file():
+                        dst.unlink()
+                    dst.mkdir(parents=True, exist_ok=True)
+                case "link":
+                    remove(dst)
+                    dst.symlink_to(entry["target"])
+                    copied += 1
+                case _:
+                    copy_atomic(stage / rel, dst)
+                    entry["stat"] = stat_key(dst)
+                    copied += 1
+
+        with LOCK:
+            removed = self.remove_entries(
+                name, {k: v for k, v in old.items() if k not in files}
+            )
+            for rel, entry in files.items():
+                if entry["type"] != "dir":
+                    self.owners[rel] = name
+            write_json(
+                self.manifest_path(name),
+                {
+                    "version": MANIFEST_VERSION,
+                    "name": name,
+                    "package_version": version,
+                    "artifact": key,
+                    "files": files,
+                },
+            )
+            self.save_owners()
+        LOGGER.info(f"{name}: {copied} copied, {skipped} unchanged, {removed} removed")
+        return InstallResult(copied, skipped, removed)
+
+    def uninstall(self, name: str) -> int:
+        manifest = self.load(name)
+        if manifest is None:
+            raise KeyError(name)
+        with LOCK:
+            count = self.remove_entries(name, manifest["files"])
+            self.manifest_path(name).unlink()
+            self.save_owners()
+        LOGGER.info(f"{name}: {count} removed")
+        return count
+
+
+DBS: Dict[pathlib.Path, Db] = {}
+
+
+def get_db() -> Db:
+    # one per prefix. owners are shared by concurrent installs
+    dir = get_db_dir()
+    with LOCK:
+        db = DBS.get(dir)
+        if not db:
+            db = Db(dir)
+            DBS[dir] = db
+        return db
+
+
+def print_owners(paths: List[str]):
+    from colorama import Fore
+
+    db = get_db()
+    for path in paths:
+        owner = db.owner(pathlib.Path(path))
+        if owner:
+            print(f"{path}: {Fore.GREEN}{owner}{Fore.RESET}")
+        else:
+            print(f"{path}: {Fore.RED}not owned{Fore.RESET}")
@@ -0,0 +1,279 @@
+from typing import Dict, List, Optional, Tuple, NamedTuple, Iterable
+import os
+import re
+import json
+import time
+import logging
+import pathlib
+import urllib.parse
+import concurrent.futures
+from colorama import Fore
+from . import runenv
+from .source import download
+from .source import store
+from .source import name_version
+from .source.formats import find_format
+
+LOGGER = logging.getLogger(__name__)
+
+# upstream release feeds of the recipes
+#
+# LOCAL_SRC/.feeds/{sha256 of url}.json : body with ETag / Last-Modified.
+# repeated checks are conditional requests and mostly 304
+
+DEFAULT_JOBS = 8
+FEED_TIMEOUT = 30
+
+GNOME_CACHE_URL = "https://download.gnome.org/sources/{name}/cache.json"
+GITHUB_TAGS_URL = "https://api.github.com/repos/{user}/{name}/tags?per_page=100"
+CODEBERG_TAGS_URL = "https://codeberg.org/api/v1/repos/{user}/{name}/tags?limit=50"
+SOURCEHUT_REFS_URL = "https://git.sr.ht/~{user}/{name}/refs/rss.xml"
+GITLAB_TAGS_URL = "https://{host}/api/v4/projects/{project}/repository/tags?per_page=100"
+
+GNOME_URL_PATTERN = re.compile(r"^https://download\.gnome\.org/sources/([^/]+)/")
+GITHUB_RELEASE_PATTERN = re.compile(
+    r"^https://github\.com/([^/]+)/([^/]+)/releases/download/([^/]+)/"
+)
+GITLAB_ARCHIVE_PATTERN = re.compile(r"^https://([^/]+)/(.+?)/-/archive/([^/]+)/")
+HREF_PATTERN = re.compile(r'href="([^"?#/]+)"')
+# prefix and trailing version. some-v1.2.3, libdrm-2.4.114, v3_1_3
+VERSION_PATTERN = re.compile(r"^(.*?)(\d+(?:[._]\d+)*)$")
+# the prefix of a pre-release. 1.0-rc1 => ("1.0-rc", "1")
+PRERELEASE_PATTERN = re.compile(
+    r"\d[._-]?(?:alpha|beta|rc|pre|dev|a|b)[._-]?$", re.IGNORECASE
+)
+
+
+class Feed(NamedTuple):
+    # gnome, github, codeberg, gitlab, sourcehut, index
+    kind: str
+    url: str
+    # tag, version or archive stem in the same form as the feed entries
+    current: str
+
+
+class CheckResult(NamedTuple):
+    name: str
+    current: str
+    latest: str = ""
+    # 304
+    cached: bool = False
+    error: str = ""
+
+
+def split_version(tag: str) -> Optional[Tuple[str, Tuple[int, ...]]]:
+    # "v1.2.3" => ("", (1, 2, 3)). "libxml2-2.11.4" => ("libxml2-", (2, 11, 4))
+    # pre-releases like 1.0-rc1 are None
+    m = VERSION_PATTERN.match(tag)
+    if not m:
+        return None
+    prefix, version = m.groups()
+    if PRERELEASE_PATTERN.search(prefix):
+        return None
+    prefix = prefix.lower().removesuffix("v")
+    return prefix, tuple(int(x) for x in re.split(r"[._]", version))
+
+
+def latest_version(current: str, candidates: Iterable[str]) -> str:
+    # newest candidate in the same series (prefix) as current
+    parsed = split_version(current)
+    if not parsed:
+        return ""
+    prefix, _ = parsed
+    found: List[Tuple[Tuple[int, ...], str]] = []
+    for candidate in candidates:
+        x = split_version(candidate)
+        if x and x[0] == prefix:
+            found.append((x[1], candidate))
+    return max(found)[1] if found else ""
+
+
+def is_outdated(current: str, latest: str) -> bool:
+    a = split_version(current)
+    b = split_version(latest)
+    return bool(a and b and b[1] > a[1])
+
+
+def url_feed(name: str, url: str) -> Feed:
+    basename = os.path.basename(url)
+    stem, _ = find_format(basename)
+    m = GNOME_URL_PATTERN.match(url)
+    if m:
+        parsed = name_version.get_name_version(stem)
+        return Feed(
+            "gnome",
+            GNOME_CACHE_URL.format(name=m.group(1)),
+            parsed[1] if parsed else stem,
+        )
+    m = GITHUB_RELEASE_PATTERN.match(url)
+    if m:
+        return Feed(
+            "github", GITHUB_TAGS_URL.format(user=m.group(1), name=m.group(2)), m.group(3)
+        )
+    m = GITLAB_ARCHIVE_PATTERN.match(url)
+    if m:
+        return Feed(
+            "gitlab",
+            GITLAB_TAGS_URL.format(
+                host=m.group(1), project=urllib.parse.quote(m.group(2), safe="")
+            ),
+            m.group(3),
+        )
+    # directory listing next to the archive
+    return Feed("index", url[0 : -len(basename)], stem)
+
+
+def get_feed(name: str, source: dict) -> Optional[Feed]:
+    # None: git refs and branch heads have no release feed
+    match source:
+        case {"gnome": {"version": version}}:
+            return Feed("gnome", GNOME_CACHE_URL.format(name=name), version)
+        case {"github": {"user": user, "tag": tag}}:
+            return Feed("github", GITHUB_TAGS_URL.format(user=user, name=name), tag)
+        case {"codeberg": {"user": user, "tag": tag}}:
+            return Feed(
+                "codeberg", CODEBERG_TAGS_URL.format(user=user, name=name), tag
+            )
+        case {"sourcehut": {"user": user, "tag": tag}}:
+            return Feed(
+                "sourcehut", SOURCEHUT_REFS_URL.format(user=user, name=name), tag
+            )
+        case {"url": url}:
+            return url_feed(name, url)
+    return None
+
+
+def get_cache_path(url: str) -> pathlib.Path:
+    return runenv.LOCAL_SRC / ".feeds" / f"{store.url_key(url)}.json"
+
+
+def fetch_feed(url: str) -> Tuple[str, bool]:
+    # (body, not modified)
+    path = get_cache_path(url)
+    try:
+        cached = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        cached = None
+
+    headers = {}
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+    token = os.environ.get("GITHUB_TOKEN")
+    if token and url.startswith("https://api.github.com/"):
+        headers["Authorization"] = f"Bearer {token}"
+
+    response = download.get_session(url).get(
+        url, headers=headers, timeout=FEED_TIMEOUT
+    )
+    if response.status_code == 304 and cached:
+        return cached["body"], True
+    response.raise_for_status()
+
+    body = response.text
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(
+        json.dumps(
+            {
+                "url": url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "body": body,
+            }
+        ),
+        encoding="utf-8",
+    )
+    os.replace(tmp, path)
+    return body, False
+
+
+def parse_index(body: str) -> List[str]:
+    # archive stems of a directory listing
+    stems = []
+    for href in HREF_PATTERN.findall(body):
+        try:
+            stem, _ = find_format(urllib.parse.unquote(href))
+        except NotImplementedError:
+            continue
+        stems.append(stem)
+    return stems
+
+
+def parse_feed(kind: str, body: str) -> List[str]:
+    match kind:
+        case "gnome":
+            # [version, {name: {version: files}}, {name: [versions]}, ...]
+            data = json.loads(body)
+            return [version for versions in data[2].values() for version in versions]
+        case "github" | "codeberg" | "gitlab":
+            return [tag["name"] for tag in json.loads(body)]
+        case "sourcehut":
+            import xml.etree.ElementTree as ET
+
+            return [item.text or "" for item in ET.fromstring(body).iter("title")]
+        case "index":
+            return parse_index(body)
+    raise NotImplementedError(kind)
+
+
+def check_one(name: str, source: dict) -> Optional[CheckResult]:
+    try:
+        feed = get_feed(name, source)
+        if not feed:
+            return None
+        body, cached = fetch_feed(feed.url)
+        latest = latest_version(feed.current, parse_feed(feed.kind, body))
+    except Exception as e:
+        LOGGER.debug(f"{name}: {e}")
+        return CheckResult(name, "", error=str(e) or e.__class__.__name__)
+    return CheckResult(name, feed.current, latest, cached)
+
+
+def check(
+    items: Iterable[Tuple[str, dict]], *, jobs: int = DEFAULT_JOBS
+) -> List[CheckResult]:
+    # (name, recipe source)
+    items = list(items)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        results = executor.map(lambda x: check_one(*x), items)
+        return [x for x in results if x]
+
+
+def print_table(results: List[CheckResult], elapsed: float, *, all: bool = False):
+    rows = []
+    for x in sorted(results, key=lambda x: x.name):
+        if x.error:
+            rows.append((x.name, x.current, f"{Fore.RED}{x.error}{Fore.RESET}"))
+        elif is_outdated(x.current, x.latest):
+            rows.append((x.name, x.current, f"{Fore.YELLOW}{x.latest}{Fore.RESET}"))
+        elif all:
+            latest = x.latest or "?"
+            rows.append((x.name, x.current, f"{Fore.GREEN}{latest}{Fore.RESET}"))
+
+    print()
+    if rows:
+        name_width = max(len("name"), *(len(row[0]) for row in rows))
+        current_width = max(len("current"), *(len(row[1]) for row in rows))
+        print(f"{'name':<{name_width}}  {'current':<{current_width}}  latest")
+        for name, current, latest in rows:
+            print(f"{name:<{name_width}}  {current:<{current_width}}  {latest}")
+        print()
+
+    outdated = sum(1 for x in results if is_outdated(x.current, x.latest))
+    errors = sum(1 for x in results if x.error)
+    cached = sum(1 for x in results if x.cached)
+    print(
+        f"{len(results)} checked, {outdated} outdated, {errors} errors, {cached} not modified in {elapsed:.1f} s"
+    )
+
+
+def outdated(
+    items: Iterable[Tuple[str, dict]], *, jobs: int = DEFAULT_JOBS, all: bool = False
+) -> List[CheckResult]:
+    start = time.perf_counter()
+    results = check(items, jobs=jobs)
+    print_table(results, time.perf_counter() - start, all=all)
+    return results
@@ -1,7 +1,7 @@
-from typing import List, Iterable, Optional
+from typing import Dict, Iterable, Optional
 import pathlib
-import toml
 from ..source import get_source, Source
+from .. import runenv
 from .pkg import Pkg
 from .meson_pkg import MesonPkg
 from .cmake_pkg import CMakePkg
@@ -9,9 +9,12 @@ from .make_pkg import MakePkg
 from .autotools_pkg import AutoToolsPkg
 from .prebuilt_pkg import PrebuiltPkg
 from .custom_pkg import CustomPkg
+from .index import PkgIndex
 
 HERE = pathlib.Path(__file__).absolute().parent
-PKGS: List[Pkg] = []
+INDEX: Optional[PkgIndex] = None
+# constructed on demand
+PKG_MAP: Dict[str, Pkg] = {}
 
 
 def make_pkg(pkg: str, source: Source) -> Pkg:
@@ -41,30 +44,62 @@ def iter_patch(dir: pathlib.Path, parsed) -> Iterable[pathlib.Path]:
                 yield dir / v
 
 
+def load_pkg(name: str, item: dict, dir: Optional[pathlib.Path] = None) -> Pkg:
+    source = get_source(name, item)
+
+    # patch.{key} = "file" relative to the recipe toml
+    if dir:
+        source.patches = list(iter_patch(dir, item))
+    pkg = make_pkg(item["pkg"], source)
+    pkg.deps = item.get("deps", [])
+    pkg.recipe = item
+    return pkg
+
+
 def generate_pkgs(parsed):
     for k, v in parsed.items():
-        source = get_source(k, v)
+        yield load_pkg(k, v)
+
 
-        # for patch in iter_patch(f.parent, v):
-        #     source.patches.append(patch)
-        yield make_pkg(v["pkg"], source)
+def init_pkgs(root: Optional[pathlib.Path] = None):
+    global INDEX
+    root = root or HERE.parent / "assets"
+    cache = runenv.LOCAL_SRC / ".index.json"
+    # toprefix serve keeps the index and PKG_MAP while the recipes are unchanged
+    if (
+        INDEX
+        and INDEX.root == root
+        and INDEX.cache == cache
+        and INDEX.is_valid(INDEX.stats)
+    ):
+        return
+    INDEX = PkgIndex(root, cache)
+    INDEX.load()
+    PKG_MAP.clear()
 
 
-def init_pkgs():
-    for f in HERE.parent.glob("assets/**/*.toml"):
-        if f.is_file and f.suffix == ".toml":
-            data = f.read_text(encoding="utf-8")
-            parsed = toml.loads(data)
-            for pkg in generate_pkgs(parsed):
-                PKGS.append(pkg)
+def iter_pkgs() -> Iterable[Pkg]:
+    assert INDEX
+    for name in INDEX.names:
+        pkg = get_pkg(name)
+        assert pkg
+        yield pkg
 
 
 def list_pkgs():
-    for pkg in PKGS:
+    for pkg in iter_pkgs():
         print(pkg)
 
 
 def get_pkg(name: str) -> Optional[Pkg]:
-    for pkg in PKGS:
-        if pkg.source.name == name:
-            return pkg
+    pkg = PKG_MAP.get(name)
+    if pkg:
+        return pkg
+    assert INDEX
+    item = INDEX.get_recipe(name)
+    if item is None:
+        return None
+    f = INDEX.get_file(name)
+    pkg = load_pkg(name, item, f.parent if f else None)
+    PKG_MAP[name] = pkg
+    return pkg
@@ -3,6 +3,8 @@ from ..source import Source
 import pathlib
 import logging
 from .. import runenv
+from .. import stamp
+from .. import compiler_cache
 
 
 LOGGER = logging.getLogger(__name__)
@@ -18,42 +20,46 @@ class AutoToolsPkg(pkg.Pkg):
     def configure(
         self,
         source_dir: pathlib.Path,
-        prefix: pathlib.Path,
         *,
         clean: bool,
         reconfigure: bool,
     ):
-        LOGGER.info(f"configure: {source_dir} => {prefix}")
-        with util.pushd(source_dir):
+        LOGGER.info(f"configure: {source_dir} => {runenv.PREFIX}")
+        with runenv.pushd(source_dir):
             if clean and (source_dir / "Makefile").exists():
-                pkg.run(
-                    f"make distclean",
-                    env=pkg.make_env(prefix),
-                )
-
-            pkg.run(
-                f"./configure --prefix={prefix}",
-                env=pkg.make_env(prefix),
-            )
-
-    def build(self, source_dir: pathlib.Path, prefix: pathlib.Path):
-        LOGGER.info(f"build: {source_dir} => {prefix}")
-        with util.pushd(source_dir):
-            pkg.run(f"make", env=pkg.make_env(prefix))
-
-    def install(self, source_dir: pathlib.Path, prefix: pathlib.Path):
-        LOGGER.info(f"install: {source_dir} => {prefix}")
-        with util.pushd(source_dir):
-            pkg.run(f"make install", env=pkg.make_env(prefix))
+                runenv.run(f"make distclean")
+
+            with runenv.setenv(**compiler_cache.compiler_env()):
+                runenv.run(f"./configure --prefix={runenv.PREFIX}")
+
+    def build(self, source_dir: pathlib.Path):
+        LOGGER.info(f"build: {source_dir} => {runenv.PREFIX}")
+        with runenv.pushd(source_dir):
+            runenv.run(f"make")
+
+    def install(self, source_dir: pathlib.Path):
+        LOGGER.info(f"install: {source_dir} => {runenv.PREFIX}")
+        with runenv.pushd(source_dir):
+            runenv.run(f"make install")
 
     def process(self, *, clean: bool, reconfigure: bool):
         LOGGER.info(f"install: {self}")
-        extract = self.source.extract(src)
+        extract = self.source.extract()
         assert extract
 
-        # patch
-
-        # build
-        self.configure(extract, prefix, clean=clean, reconfigure=reconfigure)
-        self.build(extract, prefix)
-        self.install(extract, prefix)
+        stamps = stamp.Stamps(extract)
+        if clean:
+            stamps.clear()
+        inputs = stamp.source_inputs(self.source)
+        inputs.update(stamp.toolchain("make", "cc", "c++"))
+        inputs["compiler_cache"] = compiler_cache.get_tool()
+        configured = stamps.run(
+            "configure",
+            inputs,
+            lambda: self.configure(extract, clean=clean, reconfigure=reconfigure),
+            force=reconfigure or not (extract / "Makefile").exists(),
+        )
+        built = stamps.run(
+            "build", {"configure": configured}, lambda: self.build(extract)
+        )
+        stamps.run("install", {"build": built}, lambda: self.install(extract))
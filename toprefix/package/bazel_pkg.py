@@ -2,7 +2,6 @@ from . import pkg
 from ..source import Source
 import pathlib
 import logging
-from ..envman import EnvMan
 
 
 LOGGER = logging.getLogger(__name__)
@@ -12,6 +11,6 @@ class BazelPkg(pkg.Pkg):
     def __init__(self, source: Source) -> None:
         self.source = source
 
-    def process(self, *, env: EnvMan, clean: bool, reconfigure: bool):
+    def process(self, *, clean: bool, reconfigure: bool):
         pass
 
@@ -1,10 +1,13 @@
 from typing import Optional
 import pathlib
-import shutil
 import logging
 from . import pkg
 from ..source import Source
 from .. import runenv
+from .. import stamp
+from .. import builddir
+from .. import jobserver
+from .. import compiler_cache
 
 LOGGER = logging.getLogger(__name__)
 
@@ -23,38 +26,49 @@ class CMakePkg(pkg.Pkg):
     def configure(
         self,
         source_dir: pathlib.Path,
-        *,
-        clean: bool,
-        reconfigure: bool,
+        build_dir: pathlib.Path,
     ):
         LOGGER.info(f"configure: {source_dir} => {runenv.PREFIX}")
         with runenv.pushd(source_dir):
-            if clean:
-                if (source_dir / "build").exists():
-                    shutil.rmtree(source_dir / "build")
-
             runenv.run(
-                f"cmake -S {self.cmake_source} -B build -G Ninja -DCMAKE_INSTALL_PREFIX={runenv.PREFIX} -DCMAKE_BUILD_TYPE=Release {self.args}"
+                f"cmake -S {self.cmake_source} -B {build_dir} -G Ninja -DCMAKE_INSTALL_PREFIX={runenv.PREFIX} -DCMAKE_BUILD_TYPE={builddir.cmake_build_type()}{compiler_cache.cmake_args()} {self.args}"
             )
 
-    def build(self, source_dir: pathlib.Path):
+    def build(self, source_dir: pathlib.Path, build_dir: pathlib.Path):
         LOGGER.info(f"build: {source_dir} => {runenv.PREFIX}")
         with runenv.pushd(source_dir):
-            runenv.run(f"cmake --build build")
+            runenv.run(
+                f"cmake --build {build_dir}{jobserver.parallel_args(load=False)}"
+            )
 
-    def install(self, source_dir: pathlib.Path):
+    def install(self, source_dir: pathlib.Path, build_dir: pathlib.Path):
         LOGGER.info(f"install: {source_dir} => {runenv.PREFIX}")
         with runenv.pushd(source_dir):
-            runenv.run(f"cmake --install build")
+            runenv.run(f"cmake --install {build_dir}")
 
     def process(self, *, clean: bool, reconfigure: bool):
         LOGGER.info(f"install: {self}")
         extract = self.source.extract()
         assert extract
+        build_dir = builddir.prepare(extract, clean=clean)
 
-        # patch
-
-        # build
-        self.configure(extract, clean=clean, reconfigure=reconfigure)
-        self.build(extract)
-        self.install(extract)
+        stamps = stamp.Stamps(build_dir)
+        if clean:
+            stamps.clear()
+        inputs = stamp.source_inputs(self.source)
+        inputs["args"] = self.args
+        inputs["cmake_source"] = self.cmake_source
+        inputs["compiler_cache"] = compiler_cache.get_tool()
+        inputs.update(stamp.toolchain("cmake", "ninja", "cc", "c++"))
+        configured = stamps.run(
+            "configure",
+            inputs,
+            lambda: self.configure(extract, build_dir),
+            force=reconfigure or not (build_dir / "CMakeCache.txt").exists(),
+        )
+        built = stamps.run(
+            "build", {"configure": configured}, lambda: self.build(extract, build_dir)
+        )
+        stamps.run(
+            "install", {"build": built}, lambda: self.install(extract, build_dir)
+        )
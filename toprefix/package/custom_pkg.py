@@ -1,8 +1,10 @@
 from . import pkg
 from typing import List
+import pathlib
 from ..source import Source
 import logging
 from .. import runenv
+from .. import stamp
 
 
 LOGGER = logging.getLogger(__name__)
@@ -13,10 +15,23 @@ class CustomPkg(pkg.Pkg):
         self.source = source
         self.commands = commands
 
+    def __str__(self) -> str:
+        return f"custom: {self.source}"
+
     def process(self, *, clean: bool, reconfigure: bool):
         extract = self.source.extract()
         assert extract
 
+        stamps = stamp.Stamps(extract)
+        if clean:
+            stamps.clear()
+        inputs = stamp.source_inputs(self.source)
+        inputs["commands"] = self.commands
+        stamps.run(
+            "install", inputs, lambda: self.run_commands(extract), force=reconfigure
+        )
+
+    def run_commands(self, extract: pathlib.Path):
         LOGGER.info(f"custom: {extract} => {runenv.PREFIX}")
         with runenv.pushd(extract):
             for command in self.commands:
@@ -0,0 +1,111 @@
+from typing import Dict, List, Optional
+import os
+import json
+import logging
+import pathlib
+
+LOGGER = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+
+
+def stat_key(path: pathlib.Path) -> List[int]:
+    st = path.stat()
+    return [st.st_mtime_ns, st.st_size]
+
+
+class PkgIndex:
+    # package name => recipe toml. persisted and invalidated by mtime
+    def __init__(self, root: pathlib.Path, cache: pathlib.Path) -> None:
+        self.root = root
+        self.cache = cache
+        # glob order
+        self.names: List[str] = []
+        self.files: Dict[str, pathlib.Path] = {}
+        self.stats: Dict[str, List[int]] = {}
+        self.parsed: Dict[pathlib.Path, dict] = {}
+
+    def load(self):
+        if self.load_cache():
+            return
+        LOGGER.debug(f"index: rebuild {self.root}")
+        self.rebuild()
+        self.save_cache()
+
+    def is_valid(self, stats: Dict[str, List[int]]) -> bool:
+        for path, key in stats.items():
+            try:
+                if stat_key(pathlib.Path(path)) != key:
+                    return False
+            except FileNotFoundError:
+                return False
+        return True
+
+    def load_cache(self) -> bool:
+        try:
+            data = json.loads(self.cache.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return False
+        if data.get("version") != INDEX_VERSION or data.get("root") != str(self.root):
+            return False
+        # dirs detect added or removed toml
+        if not self.is_valid(data["stats"]):
+            return False
+        self.stats = data["stats"]
+        self.names = data["names"]
+        self.files = {k: pathlib.Path(v) for k, v in data["files"].items()}
+        return True
+
+    def save_cache(self):
+        data = {
+            "version": INDEX_VERSION,
+            "root": str(self.root),
+            "stats": self.stats,
+            "names": self.names,
+            "files": {k: str(v) for k, v in self.files.items()},
+        }
+        try:
+            self.cache.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.cache.with_name(f"{self.cache.name}.{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(data), encoding="utf-8")
+            os.replace(tmp, self.cache)
+        except OSError as e:
+            LOGGER.warning(f"index: {e}")
+
+    def rebuild(self):
+        self.names.clear()
+        self.files.clear()
+        self.stats = {str(self.root): stat_key(self.root)}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames.sort()
+            dir = pathlib.Path(dirpath)
+            self.stats[str(dir)] = stat_key(dir)
+            for filename in sorted(filenames):
+                f = dir / filename
+                if f.suffix != ".toml":
+                    continue
+                self.stats[str(f)] = stat_key(f)
+                for name in self.parse(f):
+                    if name in self.files:
+                        LOGGER.warning(f"{name}: duplicated in {f}")
+                        continue
+                    self.names.append(name)
+                    self.files[name] = f
+
+    def parse(self, f: pathlib.Path) -> dict:
+        parsed = self.parsed.get(f)
+        if parsed is None:
+            import toml
+
+            parsed = toml.loads(f.read_text(encoding="utf-8"))
+            self.parsed[f] = parsed
+        return parsed
+
+    def get_file(self, name: str) -> Optional[pathlib.Path]:
+        return self.files.get(name)
+
+    def get_recipe(self, name: str) -> Optional[dict]:
+        f = self.files.get(name)
+        if not f:
+            return None
+        return self.parse(f).get(name)
@@ -4,6 +4,8 @@ import logging
 from . import pkg
 from ..source import Source
 from .. import runenv
+from .. import stamp
+from .. import compiler_cache
 
 LOGGER = logging.getLogger(__name__)
 
@@ -16,27 +18,31 @@ class MakePkg(pkg.Pkg):
     def __str__(self) -> str:
         return f"make: {self.source}"
 
-    def process(
-        self, *, clean: bool, reconfigure: bool
-    ):
+    def process(self, *, clean: bool, reconfigure: bool):
         LOGGER.info(f"install: {self}")
-        extract = self.source.extract(src)
+        extract = self.source.extract()
         assert extract
 
-        # patch
+        stamps = stamp.Stamps(extract)
+        if clean:
+            stamps.clear()
+        inputs = stamp.source_inputs(self.source)
+        inputs["args"] = self.args
+        inputs.update(stamp.toolchain("make", "cc", "c++"))
+        inputs["compiler_cache"] = compiler_cache.get_tool()
 
         # build
         # self.configure(extract, prefix, clean=clean, reconfigure=reconfigure)
-        self.build(extract, prefix)
-        self.install(extract, prefix)
+        built = stamps.run("build", inputs, lambda: self.build(extract))
+        stamps.run("install", {"build": built}, lambda: self.install(extract))
 
-    def build(self, source_dir: pathlib.Path, prefix: pathlib.Path):
+    def build(self, source_dir: pathlib.Path):
         pass
-        # LOGGER.info(f"build: {source_dir} => {prefix}")
-        # with util.pushd(source_dir):
-        #     pkg.run(f"make {self.args}", env=pkg.make_env(prefix))
-
-    def install(self, source_dir: pathlib.Path, prefix: pathlib.Path):
-        LOGGER.info(f"install: {source_dir} => {prefix}")
-        with util.pushd(source_dir):
-            pkg.run(f"make {self.args}", env=pkg.make_env(prefix))
+        # LOGGER.info(f"build: {source_dir} => {runenv.PREFIX}")
+        # with runenv.pushd(source_dir):
+        #     runenv.run(f"make {self.args}")
+
+    def install(self, source_dir: pathlib.Path):
+        LOGGER.info(f"install: {source_dir} => {runenv.PREFIX}")
+        with runenv.pushd(source_dir), runenv.setenv(**compiler_cache.compiler_env()):
+            runenv.run(f"make {self.args}")
@@ -1,63 +1,88 @@
 import pathlib
 import logging
-import shutil
 from .pkg import Pkg
 from ..source import Source
 from .. import runenv
+from .. import stamp
+from .. import builddir
+from .. import jobserver
+from .. import compiler_cache
 
 LOGGER = logging.getLogger(__name__)
 
 
+def get_meson() -> pathlib.Path:
+    meson = runenv.which("meson")
+    if not meson:
+        raise Exception("meson not found")
+    return meson
+
+
+def is_configured(build_dir: pathlib.Path) -> bool:
+    return (build_dir / "meson-private").exists()
+
+
 class MesonPkg(Pkg):
     def __init__(self, source: Source, *, args: str = ""):
-        meson = runenv.which("meson")
-        if not meson:
-            raise Exception("meson not found")
-        self.meson = meson
         self.source = source
         self.args = args
 
+    @property
+    def meson(self) -> pathlib.Path:
+        return get_meson()
+
     def __str__(self) -> str:
         return f"meson: {self.source}"
 
     def configure(
         self,
         source_dir: pathlib.Path,
+        build_dir: pathlib.Path,
         *,
-        clean: bool,
         reconfigure: bool,
     ):
         LOGGER.info(f"configure: {source_dir} => {runenv.PREFIX}")
-        with runenv.pushd(source_dir):
-            if not (source_dir / "build").exists():
-                runenv.run(f"{self.meson} setup build --prefix {runenv.PREFIX}")
-            else:
-                if clean:
-                    shutil.rmtree(source_dir / "build")
-                    runenv.run(
-                        f"{self.meson} setup build --prefix {runenv.PREFIX} {self.args}"
-                    )
-                elif reconfigure:
-                    runenv.run(
-                        f"{self.meson} setup build --prefix {runenv.PREFIX} {self.args} --reconfigure"
-                    )
-
-    def build(self, source_dir: pathlib.Path):
+        with runenv.pushd(source_dir), runenv.setenv(**compiler_cache.compiler_env()):
+            cmd = f"{self.meson} setup {build_dir} --prefix {runenv.PREFIX}{builddir.meson_args()} {self.args}"
+            if is_configured(build_dir):
+                # called only when inputs changed or reconfigure
+                cmd += " --reconfigure"
+            runenv.run(cmd)
+
+    def build(self, source_dir: pathlib.Path, build_dir: pathlib.Path):
         LOGGER.info(f"build: {source_dir} => {runenv.PREFIX}")
         with runenv.pushd(source_dir):
-            runenv.run(f"{self.meson} compile -C build")
+            runenv.run(
+                f"{self.meson} compile -C {build_dir}{jobserver.parallel_args()}"
+            )
 
-    def install(self, source_dir: pathlib.Path):
+    def install(self, source_dir: pathlib.Path, build_dir: pathlib.Path):
         LOGGER.info(f"install: {source_dir} => {runenv.PREFIX}")
         with runenv.pushd(source_dir):
-            runenv.run(f"{self.meson} install -C build")
+            runenv.run(f"{self.meson} install -C {build_dir}")
 
     def process(self, *, clean: bool, reconfigure: bool):
         LOGGER.info(f"install: {self}")
         extract = self.source.extract()
         assert extract
+        build_dir = builddir.prepare(extract, clean=clean)
 
-        # build
-        self.configure(extract, clean=clean, reconfigure=reconfigure)
-        self.build(extract)
-        self.install(extract)
+        stamps = stamp.Stamps(build_dir)
+        if clean:
+            stamps.clear()
+        inputs = stamp.source_inputs(self.source)
+        inputs["args"] = self.args
+        inputs["compiler_cache"] = compiler_cache.get_tool()
+        inputs.update(stamp.toolchain("meson", "ninja", "cc", "c++"))
+        configured = stamps.run(
+            "configure",
+            inputs,
+            lambda: self.configure(extract, build_dir, reconfigure=reconfigure),
+            force=reconfigure or not is_configured(build_dir),
+        )
+        built = stamps.run(
+            "build", {"configure": configured}, lambda: self.build(extract, build_dir)
+        )
+        stamps.run(
+            "install", {"build": built}, lambda: self.install(extract, build_dir)
+        )
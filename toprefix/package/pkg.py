@@ -1,4 +1,4 @@
-from typing import Protocol
+from typing import Protocol, List
 import logging
 from ..source import Source
 
@@ -7,6 +7,10 @@ LOGGER = logging.getLogger(__name__)
 
 class Pkg(Protocol):
     source: Source
+    # package names to install before this
+    deps: List[str] = []
+    # the recipe table in toml
+    recipe: dict = {}
 
     def process(self, *, clean: bool, reconfigure: bool):
         ...
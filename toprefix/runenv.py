@@ -1,9 +1,8 @@
-from typing import Optional, List
+from typing import Optional, List, Dict
 import pathlib, os, platform, sys
-import toml
 import logging
 import contextlib
-import subprocess
+import threading
 from colorama import Fore
 from . import vcenv
 
@@ -12,20 +11,82 @@ IS_WINDOWS = platform.system() == "Windows"
 LOGGER = logging.getLogger(__name__)
 
 HOME = pathlib.Path(os.environ["USERPROFILE"] if IS_WINDOWS else os.environ["HOME"])
-PREFIX = HOME / "prefix"
 LOCAL_BIN = HOME / "local/bin"
 LOCAL_SRC = HOME / "local/src"
 EXE = ".exe" if IS_WINDOWS else ""
 
 CONFIG_TOML = HOME / ".config/toprefix/toprefix.toml"
-if CONFIG_TOML.exists():
-    config = toml.load(CONFIG_TOML)
-    prefix = config.get("prefix")
-    if prefix:
-        PREFIX = pathlib.Path(prefix)
 
 PATH_LIST = os.environ["PATH"].split(os.pathsep)
 
+# pushd and setenv are per thread. packages are built concurrently
+CWD = threading.local()
+ENV = threading.local()
+
+
+def load_config() -> dict:
+    if not CONFIG_TOML.exists():
+        return {}
+    import toml
+
+    return toml.load(CONFIG_TOML)
+
+
+def get_config() -> dict:
+    config = globals().get("CONFIG")
+    if config is None:
+        config = load_config()
+        globals()["CONFIG"] = config
+    return config
+
+
+def get_prefix() -> pathlib.Path:
+    prefix = globals().get("PREFIX")
+    if prefix is None:
+        prefix = get_config().get("prefix")
+        prefix = pathlib.Path(prefix) if prefix else HOME / "prefix"
+        globals()["PREFIX"] = prefix
+    return prefix
+
+
+def __getattr__(name: str):
+    # toprefix.toml is read on first access to runenv.PREFIX or runenv.CONFIG
+    match name:
+        case "PREFIX":
+            return get_prefix()
+        case "CONFIG":
+            return get_config()
+    raise AttributeError(name)
+
+
+# passed through to the build commands
+WINDOWS_ENV_KEYS = (
+    "SystemRoot",
+    "APPDATA",
+    "LOCALAPPDATA",
+    "ComSpec",
+    "OS",
+    "NUMBER_OF_PROCESSORS",
+    "PROCESSOR_ARCHITECTURE",
+    "PROCESSOR_IDENTIFIER",
+    "PROCESSOR_LEVEL",
+    "PROCESSOR_REVISION",
+    "POWERSHELL_DISTRIBUTION_CHANNEL",
+    "PSModulePath",
+    "TEMP",
+    "TMP",
+    "USERNAME",
+    "USERPROFILE",
+)
+POSIX_ENV_KEYS = (
+    "HOME",
+    "LANG",
+    "USER",
+    "SHELL",
+    # "HOSTTYPE",
+)
+ENV_KEYS = WINDOWS_ENV_KEYS if IS_WINDOWS else POSIX_ENV_KEYS
+
 
 def minimum_env():
     git = which("git")
@@ -38,38 +99,14 @@ def minimum_env():
     if IS_WINDOWS:
         path.append(os.environ["SystemRoot"] + "\\System32")
         path.append(os.environ["SystemRoot"] + "\\System32\\WindowsPowerShell\\v1.0")
-        for k in (
-            "SystemRoot",
-            "APPDATA",
-            "LOCALAPPDATA",
-            "ComSpec",
-            "OS",
-            "NUMBER_OF_PROCESSORS",
-            "PROCESSOR_ARCHITECTURE",
-            "PROCESSOR_IDENTIFIER",
-            "PROCESSOR_LEVEL",
-            "PROCESSOR_REVISION",
-            "POWERSHELL_DISTRIBUTION_CHANNEL",
-            "PSModulePath",
-            "TEMP",
-            "TMP",
-            "USERNAME",
-            "USERPROFILE",
-        ):
-            env[k] = os.environ[k]
         env["PATH"] = ";".join(path)
     else:
         path.append("/bin")
         path.append("/usr/bin")
         path.append("/sbin")
         env["PATH"] = ":".join(path)
-        for k in (
-            "HOME",
-            "LANG",
-            "USER",
-            "SHELL",
-            # "HOSTTYPE",
-        ):
+    for k in ENV_KEYS:
+        if k in os.environ:
             env[k] = os.environ[k]
 
     return env
@@ -92,10 +129,16 @@ def unexpand(src: pathlib.Path) -> str:
 
 
 def which(cmd: str) -> Optional[pathlib.Path]:
-    for path in PATH_LIST:
-        fullpath = pathlib.Path(path) / f"{cmd}{EXE}"
-        if fullpath.exists():
-            return fullpath
+    from . import toolchain
+
+    return toolchain.which(cmd)
+
+
+def tool_version(cmd: str) -> str:
+    # first line of `cmd --version`. cached in LOCAL_SRC/.toolchain.json
+    from . import toolchain
+
+    return toolchain.version(cmd)
 
 
 def print_cmd(*cmds: str):
@@ -115,7 +158,7 @@ def has_env(key: str, path: pathlib.Path) -> bool:
 
 
 def check_prefix_env_path(key: str, value: str, *, indent: str = "        "):
-    has = has_env(key, PREFIX / value)
+    has = has_env(key, get_prefix() / value)
     if has:
         print(
             f"{indent}ENV{{{key}}} has {{PREFIX}}/{value}: {Fore.GREEN}True{Fore.RESET}"
@@ -126,13 +169,26 @@ def check_prefix_env_path(key: str, value: str, *, indent: str = "        "):
         )
 
 
+def get_overlay() -> Dict[str, str]:
+    return getattr(ENV, "overlay", {})
+
+
 def run(cmd: str, *, check=True):
-    env = minimum_env()
-    env.update(vcenv.get_env(env))
-    cmd = cmd.format(PREFIX=PREFIX)
+    # output goes to the log of the package. see runner
+    from . import buildenv
+    from . import jobserver
+    from . import runner
+
+    env = buildenv.get_env(get_overlay())
+    cmd = cmd.format(PREFIX=get_prefix())
     LOGGER.debug(cmd)
-    LOGGER.debug(env.keys())
-    subprocess.run(cmd, env=env, shell=True, check=check)
+    runner.run(
+        cmd,
+        env=env,
+        check=check,
+        cwd=getcwd(),
+        pass_fds=jobserver.pass_fds(),
+    )
 
 
 # def make_env(prefix: pathlib.Path) -> dict:
@@ -148,7 +204,7 @@ def print_env():
     print()
     print("environment:")
     print(f"  TOOLS: {Fore.CYAN}{unexpand(LOCAL_BIN)}{Fore.RESET}")
-    print(f"  PREFIX: {Fore.CYAN}{unexpand(PREFIX)}{Fore.RESET}")
+    print(f"  PREFIX: {Fore.CYAN}{unexpand(get_prefix())}{Fore.RESET}")
     # PATH
     check_prefix_env_path("PATH", "bin")
     # LD_LIBRARY_PATH
@@ -164,11 +220,11 @@ def print_env():
     # PYTHONPATH
     if not IS_WINDOWS:
         python_lib_path = (
-            PREFIX
+            get_prefix()
             / f"lib/python{sys.version_info.major}.{sys.version_info.minor}/site_packages"
         )
     else:
-        python_lib_path = PREFIX / f"lib/site-packages"
+        python_lib_path = get_prefix() / f"lib/site-packages"
     has_sys_path = any(x for x in sys.path if pathlib.Path(x) == python_lib_path)
     if has_sys_path:
         print(f"    {Fore.GREEN}sys.path has {python_lib_path}{Fore.RESET}")
@@ -219,20 +275,31 @@ def print_env():
     print()
 
 
-def do_patch(dst: pathlib.Path, patches: List[pathlib.Path]):
-    for patch in patches:
-        LOGGER.info(f"apply: {patch}")
-        with pushd(dst):
-            run(f"patch -p0 < {patch}", check=False)
+def getcwd() -> pathlib.Path:
+    cwd = getattr(CWD, "path", None)
+    if cwd:
+        return cwd
+    return pathlib.Path(os.getcwd())
+
+
+@contextlib.contextmanager
+def setenv(**kw: str):
+    LOGGER.debug(f"setenv: {kw}")
+    overlay = getattr(ENV, "overlay", {})
+    try:
+        ENV.overlay = {**overlay, **kw}
+        yield
+    finally:
+        ENV.overlay = overlay
 
 
 @contextlib.contextmanager
 def pushd(path: pathlib.Path):
     LOGGER.debug(f"pushd: {path}")
-    cwd = os.getcwd()
+    cwd = getattr(CWD, "path", None)
     try:
-        os.chdir(path)
+        CWD.path = path
         yield
     finally:
         LOGGER.debug(f"popd: {cwd}")
-        os.chdir(cwd)
+        CWD.path = cwd
@@ -0,0 +1,168 @@
+from typing import Optional, Deque, Tuple, IO
+import sys
+import logging
+import pathlib
+import threading
+import contextlib
+import subprocess
+import collections
+from colorama import Fore
+from . import runenv
+
+LOGGER = logging.getLogger(__name__)
+
+# output of the build commands
+#
+# LOCAL_SRC/.logs/{name}.log : stdout and stderr of the last build of the package.
+# the last TAIL_LINES are kept in memory and printed when a command fails.
+#
+# verbosity. toprefix -q / -v / -vv or toprefix.toml verbosity
+# 0: warnings only
+# 1: progress. command output goes to the log files
+# 2: command output is also printed as `[name] line`
+# 3: debug log
+
+QUIET = 0
+NORMAL = 1
+ECHO = 2
+DEBUG = 3
+
+VERBOSITY = NORMAL
+TAIL_LINES = 40
+
+# whole lines from concurrent builds
+TERMINAL_LOCK = threading.Lock()
+CURRENT = threading.local()
+
+
+def get_log_dir() -> pathlib.Path:
+    return runenv.LOCAL_SRC / ".logs"
+
+
+def echo(name: str, line: str):
+    prefix = f"{Fore.CYAN}[{name}]{Fore.RESET} " if name else ""
+    with TERMINAL_LOCK:
+        sys.stdout.write(f"{prefix}{line}\n")
+
+
+class PackageLog:
+    def __init__(self, name: str, path: Optional[pathlib.Path] = None) -> None:
+        self.name = name
+        self.path = path
+        self.tail: Deque[str] = collections.deque(maxlen=TAIL_LINES)
+        self.lock = threading.Lock()
+        self.f: Optional[IO[str]] = None
+        if path:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self.f = path.open("w", encoding="utf-8", errors="replace")
+
+    def close(self):
+        if self.f:
+            self.f.close()
+            self.f = None
+
+    def write(self, line: str):
+        with self.lock:
+            self.tail.append(line)
+            if self.f:
+                self.f.write(line + "\n")
+        if VERBOSITY >= ECHO:
+            echo(self.name, line)
+
+    def print_tail(self):
+        if self.f:
+            self.f.flush()
+        with self.lock:
+            lines = list(self.tail)
+        where = f": {self.path}" if self.path else ""
+        with TERMINAL_LOCK:
+            print(f"{Fore.RED}--- {self.name or 'command'} failed{where}{Fore.RESET}")
+            for line in lines:
+                print(f"| {line}")
+            sys.stdout.flush()
+
+
+def current() -> PackageLog:
+    package_log = getattr(CURRENT, "log", None)
+    if not package_log:
+        # outside of a package build. tail only
+        package_log = PackageLog("")
+        CURRENT.log = package_log
+    return package_log
+
+
+@contextlib.contextmanager
+def log(name: str):
+    # command output of this thread => LOCAL_SRC/.logs/{name}.log
+    package_log = PackageLog(name, get_log_dir() / f"{name}.log")
+    last = getattr(CURRENT, "log", None)
+    CURRENT.log = package_log
+    try:
+        yield package_log
+    finally:
+        CURRENT.log = last
+        package_log.close()
+
+
+def pump(stream: IO[bytes], package_log: PackageLog):
+    with stream:
+        for raw in iter(stream.readline, b""):
+            package_log.write(raw.decode("utf-8", errors="replace").rstrip("\r\n"))
+
+
+def run(
+    cmd: str,
+    *,
+    env: dict,
+    cwd: pathlib.Path,
+    pass_fds: Tuple[int, ...] = (),
+    check: bool = True,
+) -> int:
+    package_log = current()
+    package_log.write(f"$ {cmd}")
+    process = subprocess.Popen(
+        cmd,
+        env=env,
+        shell=True,
+        cwd=cwd,
+        pass_fds=pass_fds,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    assert process.stdout and process.stderr
+    readers = [
+        threading.Thread(target=pump, args=(stream, package_log), daemon=True)
+        for stream in (process.stdout, process.stderr)
+    ]
+    for reader in readers:
+        reader.start()
+    for reader in readers:
+        reader.join()
+    returncode = process.wait()
+    if check and returncode != 0:
+        if VERBOSITY < ECHO:
+            package_log.print_tail()
+        raise subprocess.CalledProcessError(returncode, cmd)
+    return returncode
+
+
+def get_level(verbosity: int) -> int:
+    if verbosity >= DEBUG:
+        return logging.DEBUG
+    elif verbosity >= NORMAL:
+        return logging.INFO
+    return logging.WARNING
+
+
+def setup(verbosity: int):
+    global VERBOSITY
+    VERBOSITY = verbosity
+    logging.basicConfig(level=get_level(verbosity))
+
+
+def set_verbosity(verbosity: int):
+    # after setup. toprefix serve runs each command with the -q / -v of the client
+    global VERBOSITY
+    VERBOSITY = verbosity
+    logging.getLogger().setLevel(get_level(verbosity))
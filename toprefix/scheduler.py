@@ -0,0 +1,98 @@
+from typing import List, Dict, Set, Callable, Optional, Iterable
+import logging
+import concurrent.futures
+from colorama import Fore
+from .package import Pkg
+
+LOGGER = logging.getLogger(__name__)
+
+OK = "ok"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+class CycleError(Exception):
+    def __init__(self, cycle: List[str]) -> None:
+        super().__init__(f"dependency cycle: {' => '.join(cycle)}")
+        self.cycle = cycle
+
+
+def resolve(names: Iterable[str], get_pkg: Callable[[str], Optional[Pkg]]) -> List[Pkg]:
+    # targets and their deps in topological order.
+    # KeyError if not found. CycleError if a pkg depends on itself
+    order: List[Pkg] = []
+    visiting: Set[str] = set()
+    visited: Set[str] = set()
+
+    def visit(name: str, path: List[str]):
+        if name in visited:
+            return
+        if name in visiting:
+            raise CycleError(path[path.index(name) :] + [name])
+        pkg = get_pkg(name)
+        if not pkg:
+            raise KeyError(name)
+        visiting.add(name)
+        for dep in pkg.deps:
+            visit(dep, path + [name])
+        visiting.remove(name)
+        visited.add(name)
+        order.append(pkg)
+
+    for name in names:
+        visit(name, [])
+    return order
+
+
+def build(
+    pkgs: List[Pkg], *, slots: int, process: Callable[[Pkg], None]
+) -> Dict[str, str]:
+    # independent pkgs run concurrently up to slots.
+    # dependents of a failed pkg are skipped.
+    pkg_map = {pkg.source.name: pkg for pkg in pkgs}
+    waiting: Dict[str, Set[str]] = {
+        name: {dep for dep in pkg.deps if dep in pkg_map}
+        for name, pkg in pkg_map.items()
+    }
+    status: Dict[str, str] = {}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, slots)) as executor:
+        running: Dict[concurrent.futures.Future, str] = {}
+        while True:
+            # dict keeps topological order
+            for name in [name for name, deps in waiting.items() if not deps]:
+                del waiting[name]
+                LOGGER.info(f"start: {name}")
+                running[executor.submit(process, pkg_map[name])] = name
+            if not running:
+                break
+
+            done, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                name = running.pop(future)
+                try:
+                    future.result()
+                except Exception as e:
+                    LOGGER.error(f"{name}: {e}")
+                    status[name] = FAILED
+                    continue
+                status[name] = OK
+                for deps in waiting.values():
+                    deps.discard(name)
+
+    for name in waiting:
+        status[name] = SKIPPED
+    return status
+
+
+def print_status(status: Dict[str, str]):
+    print()
+    for name, result in status.items():
+        match result:
+            case "ok":
+                print(f"  {name}: {Fore.GREEN}{result}{Fore.RESET}")
+            case _:
+                print(f"  {name}: {Fore.RED}{result}{Fore.RESET}")
+    print()
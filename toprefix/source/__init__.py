@@ -1,8 +1,8 @@
-from typing import Tuple
 import logging
 from .source import Source
 from .archive import Archive
 from .gitrepository import GitRepository
+from .formats import archive_ext
 from .. import runenv
 
 LOGGER = logging.getLogger(__name__)
@@ -11,17 +11,33 @@ __all__ = ["Source", "Archive", "GitRepository", "get_source"]
 
 
 def get_source(name: str, item: dict) -> Source:
+    source = make_source(name, item["source"])
     match item["source"]:
+        case {"sha256": sha256} if isinstance(source, Archive):
+            source.sha256 = sha256
+    return source
+
+
+def make_source(name: str, source: dict) -> Source:
+    match source:
         case {"gnome": gnome}:
             return Archive.gnome(name, gnome["version"])
         case {"url": url, "version": version}:
             return Archive.from_url(url, name=name, version=version)
         case {"url": url}:
-            return Archive.from_url(url)
+            return Archive.from_url(url, name=name)
+        case {"git": {"url": url, **repo}}:
+            return GitRepository(
+                name, url, ref=repo.get("ref"), depth=repo.get("depth")
+            )
         case {"github": repo}:
             match repo:
                 case {"user": user, "tag": tag}:
                     return Archive.github_tag(user, name, tag)
+                case {"user": user, "ref": ref}:
+                    source = GitRepository.github(user, name, ref)
+                    source.depth = repo.get("depth")
+                    return source
                 case {"user": user}:
                     return Archive.github_head(user, name)
                 case _:
@@ -30,7 +46,9 @@ def get_source(name: str, item: dict) -> Source:
             if "tag" in repo:
                 return Archive.codeberg_tag(repo["user"], name, repo["tag"])
             else:
-                return GitRepository.github(repo["user"], name)
+                source = GitRepository.codeberg(repo["user"], name, repo.get("ref"))
+                source.depth = repo.get("depth")
+                return source
         case {"sourcehut": repo}:
             if "tag" in repo:
                 return Archive.sourcehut_tag(repo["user"], name, repo["tag"])
@@ -38,16 +56,3 @@ def get_source(name: str, item: dict) -> Source:
                 raise NotImplementedError()
         case _:
             raise NotImplementedError()
-
-
-def archive_ext(src: str) -> Tuple[str, str]:
-    if src.endswith(".tar.xz"):
-        return src[0:-7], ".tar.xz"
-    elif src.endswith(".tar.gz"):
-        return src[0:-7], ".tar.gz"
-    elif src.endswith(".tar.bz2"):
-        return src[0:-8], ".tar.bz2"
-    elif src.endswith(".zip"):
-        return src[0:-4], ".zip"
-    else:
-        raise NotImplementedError(src)
@@ -1,28 +1,18 @@
-from typing import Tuple, Optional
+from typing import Optional
 import os
 import logging
 import pathlib
-import requests
-import shutil
 import re
-import tqdm
+import shutil
 import tempfile
 from .. import runenv
+from .. import history
 from .source import Source
 from . import name_version
-
-
-def archive_ext(src: str) -> Tuple[str, str]:
-    if src.endswith(".tar.xz"):
-        return src[0:-7], ".tar.xz"
-    elif src.endswith(".tar.gz"):
-        return src[0:-7], ".tar.gz"
-    elif src.endswith(".tar.bz2"):
-        return src[0:-8], ".tar.bz2"
-    elif src.endswith(".zip"):
-        return src[0:-4], ".zip"
-    else:
-        raise NotImplementedError(src)
+from . import store
+from . import formats
+from . import patch
+from .formats import archive_ext
 
 
 LOGGER = logging.getLogger(__name__)
@@ -45,6 +35,10 @@ class Archive(Source):
         url: str,
         # folder name to extract other than filename
         archive_name: Optional[str] = None,
+        *,
+        sha256: Optional[str] = None,
+        # the content of url changes. github_head
+        moving: bool = False,
     ) -> None:
         self.name = name
         self.version = version
@@ -52,6 +46,8 @@ class Archive(Source):
         if not archive_name:
             archive_name = os.path.basename(self.url)
         self.archive_name = archive_name
+        self.sha256 = sha256
+        self.moving = moving
         self.patches = []
 
     def __str__(self) -> str:
@@ -72,10 +68,10 @@ class Archive(Source):
             )
 
         match name_version.get_name_version(stem):
-            case (name, version):
+            case (parsed_name, parsed_version):
                 return Archive(
-                    name,
-                    version,
+                    name or parsed_name,
+                    version or parsed_version,
                     url,
                 )
 
@@ -92,6 +88,8 @@ class Archive(Source):
                 minor=m.group(2),
                 patch=m.group(3),
             ),
+            name=name,
+            version=version,
         )
 
     @staticmethod
@@ -110,6 +108,7 @@ class Archive(Source):
             "head",
             f"https://github.com/{user}/{name}/archive/refs/heads/master.zip",
             f"{name}.zip",
+            moving=True,
         )
 
     @staticmethod
@@ -130,51 +129,74 @@ class Archive(Source):
             archive_name=f"{name}-{tag}.tar.gz",
         )
 
-    def extract(self) -> Optional[pathlib.Path]:
-        download = runenv.LOCAL_SRC / self.archive_name
-        if download.exists():
-            LOGGER.info(f"exists: {download}")
-        else:
-            LOGGER.info(f"download: {download}")
-            self.do_download(self.url, download)
-
-        stem, _ = archive_ext(self.archive_name)
-        extract = runenv.LOCAL_SRC / stem
-        if not extract.exists():
-            with tempfile.TemporaryDirectory() as dname:
-                dst = pathlib.Path(dname)
-                with runenv.pushd(dst):
-                    shutil.unpack_archive(download)
-
-                    # check result
-                    items = [f for f in dst.iterdir()]
-                    if len(items) != 1:
-                        raise Exception(f"extrac many root: {items}")
+    @property
+    def download_path(self) -> Optional[pathlib.Path]:
+        return store.lookup(self.url, self.sha256)
 
-                    # move to dst
-                    shutil.move(items[0], extract)
+    def fetch(self) -> int:
+        _, size = store.fetch(self.url, sha256=self.sha256, desc=self.name)
+        return size
 
-            assert not os.path.exists(dname)
+    def fingerprint(self) -> str:
+        # sha256 of the archive
+        path = self.download_path
+        return path.name if path else ""
 
-            # LOGGER.info(f"extract: {extract}")
-            # self.do_extract(download, extract)
-
-        runenv.do_patch(extract, self.patches)
+    def extract(self) -> Optional[pathlib.Path]:
+        stem, format = formats.find_format(self.archive_name)
+        extract = runenv.LOCAL_SRC / stem
+        use_tool = runenv.CONFIG.get("decompress_tools", True)
+        if extract.exists() and patch.needs_reextract(extract, self.url, self.patches):
+            LOGGER.info(f"patch set changed: re-extract {extract}")
+            shutil.rmtree(extract)
+        if extract.exists():
+            store.fetch(self.url, sha256=self.sha256, desc=self.name)
+        else:
+            extract.parent.mkdir(parents=True, exist_ok=True)
+            # staging next to extract. same filesystem, single rename
+            with tempfile.TemporaryDirectory(
+                dir=extract.parent, prefix=f".{stem}."
+            ) as dname:
+                staging = pathlib.Path(dname)
+                if self.can_stream(format):
+                    LOGGER.info(f"stream extract: {self.url} => {extract}")
+                    # overlaps download
+                    with history.phase("extract"):
+                        store.fetch_stream(
+                            self.url,
+                            lambda f: formats.extract_stream(
+                                f, format, staging, use_tool=use_tool
+                            ),
+                            sha256=self.sha256,
+                            desc=self.name,
+                        )
+                else:
+                    download, _ = store.fetch(
+                        self.url, sha256=self.sha256, desc=self.name
+                    )
+                    LOGGER.info(f"extract: {download} => {extract}")
+                    with history.phase("extract"):
+                        formats.extract_file(
+                            download, format, staging, use_tool=use_tool
+                        )
+
+                # check result
+                items = [f for f in staging.iterdir()]
+                if len(items) != 1:
+                    raise Exception(f"extrac many root: {items}")
+
+                # move to dst
+                os.rename(items[0], extract)
+
+        patch.apply(extract, self.url, self.patches)
 
         return extract
 
-    def do_download(self, url: str, dst: pathlib.Path):
-        try:
-            size = int(requests.head(url).headers["content-length"])
-        except KeyError:
-            size = 0
-
-        res = requests.get(url, stream=True)
-        pbar = tqdm.tqdm(total=size, unit="B", unit_scale=True)
-
-        dst.parent.mkdir(exist_ok=True, parents=True)
-        with dst.open("wb") as file:
-            for chunk in res.iter_content(chunk_size=1024):
-                file.write(chunk)
-                pbar.update(len(chunk))
-            pbar.close()
+    def can_stream(self, format: formats.ArchiveFormat) -> bool:
+        # zip has the index at the end. resume partial download first
+        return (
+            format.tar
+            and runenv.CONFIG.get("stream_extract", True)
+            and not store.lookup(self.url, self.sha256)
+            and not store.has_partial(self.url)
+        )
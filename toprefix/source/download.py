@@ -0,0 +1,437 @@
+from typing import Dict, List, Tuple, Optional, Callable, TYPE_CHECKING
+import os
+import re
+import json
+import queue
+import threading
+import concurrent.futures
+import urllib.parse
+import pathlib
+import logging
+
+if TYPE_CHECKING:
+    import requests
+
+LOGGER = logging.getLogger(__name__)
+
+# keep-alive connections per host
+POOL_SIZE = 8
+
+# parallel byte ranges per download. toprefix.toml download_connections
+CONNECTIONS = 4
+# smaller files are a single request
+SEGMENT_SIZE = 8 * 1024 * 1024
+SEGMENT_RETRIES = 3
+# (connect, read) seconds. a stalled segment is retried
+SEGMENT_TIMEOUT = (30, 60)
+
+CONTENT_RANGE_PATTERN = re.compile(r"^bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)$")
+
+# requests and tqdm are imported on the first download
+SESSIONS: Dict[str, "requests.Session"] = {}
+SESSIONS_LOCK = threading.Lock()
+
+# install --offline. archives from the store and git commits from the mirrors only
+OFFLINE = False
+
+
+class OfflineError(Exception):
+    pass
+
+
+def check_online(url: str):
+    if OFFLINE:
+        raise OfflineError(f"offline: {url}")
+
+
+def get_host(url: str) -> str:
+    return urllib.parse.urlsplit(url).netloc
+
+
+def get_session(url: str) -> "requests.Session":
+    check_online(url)
+    import requests
+    import requests.adapters
+
+    host = get_host(url)
+    with SESSIONS_LOCK:
+        session = SESSIONS.get(host)
+        if not session:
+            session = requests.Session()
+            # redirect target (github => codeload) shares the same session
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=4, pool_maxsize=POOL_SIZE
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            SESSIONS[host] = session
+        return session
+
+
+def parse_content_range(value: str) -> Tuple[Optional[int], Optional[int]]:
+    # "bytes 100-199/1000" => (100, 1000), "bytes */1000" => (None, 1000)
+    m = CONTENT_RANGE_PATTERN.match(value)
+    if not m:
+        return None, None
+    start = int(m.group(1)) if m.group(1) else None
+    total = int(m.group(3)) if m.group(3) != "*" else None
+    return start, total
+
+
+def get_connections() -> int:
+    from .. import runenv
+
+    return int(runenv.get_config().get("download_connections", CONNECTIONS))
+
+
+def download(
+    url: str,
+    dst: pathlib.Path,
+    *,
+    desc: str = "",
+    on_chunk: Optional[Callable[[bytes], None]] = None,
+    connections: Optional[int] = None,
+) -> int:
+    # resume if dst exists. on_chunk gets the whole content only when dst does not exist
+    offset = dst.stat().st_size if dst.exists() else 0
+    if connections is None:
+        connections = get_connections()
+    if not offset and not on_chunk and connections > 1:
+        # also resumes an interrupted segmented download
+        return download_segmented(url, dst, desc=desc, connections=connections)
+
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    res = get_session(url).get(url, stream=True, headers=headers)
+
+    if res.status_code == 416:
+        # nothing left to download or the file was replaced
+        res.close()
+        _, total = parse_content_range(res.headers.get("content-range", ""))
+        if total == offset:
+            return 0
+        LOGGER.warning(f"{url}: restart. size {offset} != {total}")
+        os.remove(dst)
+        return download(
+            url, dst, desc=desc, on_chunk=on_chunk, connections=connections
+        )
+
+    res.raise_for_status()
+    if res.status_code == 206:
+        start, _ = parse_content_range(res.headers.get("content-range", ""))
+        if start != offset:
+            res.close()
+            raise Exception(f"{url}: unexpected content-range")
+        LOGGER.info(f"resume: {url} from {offset}")
+        return write_stream(url, res, dst, offset=offset, desc=desc, on_chunk=on_chunk)
+    return write_stream(url, res, dst, desc=desc, on_chunk=on_chunk)
+
+
+def write_stream(
+    url: str,
+    res: "requests.Response",
+    dst: pathlib.Path,
+    *,
+    offset: int = 0,
+    desc: str = "",
+    on_chunk: Optional[Callable[[bytes], None]] = None,
+) -> int:
+    import tqdm
+
+    # append to dst after offset
+    size = int(res.headers.get("content-length", 0))
+    dst.parent.mkdir(exist_ok=True, parents=True)
+    written = 0
+    with tqdm.tqdm(
+        total=offset + size,
+        initial=offset,
+        unit="B",
+        unit_scale=True,
+        desc=desc,
+        leave=False,
+    ) as pbar:
+        with dst.open("ab" if offset else "wb") as file, res:
+            for chunk in res.iter_content(chunk_size=64 * 1024):
+                file.write(chunk)
+                if on_chunk:
+                    on_chunk(chunk)
+                written += len(chunk)
+                pbar.update(len(chunk))
+    if size and written != size and not res.headers.get("content-encoding"):
+        raise Exception(f"{url}: truncated {written} != {size}")
+    return written
+
+
+def split_segments(total: int, first: int, connections: int) -> List[Tuple[int, int]]:
+    # [(start, end)] inclusive. the first is the probe request
+    segments = [(0, min(first, total) - 1)]
+    rest = total - first
+    if rest <= 0:
+        return segments
+    # a few segments per connection. a fast connection takes more
+    size = max(SEGMENT_SIZE, -(-rest // (connections * 4)))
+    for start in range(first, total, size):
+        segments.append((start, min(start + size, total) - 1))
+    return segments
+
+
+def preallocate(fd: int, size: int):
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError:
+            # not supported by the filesystem
+            pass
+    os.truncate(fd, size)
+
+
+WRITE_LOCK = threading.Lock()
+
+
+def write_at(fd: int, data: bytes, pos: int):
+    if hasattr(os, "pwrite"):
+        while data:
+            n = os.pwrite(fd, data, pos)
+            data = data[n:]
+            pos += n
+    else:
+        # windows
+        with WRITE_LOCK:
+            os.lseek(fd, pos, os.SEEK_SET)
+            os.write(fd, data)
+
+
+class RangeError(Exception):
+    # a segment got 200. single stream instead
+    pass
+
+
+def get_validator(headers) -> Optional[str]:
+    # If-Range needs a strong validator. a weak etag turns every range into a 200
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return headers.get("last-modified")
+
+
+def load_segments(
+    state: pathlib.Path, url: str, total: int, validator: Optional[str]
+) -> Optional[dict]:
+    # completed segments of an interrupted download of the same content
+    if not validator:
+        return None
+    try:
+        data = json.loads(state.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return None
+    if (data.get("url"), data.get("total"), data.get("validator")) != (
+        url,
+        total,
+        validator,
+    ):
+        return None
+    return data
+
+
+def download_segmented(
+    url: str, dst: pathlib.Path, *, desc: str = "", connections: int = CONNECTIONS
+) -> int:
+    # returns transferred bytes
+    import tqdm
+    import requests
+
+    session = get_session(url)
+    res = session.get(
+        url,
+        stream=True,
+        headers={"Range": f"bytes=0-{SEGMENT_SIZE - 1}"},
+        timeout=SEGMENT_TIMEOUT,
+    )
+    res.raise_for_status()
+    _, total = parse_content_range(res.headers.get("content-range", ""))
+    if res.status_code != 206 or total is None:
+        # no Accept-Ranges. single stream
+        LOGGER.debug(f"{url}: no range support")
+        return write_stream(url, res, dst, desc=desc)
+
+    # same file for all segments, or the server returns 200
+    validator = get_validator(res.headers)
+
+    # segments are written to tmp. dst is the resumable single stream download.
+    # state records the completed segments. resumed if the validator matches
+    tmp = dst.with_name(f"{dst.name}.segments")
+    state = dst.with_name(f"{dst.name}.segments.json")
+    tmp.parent.mkdir(exist_ok=True, parents=True)
+    resumed = load_segments(state, url, total, validator) if tmp.exists() else None
+    if resumed:
+        segments = [(start, end) for start, end in resumed["segments"]]
+        done = {(start, end) for start, end in resumed["done"]}
+        LOGGER.info(f"resume segmented: {url} {len(done)}/{len(segments)} segments")
+    else:
+        segments = split_segments(total, SEGMENT_SIZE, connections)
+        done = set()
+        state.unlink(missing_ok=True)
+        LOGGER.info(f"segmented: {url} {total} bytes, {len(segments)} segments")
+    state_lock = threading.Lock()
+    aborted = threading.Event()
+
+    def save_state():
+        if not validator:
+            return
+        data = {
+            "url": url,
+            "total": total,
+            "validator": validator,
+            "segments": segments,
+            "done": sorted(done),
+        }
+        with state_lock:
+            part = state.with_name(f"{state.name}.tmp")
+            part.write_text(json.dumps(data), encoding="utf-8")
+            os.replace(part, state)
+
+    def fetch_segment(start: int, end: int, res: Optional["requests.Response"]) -> int:
+        pos = start
+        for retry in range(SEGMENT_RETRIES):
+            try:
+                if not res:
+                    headers = {"Range": f"bytes={pos}-{end}"}
+                    if validator:
+                        headers["If-Range"] = validator
+                    res = session.get(
+                        url, stream=True, headers=headers, timeout=SEGMENT_TIMEOUT
+                    )
+                    if res.status_code == 200:
+                        res.close()
+                        raise RangeError(f"{url}: 200 for a range")
+                    if res.status_code != 206:
+                        res.close()
+                        res.raise_for_status()
+                        raise Exception(f"{url}: status {res.status_code}")
+                    got, _ = parse_content_range(res.headers.get("content-range", ""))
+                    if got != pos:
+                        res.close()
+                        raise Exception(f"{url}: unexpected content-range")
+                for chunk in res.iter_content(chunk_size=64 * 1024):
+                    if aborted.is_set():
+                        res.close()
+                        return pos - start
+                    chunk = chunk[0 : end + 1 - pos]
+                    write_at(fd, chunk, pos)
+                    pos += len(chunk)
+                    pbar.update(len(chunk))
+                res.close()
+                res = None
+                if pos > end:
+                    with state_lock:
+                        done.add((start, end))
+                    save_state()
+                    return pos - start
+                LOGGER.warning(f"{url}: segment {start} truncated at {pos}")
+            except requests.RequestException as e:
+                LOGGER.warning(f"{url}: segment {start}: {e}")
+                res = None
+        raise Exception(f"{url}: segment {start}-{end} failed")
+
+    flags = os.O_WRONLY | os.O_CREAT | getattr(os, "O_BINARY", 0)
+    fd = os.open(tmp, flags if resumed else flags | os.O_TRUNC)
+    written = []
+    try:
+        try:
+            if not resumed:
+                preallocate(fd, total)
+            if segments[0] in done:
+                res.close()
+            save_state()
+            with tqdm.tqdm(
+                total=total,
+                initial=sum(end + 1 - start for start, end in done),
+                unit="B",
+                unit_scale=True,
+                desc=desc,
+                leave=False,
+            ) as pbar, concurrent.futures.ThreadPoolExecutor(
+                max_workers=connections
+            ) as executor:
+                futures = [
+                    executor.submit(
+                        fetch_segment, start, end, res if start == 0 else None
+                    )
+                    for start, end in segments
+                    if (start, end) not in done
+                ]
+                try:
+                    for future in futures:
+                        written.append(future.result())
+                finally:
+                    # stop the other segments. also on Ctrl-C
+                    aborted.set()
+        finally:
+            os.close(fd)
+    except RangeError as e:
+        LOGGER.warning(f"{e}. single stream")
+        tmp.unlink(missing_ok=True)
+        state.unlink(missing_ok=True)
+        res = session.get(url, stream=True)
+        res.raise_for_status()
+        return write_stream(url, res, dst, desc=desc)
+    except Exception:
+        if not validator:
+            # not resumable
+            tmp.unlink(missing_ok=True)
+        raise
+
+    missing = [segment for segment in segments if segment not in done]
+    if missing:
+        raise Exception(f"{url}: segments {missing} not written")
+    os.replace(tmp, dst)
+    state.unlink(missing_ok=True)
+    return sum(written)
+
+
+class PipeAborted(Exception):
+    # the reader of ChunkPipe stopped. the download is abandoned
+    pass
+
+
+class ChunkPipe:
+    # file-like reader for chunks put by the download thread
+    def __init__(self, maxsize: int = 64) -> None:
+        self.queue: "queue.Queue[Optional[bytes]]" = queue.Queue(maxsize=maxsize)
+        self.buffer = b""
+        self.closed = False
+        self.aborted = False
+
+    def put(self, chunk: bytes):
+        if self.aborted:
+            raise PipeAborted()
+        self.queue.put(chunk)
+
+    def close(self):
+        if not self.aborted:
+            self.queue.put(None)
+
+    def abort(self):
+        # unblock the writer. the next put raises
+        self.aborted = True
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+
+    def read(self, size: int = -1) -> bytes:
+        while not self.closed and (size < 0 or len(self.buffer) < size):
+            chunk = self.queue.get()
+            if chunk is None:
+                self.closed = True
+                break
+            self.buffer += chunk
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[0:size], self.buffer[size:]
+        return data
+
+    def drain(self):
+        while self.read(1024 * 1024):
+            pass
@@ -0,0 +1,195 @@
+from typing import Dict, List, Optional, Tuple, BinaryIO, Callable
+import shutil
+import logging
+import pathlib
+import tarfile
+import tempfile
+import threading
+import subprocess
+from .. import runenv
+
+LOGGER = logging.getLogger(__name__)
+
+
+class ArchiveFormat:
+    def __init__(
+        self,
+        ext: str,
+        *,
+        tar: bool = True,
+        tools: List[List[str]] = [],
+        codec: Optional[Callable[[BinaryIO], BinaryIO]] = None,
+    ) -> None:
+        self.ext = ext
+        self.tar = tar
+        # decompressor commands reading stdin, writing stdout. first found is used
+        self.tools = tools
+        # python fallback. decompressed stream
+        self.codec = codec
+
+    def __str__(self) -> str:
+        return self.ext
+
+    def find_tool(self) -> Optional[List[str]]:
+        for tool in self.tools:
+            found = runenv.which(tool[0])
+            if found:
+                return [str(found)] + tool[1:]
+
+
+def gzip_codec(f: BinaryIO) -> BinaryIO:
+    import gzip
+
+    return gzip.GzipFile(fileobj=f, mode="rb")  # type: ignore
+
+
+def xz_codec(f: BinaryIO) -> BinaryIO:
+    import lzma
+
+    return lzma.LZMAFile(f)  # type: ignore
+
+
+def bz2_codec(f: BinaryIO) -> BinaryIO:
+    import bz2
+
+    return bz2.BZ2File(f)  # type: ignore
+
+
+def zstd_codec(f: BinaryIO) -> BinaryIO:
+    try:
+        # python 3.14
+        from compression import zstd  # type: ignore
+
+        return zstd.ZstdFile(f)
+    except ImportError:
+        pass
+    try:
+        import zstandard  # type: ignore
+    except ImportError:
+        raise NotImplementedError("zstd or python zstandard required for .tar.zst")
+    return zstandard.ZstdDecompressor().stream_reader(f)
+
+
+FORMATS: Dict[str, ArchiveFormat] = {}
+
+
+def register(format: ArchiveFormat):
+    FORMATS[format.ext] = format
+
+
+GZIP_TOOLS = [["pigz", "-d", "-c"], ["gzip", "-d", "-c"]]
+register(ArchiveFormat(".tar.gz", tools=GZIP_TOOLS, codec=gzip_codec))
+register(ArchiveFormat(".tgz", tools=GZIP_TOOLS, codec=gzip_codec))
+register(
+    ArchiveFormat(
+        ".tar.xz",
+        # xz >= 5.4 decompress multithreaded
+        tools=[["pixz", "-d"], ["xz", "-d", "-c", "-T0"]],
+        codec=xz_codec,
+    )
+)
+register(
+    ArchiveFormat(
+        ".tar.bz2",
+        tools=[["lbzip2", "-d", "-c"], ["pbzip2", "-d", "-c"]],
+        codec=bz2_codec,
+    )
+)
+register(
+    ArchiveFormat(".tar.zst", tools=[["zstd", "-d", "-c", "-T0"]], codec=zstd_codec)
+)
+# no python codec
+register(ArchiveFormat(".tar.lz", tools=[["plzip", "-d", "-c"], ["lzip", "-d", "-c"]]))
+register(ArchiveFormat(".zip", tar=False))
+
+
+def find_format(src: str) -> Tuple[str, ArchiveFormat]:
+    # longest extension first. .tar.gz before .gz
+    for ext in sorted(FORMATS, key=len, reverse=True):
+        if src.endswith(ext):
+            return src[0 : -len(ext)], FORMATS[ext]
+    raise NotImplementedError(src)
+
+
+def archive_ext(src: str) -> Tuple[str, str]:
+    stem, format = find_format(src)
+    return stem, format.ext
+
+
+def extract_tar(f: BinaryIO, dst: pathlib.Path):
+    with tarfile.open(fileobj=f, mode="r|") as tar:
+        if hasattr(tarfile, "tar_filter"):
+            tar.extractall(dst, filter="tar")
+        else:
+            tar.extractall(dst)
+
+
+def extract_with_tool(tool: List[str], f: BinaryIO, dst: pathlib.Path):
+    LOGGER.debug(f"decompress: {' '.join(tool)}")
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(
+            tool, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=stderr
+        )
+        assert process.stdin and process.stdout
+
+        def feed():
+            try:
+                while True:
+                    chunk = f.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    process.stdin.write(chunk)  # type: ignore
+            except (BrokenPipeError, ValueError):
+                pass
+            finally:
+                try:
+                    process.stdin.close()  # type: ignore
+                except BrokenPipeError:
+                    pass
+
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+        try:
+            extract_tar(process.stdout, dst)  # type: ignore
+            # trailing padding
+            while process.stdout.read(1024 * 1024):
+                pass
+        except:
+            process.kill()
+            raise
+        finally:
+            feeder.join()
+            process.wait()
+            process.stdout.close()
+        if process.returncode != 0:
+            stderr.seek(0)
+            raise Exception(
+                f"{tool[0]}: {process.returncode}: {stderr.read().decode(errors='replace').strip()}"
+            )
+
+
+def extract_stream(
+    f: BinaryIO, format: ArchiveFormat, dst: pathlib.Path, *, use_tool: bool = True
+):
+    # f is read sequentially
+    if not format.tar:
+        raise NotImplementedError(f"{format} is not streamable")
+    tool = format.find_tool() if use_tool else None
+    if tool:
+        extract_with_tool(tool, f, dst)
+    else:
+        if not format.codec:
+            names = " or ".join(tool[0] for tool in format.tools)
+            raise NotImplementedError(f"{names} required for {format}")
+        with format.codec(f) as decompressed:
+            extract_tar(decompressed, dst)
+
+
+def extract_file(
+    path: pathlib.Path, format: ArchiveFormat, dst: pathlib.Path, *, use_tool: bool = True
+):
+    if not format.tar:
+        shutil.unpack_archive(path, dst, format="zip")
+        return
+    with path.open("rb") as f:
+        extract_stream(f, format, dst, use_tool=use_tool)
@@ -1,29 +1,106 @@
+from typing import Optional, Dict
 from .source import Source
+import os
+import re
 import logging
 import pathlib
+import threading
+import subprocess
+import urllib.parse
 from .. import runenv
+from .. import history
+from . import patch
+from . import download
 
 LOGGER = logging.getLogger(__name__)
 
 # git repository
 GITHUB_URL = "https://github.com/{user}/{name}.git"
 GITLAB_URL = "https://gitlab.freedesktop.org/{user}/{name}.git"
+CODEBERG_URL = "https://codeberg.org/{user}/{name}.git"
+
+# install --update / fetch --update. fetch ref even if the worktree exists
+UPDATE = False
+
+MIRROR_LOCKS: Dict[str, threading.Lock] = {}
+MIRROR_LOCKS_LOCK = threading.Lock()
+
+
+def git(*args: str, cwd: Optional[pathlib.Path] = None) -> str:
+    return subprocess.run(
+        ["git", *args], cwd=cwd, capture_output=True, text=True, check=True
+    ).stdout.strip()
+
+
+def mirror_name(url: str) -> str:
+    # https://github.com/neovim/neovim.git => github.com/neovim/neovim.git
+    parsed = urllib.parse.urlsplit(url)
+    path = parsed.path.strip("/")
+    if not path.endswith(".git"):
+        path += ".git"
+    return f"{parsed.netloc}/{path}" if parsed.netloc else re.sub(r"[:/\\]+", "_", path)
+
+
+def has_commit(repository: pathlib.Path, commit: str) -> bool:
+    # without the lazy fetch of a partial clone
+    return (
+        subprocess.run(
+            ["git", "cat-file", "-e", f"{commit}^{{commit}}"],
+            cwd=repository,
+            env={**os.environ, "GIT_NO_LAZY_FETCH": "1"},
+            capture_output=True,
+        ).returncode
+        == 0
+    )
+
+
+def get_mirror_lock(mirror: pathlib.Path) -> threading.Lock:
+    with MIRROR_LOCKS_LOCK:
+        lock = MIRROR_LOCKS.get(str(mirror))
+        if not lock:
+            lock = threading.Lock()
+            MIRROR_LOCKS[str(mirror)] = lock
+        return lock
 
 
 class GitRepository(Source):
-    def __init__(self, name: str, url: str) -> None:
+    def __init__(
+        self,
+        name: str,
+        url: str,
+        *,
+        ref: Optional[str] = None,
+        depth: Optional[int] = None,
+    ) -> None:
         self.name = name
         self.url = url
+        # branch, tag or commit. remote HEAD if None
+        self.ref = ref
+        # shallow fetch
+        self.depth = depth
+        # pinned by the lockfile. checked out instead of ref
+        self.commit: Optional[str] = None
         self.patches = []
 
     def __str__(self) -> str:
+        if self.ref:
+            return f"{self.name}-{self.ref}"
         return f"{self.name}: {self.url}"
 
     @staticmethod
-    def github(user: str, name: str) -> "GitRepository":
+    def github(user: str, name: str, ref: Optional[str] = None) -> "GitRepository":
         return GitRepository(
             name,
             GITHUB_URL.format(user=user, name=name),
+            ref=ref,
+        )
+
+    @staticmethod
+    def codeberg(user: str, name: str, ref: Optional[str] = None) -> "GitRepository":
+        return GitRepository(
+            name,
+            CODEBERG_URL.format(user=user, name=name),
+            ref=ref,
         )
 
     @staticmethod
@@ -33,17 +110,122 @@ class GitRepository(Source):
             GITLAB_URL.format(user=user, name=name),
         )
 
-    def do_clone(self, url: str, dst: pathlib.Path):
-        dst.parent.mkdir(parents=True, exist_ok=True)
-        with runenv.pushd(dst.parent):
-            runenv.run(f"git clone {url}")
+    @property
+    def mirror(self) -> pathlib.Path:
+        # bare, blob:none. shared by worktrees of each ref
+        return runenv.LOCAL_SRC / ".git-mirrors" / mirror_name(self.url)
+
+    @property
+    def worktree(self) -> pathlib.Path:
+        if self.ref:
+            ref = re.sub(r"[^\w.+-]", "_", self.ref)
+            return runenv.LOCAL_SRC / f"{self.name}-{ref}"
+        return runenv.LOCAL_SRC / self.name
+
+    def init_mirror(self):
+        LOGGER.info(f"mirror: {self.url} => {self.mirror}")
+        self.mirror.mkdir(parents=True, exist_ok=True)
+        git("init", "--bare", "--quiet", cwd=self.mirror)
+        git("remote", "add", "origin", self.url, cwd=self.mirror)
+        git("config", "remote.origin.promisor", "true", cwd=self.mirror)
+        git("config", "remote.origin.partialclonefilter", "blob:none", cwd=self.mirror)
+
+    def fetch_ref(self, repository: pathlib.Path) -> str:
+        # incremental. returns the commit
+        download.check_online(self.url)
+        depth = f" --depth {self.depth}" if self.depth else ""
+        with runenv.pushd(repository), history.phase("download"):
+            runenv.run(
+                f"git fetch --filter=blob:none{depth} origin {self.ref or 'HEAD'}"
+            )
+        return git("rev-parse", "FETCH_HEAD^{commit}", cwd=repository)
+
+    def fetch(self) -> int:
+        if self.commit:
+            return self.fetch_commit(self.commit)
+        worktree = self.worktree
+        if worktree.exists() and not UPDATE:
+            return 0
+
+        if (worktree / ".git").is_dir():
+            # full clone by older version
+            LOGGER.info(f"update: {worktree}")
+            commit = self.fetch_ref(worktree)
+            force = ["--force"] if patch.is_patched(worktree) else []
+            with history.phase("extract"):
+                git("checkout", "--quiet", *force, "--detach", commit, cwd=worktree)
+            return 0
+
+        with get_mirror_lock(self.mirror):
+            if not (self.mirror / "HEAD").exists():
+                self.init_mirror()
+            commit = self.fetch_ref(self.mirror)
+            with history.phase("extract"):
+                self.checkout(commit)
+        return 0
+
+    def fetch_commit(self, commit: str) -> int:
+        # locked. no network if the worktree or the mirror has the commit
+        worktree = self.worktree
+        if worktree.exists() and self.fingerprint() == commit:
+            return 0
+        full_clone = (worktree / ".git").is_dir()
+        repository = worktree if full_clone else self.mirror
+        with get_mirror_lock(self.mirror):
+            if not full_clone and not (self.mirror / "HEAD").exists():
+                self.init_mirror()
+            if not has_commit(repository, commit):
+                self.fetch_ref(repository)
+                if not has_commit(repository, commit):
+                    raise Exception(
+                        f"{self.name}: {commit} is not in {self.ref or 'HEAD'}"
+                    )
+            with history.phase("extract"):
+                if full_clone:
+                    force = ["--force"] if patch.is_patched(worktree) else []
+                    git("checkout", "--quiet", *force, "--detach", commit, cwd=worktree)
+                else:
+                    self.checkout(commit)
+        return 0
+
+    def checkout(self, commit: str):
+        worktree = self.worktree
+        if worktree.exists():
+            LOGGER.info(f"update: {worktree} => {commit}")
+            # patched files are applied again to the new commit
+            force = ["--force"] if patch.is_patched(worktree) else []
+            git("checkout", "--quiet", *force, "--detach", commit, cwd=worktree)
+        else:
+            LOGGER.info(f"worktree: {worktree} => {commit}")
+            git("worktree", "prune", cwd=self.mirror)
+            git(
+                "worktree",
+                "add",
+                "--quiet",
+                "--detach",
+                str(worktree),
+                commit,
+                cwd=self.mirror,
+            )
+
+    def fingerprint(self) -> str:
+        # HEAD commit
+        worktree = self.worktree
+        if not worktree.exists():
+            return ""
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=worktree, capture_output=True, text=True
+        ).stdout.strip()
 
     def extract(self):
-        clone = runenv.LOCAL_SRC / self.name
-        if not clone.exists():
-            LOGGER.info(f"clone: {clone}")
-            self.do_clone(self.url, clone)
+        self.fetch()
+        worktree = self.worktree
 
-        runenv.do_patch(clone, self.patches)
+        commit = self.fingerprint()
+        if patch.needs_reextract(worktree, commit, self.patches):
+            LOGGER.info(f"patch set changed: reset {worktree}")
+            git("reset", "--quiet", "--hard", cwd=worktree)
+            git("clean", "--quiet", "-fd", cwd=worktree)
+        patch.apply(worktree, commit, self.patches)
 
-        return clone
+        return worktree
@@ -6,7 +6,7 @@ TRIPLETS = [
     "-windows-x86_64",
 ]
 
-PATTERN = re.compile(r"^(.*)-?v?(\d+)(\.\d+)(\.\d+)?$")
+PATTERN = re.compile(r"^(.*?)-?v?(\d+)(\.\d+)(\.\d+)?$")
 
 
 def get_name_version(stem: str) -> Optional[Tuple[str, str]]:
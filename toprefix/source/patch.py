@@ -0,0 +1,94 @@
+from typing import List, Optional
+import os
+import json
+import logging
+import pathlib
+import subprocess
+from .. import runenv
+from .. import history
+from . import store
+
+LOGGER = logging.getLogger(__name__)
+
+# {tree}/.toprefix-patches.json : patches applied to the extracted tree
+#
+# {"base": archive url or commit, "patches": [[name, sha256], ...]}
+# pending patches are appended in one `patch` run after a dry run.
+# a removed, changed or reordered patch needs a pristine tree
+
+PATCHES_JSON = ".toprefix-patches.json"
+
+
+def get_patch_set(patches: List[pathlib.Path]) -> List[List[str]]:
+    return [[patch.name, store.hash_file(patch)] for patch in patches]
+
+
+def load_record(dst: pathlib.Path) -> Optional[dict]:
+    try:
+        return json.loads((dst / PATCHES_JSON).read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def save_record(dst: pathlib.Path, base: str, applied: List[List[str]]):
+    path = dst / PATCHES_JSON
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(
+        json.dumps({"base": base, "patches": applied}, indent=2), encoding="utf-8"
+    )
+    os.replace(tmp, path)
+
+
+def is_patched(dst: pathlib.Path) -> bool:
+    record = load_record(dst)
+    return bool(record and record["patches"])
+
+
+def needs_reextract(dst: pathlib.Path, base: str, patches: List[pathlib.Path]) -> bool:
+    # the applied patches are not a prefix of the patch set
+    record = load_record(dst)
+    if record is None:
+        # extracted by an older version. patched or not is unknown
+        return bool(patches)
+    applied = record["patches"]
+    if not applied:
+        return False
+    if record["base"] != base:
+        return True
+    return get_patch_set(patches)[0 : len(applied)] != applied
+
+
+def run_patch(dst: pathlib.Path, data: bytes, *, dry_run: bool = False):
+    patch = runenv.which("patch")
+    if not patch:
+        raise Exception("patch not found")
+    cmd = [str(patch), "-p0", "--batch", "--forward"]
+    if dry_run:
+        cmd.append("--dry-run")
+    p = subprocess.run(cmd, input=data, cwd=dst, capture_output=True)
+    if p.returncode != 0:
+        output = (p.stdout + p.stderr).decode("utf-8", errors="replace").strip()
+        raise Exception(f"patch{' --dry-run' if dry_run else ''}: {dst}: {output}")
+
+
+def apply(dst: pathlib.Path, base: str, patches: List[pathlib.Path]):
+    record = load_record(dst)
+    applied = record["patches"] if record and record["base"] == base else []
+    patch_set = get_patch_set(patches)
+    pending = list(zip(patches[len(applied) :], patch_set[len(applied) :]))
+    if not pending:
+        if record is None:
+            save_record(dst, base, [])
+        return
+
+    with history.phase("patch"):
+        LOGGER.info(f"apply: {', '.join(patch.name for patch, _ in pending)}")
+        data = b""
+        for patch, _ in pending:
+            data += patch.read_bytes()
+            if not data.endswith(b"\n"):
+                data += b"\n"
+        # nothing is modified if any hunk fails
+        run_patch(dst, data, dry_run=True)
+        run_patch(dst, data)
+    save_record(dst, base, applied + [x for _, x in pending])
@@ -19,5 +19,11 @@ class Source(Protocol):
     name: str
     patches: List[pathlib.Path] = []
 
+    def fetch(self) -> int:
+        ...
+
+    def fingerprint(self) -> str:
+        ...
+
     def extract(self) -> Optional[pathlib.Path]:
         ...
@@ -0,0 +1,221 @@
+from typing import Optional, Tuple, Dict, Callable, BinaryIO
+import os
+import hashlib
+import logging
+import contextlib
+import pathlib
+import threading
+from .. import runenv
+from .. import history
+from . import download
+
+LOGGER = logging.getLogger(__name__)
+
+# LOCAL_SRC/.store/sha256/ab/abcdef... : archive content
+# LOCAL_SRC/.store/url/<sha256 of url> : sha256 of the content
+# LOCAL_SRC/.store/tmp/<sha256 of url>.part : download in progress
+# LOCAL_SRC/.store/tmp/<sha256 of url>.lock : held by the process writing the .part
+
+URL_LOCKS: Dict[str, threading.Lock] = {}
+URL_LOCKS_LOCK = threading.Lock()
+
+
+class ChecksumError(Exception):
+    pass
+
+
+def get_store() -> pathlib.Path:
+    return runenv.LOCAL_SRC / ".store"
+
+
+def object_path(sha256: str) -> pathlib.Path:
+    return get_store() / "sha256" / sha256[0:2] / sha256
+
+
+def url_key(url: str) -> str:
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+def hash_file(path: pathlib.Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        while True:
+            chunk = f.read(1024 * 1024)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def write_atomic(path: pathlib.Path, data: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(data, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def lookup(url: str, sha256: Optional[str] = None) -> Optional[pathlib.Path]:
+    if sha256:
+        path = object_path(sha256)
+        if path.exists():
+            return path
+
+    ref = get_store() / "url" / url_key(url)
+    if ref.exists():
+        found = ref.read_text(encoding="utf-8").strip()
+        if sha256 and found != sha256:
+            LOGGER.warning(f"{url}: sha256 changed {found} => {sha256}")
+            return None
+        path = object_path(found)
+        if path.exists():
+            return path
+
+
+def forget(url: str):
+    # the next fetch downloads again. the object is kept
+    (get_store() / "url" / url_key(url)).unlink(missing_ok=True)
+
+
+def get_part_path(url: str) -> pathlib.Path:
+    return get_store() / "tmp" / f"{url_key(url)}.part"
+
+
+@contextlib.contextmanager
+def part_lock(url: str):
+    # between toprefix processes. URL_LOCKS are per process
+    path = get_part_path(url).with_suffix(".lock")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+
+            f.seek(0)
+            while True:
+                try:
+                    # retries for 10 seconds
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def get_url_lock(url: str) -> threading.Lock:
+    with URL_LOCKS_LOCK:
+        lock = URL_LOCKS.get(url)
+        if not lock:
+            lock = threading.Lock()
+            URL_LOCKS[url] = lock
+        return lock
+
+
+def add(
+    path: pathlib.Path, *, url: str, sha256: Optional[str] = None
+) -> pathlib.Path:
+    # move a finished download into the store
+    digest = hash_file(path)
+    if sha256 and digest != sha256:
+        os.remove(path)
+        raise ChecksumError(f"{url}: sha256 {digest} != {sha256}")
+
+    dst = object_path(digest)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(path, dst)
+    write_atomic(get_store() / "url" / url_key(url), digest)
+    return dst
+
+
+def fetch(
+    url: str, *, sha256: Optional[str] = None, desc: str = ""
+) -> Tuple[pathlib.Path, int]:
+    # (path in store, transferred bytes)
+    with get_url_lock(url):
+        found = lookup(url, sha256)
+        if found:
+            LOGGER.info(f"exists: {found}")
+            return found, 0
+
+        with part_lock(url):
+            # finished by another process while waiting
+            found = lookup(url, sha256)
+            if found:
+                LOGGER.info(f"exists: {found}")
+                return found, 0
+            return download_part(url, sha256=sha256, desc=desc)
+
+
+def download_part(
+    url: str, *, sha256: Optional[str], desc: str
+) -> Tuple[pathlib.Path, int]:
+    # resume or start .part. part_lock is held
+    part = get_part_path(url)
+    LOGGER.info(f"download: {url} => {part}")
+    with history.phase("download"):
+        size = download.download(url, part, desc=desc)
+    return add(part, url=url, sha256=sha256), size
+
+
+def has_partial(url: str) -> bool:
+    part = get_part_path(url)
+    return part.exists() or part.with_name(f"{part.name}.segments").exists()
+
+
+def fetch_stream(
+    url: str,
+    consume: Callable[[BinaryIO], None],
+    *,
+    sha256: Optional[str] = None,
+    desc: str = "",
+) -> Tuple[pathlib.Path, int]:
+    # download in a thread. consume reads the content while it arrives
+    with get_url_lock(url), part_lock(url):
+        part = get_part_path(url)
+        if part.exists():
+            os.remove(part)
+        LOGGER.info(f"download: {url} => {part}")
+        pipe = download.ChunkPipe()
+        result = []
+        errors = []
+        run = history.current()
+
+        def producer():
+            try:
+                with history.attach(run), history.phase("download"):
+                    result.append(
+                        download.download(url, part, desc=desc, on_chunk=pipe.put)
+                    )
+            except Exception as e:
+                errors.append(e)
+            finally:
+                pipe.close()
+
+        thread = threading.Thread(target=producer, daemon=True)
+        thread.start()
+        try:
+            consume(pipe)  # type: ignore
+            pipe.drain()
+        except Exception:
+            # stop the download before the join
+            pipe.abort()
+            thread.join()
+            # truncated stream
+            errors = [e for e in errors if not isinstance(e, download.PipeAborted)]
+            if errors:
+                raise errors[0]
+            raise
+        thread.join()
+        if errors:
+            raise errors[0]
+        return add(part, url=url, sha256=sha256), result[0]
@@ -0,0 +1,100 @@
+from typing import Dict, Callable, Any
+import json
+import hashlib
+import logging
+import pathlib
+from colorama import Fore
+from . import runenv
+from . import history
+from .source import Source
+
+LOGGER = logging.getLogger(__name__)
+
+STAMPS_JSON = ".toprefix-stamps.json"
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def fingerprint(inputs: Dict[str, Any]) -> str:
+    return hash_bytes(json.dumps(inputs, sort_keys=True).encode("utf-8"))
+
+
+def source_inputs(source: Source) -> Dict[str, Any]:
+    return {
+        "source": source.fingerprint(),
+        "patches": [hash_bytes(patch.read_bytes()) for patch in source.patches],
+        "prefix": str(runenv.PREFIX),
+    }
+
+
+def toolchain(*cmds: str) -> Dict[str, str]:
+    return {cmd: runenv.tool_version(cmd) for cmd in cmds}
+
+
+class Stamps:
+    # stage => inputs of the last successful run. kept in the source tree
+    def __init__(self, dir: pathlib.Path) -> None:
+        self.path = dir / STAMPS_JSON
+        self.stages: Dict[str, dict] = {}
+        if self.path.exists():
+            try:
+                self.stages = json.loads(self.path.read_text(encoding="utf-8"))
+            except json.JSONDecodeError:
+                LOGGER.warning(f"broken: {self.path}")
+
+    def save(self):
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.stages, indent=2), encoding="utf-8")
+        tmp.replace(self.path)
+
+    def clear(self):
+        self.stages.clear()
+        if self.path.exists():
+            self.path.unlink()
+
+    def why(self, stage: str, inputs: Dict[str, Any]) -> str:
+        # empty if up to date
+        last = self.stages.get(stage)
+        if not last:
+            return "no stamp"
+        changed = sorted(
+            k
+            for k in set(inputs) | set(last["inputs"])
+            if inputs.get(k) != last["inputs"].get(k)
+        )
+        if changed:
+            return f"{', '.join(changed)} changed"
+        return ""
+
+    def run(
+        self,
+        stage: str,
+        inputs: Dict[str, Any],
+        func: Callable[[], None],
+        *,
+        force: bool = False,
+    ) -> str:
+        # run func unless inputs are same as last time. returns fingerprint
+        if stage == "install" and "DESTDIR" in runenv.get_overlay():
+            # staged to a new directory every time
+            force = True
+        why = "forced" if force else self.why(stage, inputs)
+        if not why:
+            LOGGER.info(f"{stage}: {Fore.GREEN}up to date{Fore.RESET}")
+            return self.stages[stage]["fingerprint"]
+
+        LOGGER.info(f"{stage}: {why}")
+        # invalidate this and later stages until it succeeds
+        if stage in self.stages:
+            stages = list(self.stages)
+            for k in stages[stages.index(stage) :]:
+                del self.stages[k]
+        self.save()
+        with history.phase(stage):
+            func()
+        value = fingerprint(inputs)
+        self.stages[stage] = {"fingerprint": value, "inputs": inputs}
+        self.save()
+        return value
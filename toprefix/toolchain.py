@@ -0,0 +1,174 @@
+from typing import Dict, List, Optional, Tuple
+import os
+import json
+import logging
+import pathlib
+import threading
+import subprocess
+from . import runenv
+
+LOGGER = logging.getLogger(__name__)
+
+# LOCAL_SRC/.toolchain.json
+#
+# executable name => path of the first PATH entry, and `--version` of probed tools.
+# rebuilt when PATH or the mtime of a PATH directory changes
+
+TOOLCHAIN_VERSION = 1
+VERSION_TIMEOUT = 30
+
+
+def dir_mtime(dir: str) -> int:
+    try:
+        return os.stat(dir).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def file_mtime(path: str) -> int:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def scan(path_list: List[str]) -> Dict[str, str]:
+    index: Dict[str, str] = {}
+    for dir in path_list:
+        try:
+            entries = list(os.scandir(dir))
+        except OSError:
+            continue
+        for entry in entries:
+            name = entry.name
+            if runenv.IS_WINDOWS:
+                if not name.lower().endswith(runenv.EXE):
+                    continue
+                # case insensitive
+                name = name[0 : -len(runenv.EXE)].lower()
+            # first PATH entry wins
+            if name not in index:
+                try:
+                    if entry.is_dir():
+                        continue
+                except OSError:
+                    continue
+                index[name] = entry.path
+    return index
+
+
+def probe_version(path: str) -> str:
+    # first line of `tool --version`
+    try:
+        output = subprocess.run(
+            [path, "--version"],
+            capture_output=True,
+            text=True,
+            timeout=VERSION_TIMEOUT,
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return ""
+    lines = output.strip().splitlines()
+    return lines[0] if lines else ""
+
+
+class Toolchain:
+    def __init__(self, path_list: List[str], cache: Optional[pathlib.Path]) -> None:
+        self.path_list = list(path_list)
+        self.cache = cache
+        self.lock = threading.Lock()
+        self.mtimes = {dir: dir_mtime(dir) for dir in self.path_list}
+        self.index: Dict[str, str] = {}
+        # name => {"path", "mtime", "version"}
+        self.versions: Dict[str, dict] = {}
+        if not self.load():
+            LOGGER.debug(f"toolchain: scan {len(self.path_list)} dirs")
+            self.index = scan(self.path_list)
+            self.save()
+
+    def load(self) -> bool:
+        if not self.cache:
+            return False
+        try:
+            data = json.loads(self.cache.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return False
+        if (
+            data.get("version") != TOOLCHAIN_VERSION
+            or data.get("path") != self.path_list
+            or data.get("mtimes") != self.mtimes
+        ):
+            return False
+        self.index = data["index"]
+        self.versions = data["versions"]
+        return True
+
+    def save(self):
+        if not self.cache:
+            return
+        data = {
+            "version": TOOLCHAIN_VERSION,
+            "path": self.path_list,
+            "mtimes": self.mtimes,
+            "index": self.index,
+            "versions": self.versions,
+        }
+        try:
+            self.cache.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.cache.with_name(
+                f"{self.cache.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+            )
+            tmp.write_text(json.dumps(data), encoding="utf-8")
+            os.replace(tmp, self.cache)
+        except OSError as e:
+            LOGGER.warning(f"toolchain: {e}")
+
+    def get(self, cmd: str) -> Optional[str]:
+        return self.index.get(cmd.lower() if runenv.IS_WINDOWS else cmd)
+
+    def which(self, cmd: str) -> Optional[pathlib.Path]:
+        found = self.get(cmd)
+        return pathlib.Path(found) if found else None
+
+    def version(self, cmd: str) -> str:
+        found = self.get(cmd)
+        if not found:
+            return ""
+        mtime = file_mtime(found)
+        with self.lock:
+            cached = self.versions.get(cmd)
+            if cached and cached["path"] == found and cached["mtime"] == mtime:
+                return cached["version"]
+        version = probe_version(found)
+        with self.lock:
+            self.versions[cmd] = {"path": found, "mtime": mtime, "version": version}
+            self.save()
+        return version
+
+    def versions_of(self, *cmds: str) -> Dict[str, str]:
+        return {cmd: self.version(cmd) for cmd in cmds}
+
+
+TOOLCHAIN: Optional[Toolchain] = None
+TOOLCHAIN_KEY: Optional[Tuple[Tuple[str, ...], pathlib.Path]] = None
+TOOLCHAIN_LOCK = threading.Lock()
+
+
+def get_toolchain() -> Toolchain:
+    # runenv.PATH_LIST and LOCAL_SRC are replaced by tests and benchmarks
+    global TOOLCHAIN, TOOLCHAIN_KEY
+    cache = runenv.LOCAL_SRC / ".toolchain.json"
+    key = (tuple(runenv.PATH_LIST), cache)
+    with TOOLCHAIN_LOCK:
+        if not TOOLCHAIN or TOOLCHAIN_KEY != key:
+            TOOLCHAIN = Toolchain(runenv.PATH_LIST, cache)
+            TOOLCHAIN_KEY = key
+        return TOOLCHAIN
+
+
+def which(cmd: str) -> Optional[pathlib.Path]:
+    return get_toolchain().which(cmd)
+
+
+def version(cmd: str) -> str:
+    return get_toolchain().version(cmd)
@@ -5,25 +5,23 @@ import subprocess
 import pathlib
 import json
 
-if platform.system() == "Windows":
-    import vswhere
 
-KITS = (
-    pathlib.Path(f"{os.environ['LOCALAPPDATA']}/CMakeTools/cmake-tools-kits.json")
-    if platform.system() == "Windows"
-    else pathlib.Path(
+def get_kits() -> pathlib.Path:
+    if platform.system() == "Windows":
+        return pathlib.Path(
+            f"{os.environ['LOCALAPPDATA']}/CMakeTools/cmake-tools-kits.json"
+        )
+    return pathlib.Path(
         f"{os.environ['HOME']}/.local/share/CMakeTools/cmake-tools-kits.json"
     )
-)
+
 
 # VCBARS64_2019 = 'C:\\Program Files (x86)\\Microsoft Visual Studio\\2019\\BuildTools\\VC\\Auxiliary\\Build\\vcvars64.bat'
 # VCBARS64_2022 = "C:\\Program Files (x86)\\Microsoft Visual Studio\\2022\\BuildTools\\VC\\Auxiliary\\Build\\vcvars64.bat"
 
 
 def select_x64_kit() -> Optional[dict]:
-    KITS = pathlib.Path(
-        f"{os.environ['LOCALAPPDATA']}/CMakeTools/cmake-tools-kits.json"
-    )
+    KITS = get_kits()
     if KITS.exists():
         parsed = json.loads(KITS.read_text(encoding="utf-8"))
         for kit in parsed:
@@ -38,6 +36,8 @@ def select_x64_kit() -> Optional[dict]:
 
 
 def get_vs_path(name: str) -> Optional[pathlib.Path]:
+    import vswhere
+
     for product in vswhere.find(products="*"):
         if product["displayName"] == name:
             return pathlib.Path(product["installationPath"])
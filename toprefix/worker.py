@@ -0,0 +1,396 @@
+from typing import Callable, List, Optional, Tuple, BinaryIO
+import os
+import re
+import hmac
+import json
+import queue
+import ipaddress
+import socket
+import logging
+import pathlib
+import tempfile
+import threading
+import contextlib
+import socketserver
+from . import runenv
+from . import stamp
+from . import history
+from . import builddir
+from . import artifact
+from .package import Pkg
+
+LOGGER = logging.getLogger(__name__)
+
+# distributed builds. each message is a json line, followed by the bytes of an artifact
+#
+# coordinator => worker
+#   {"op": "info", "token"} => {"slots", "platform", "prefix"}
+#   {"op": "build", "token", "name", "key", "recipe", "build_type", "deps": [[name, key], ...], "clean", "reconfigure"}
+#     <= {"need": [names of deps not in the worker cache]}
+#     => {"name", "size"} + artifact for each need
+#     <= {"status": "ok", "size"} + artifact or {"status": "error", "error"}
+#
+# workers need the same PREFIX, platform and recipes. the recipe fingerprint is checked.
+# toprefix.toml
+# workers = ["box1:8765", "box2:8765"]
+# worker_token = "secret" # same on both sides
+
+DEFAULT_PORT = 8765
+CONNECT_TIMEOUT = 10
+CHUNK_SIZE = 1024 * 1024
+# seconds. recheck live workers while all slots are busy
+IDLE_POLL = 1.0
+# artifact keys are sha256. used as file names in the cache
+KEY_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def get_token() -> str:
+    return runenv.get_config().get("worker_token", "")
+
+
+def parse_address(address: str) -> Tuple[str, int]:
+    host, _, port = address.rpartition(":")
+    if not host:
+        return address, DEFAULT_PORT
+    return host, int(port)
+
+
+def recipe_fingerprint(pkg: Pkg) -> str:
+    # the worker builds the same thing
+    return stamp.fingerprint(
+        {
+            "recipe": pkg.recipe,
+            "prefix": str(runenv.get_prefix()),
+            "platform": artifact.get_platform(),
+            "build_type": builddir.get_build_type(),
+        }
+    )
+
+
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def check_key(key) -> str:
+    if not isinstance(key, str) or not KEY_PATTERN.match(key):
+        raise Exception(f"invalid artifact key: {key!r}")
+    return key
+
+
+def send_json(f: BinaryIO, data: dict):
+    f.write(json.dumps(data).encode("utf-8") + b"\n")
+    f.flush()
+
+
+def recv_json(f: BinaryIO) -> dict:
+    line = f.readline()
+    if not line:
+        raise ConnectionError("connection closed")
+    return json.loads(line)
+
+
+def send_file(f: BinaryIO, path: pathlib.Path):
+    with path.open("rb") as src:
+        while True:
+            chunk = src.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            f.write(chunk)
+    f.flush()
+
+
+def recv_file(f: BinaryIO, size: int, dst: pathlib.Path):
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(f"{dst.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with tmp.open("wb") as w:
+            while size > 0:
+                chunk = f.read(min(size, CHUNK_SIZE))
+                if not chunk:
+                    raise ConnectionError("connection closed")
+                w.write(chunk)
+                size -= len(chunk)
+        os.replace(tmp, dst)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+class Worker:
+    def __init__(
+        self,
+        get_pkg: Callable[[str], Optional[Pkg]],
+        *,
+        host: str = "127.0.0.1",
+        port: int = DEFAULT_PORT,
+        slots: int = 1,
+        cache: Optional[artifact.ArtifactCache] = None,
+        token: str = "",
+    ) -> None:
+        if not token and not is_loopback(host):
+            # anyone could install artifacts to PREFIX
+            raise Exception(f"worker: --bind {host} needs worker_token in toprefix.toml")
+        self.get_pkg = get_pkg
+        self.slots = max(1, slots)
+        self.semaphore = threading.Semaphore(self.slots)
+        self.cache = cache or artifact.ArtifactCache()
+        self.token = token
+        # deps are installed to the shared PREFIX one at a time
+        self.deps_lock = threading.Lock()
+        worker = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                worker.handle(self.rfile, self.wfile)  # type: ignore
+
+        self.server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.address = "%s:%d" % self.server.server_address[:2]
+
+    def serve_forever(self):
+        LOGGER.info(f"worker: {self.address} slots={self.slots}")
+        self.server.serve_forever()
+
+    def __enter__(self) -> "Worker":
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handle(self, r: BinaryIO, w: BinaryIO):
+        try:
+            request = recv_json(r)
+        except (ConnectionError, json.JSONDecodeError):
+            return
+        if not hmac.compare_digest(request.get("token", ""), self.token):
+            send_json(w, {"status": "error", "error": "invalid token"})
+            return
+        try:
+            match request.get("op"):
+                case "info":
+                    send_json(
+                        w,
+                        {
+                            "slots": self.slots,
+                            "platform": artifact.get_platform(),
+                            "prefix": str(runenv.get_prefix()),
+                        },
+                    )
+                case "build":
+                    # the build type of the coordinator
+                    with self.semaphore, builddir.use(request.get("build_type")):
+                        self.build(request, r, w)
+                case op:
+                    send_json(w, {"status": "error", "error": f"unknown op: {op}"})
+        except ConnectionError as e:
+            LOGGER.warning(f"worker: {e}")
+        except Exception as e:
+            LOGGER.error(f"worker: {request.get('name')}: {e}")
+            send_json(w, {"status": "error", "error": str(e)})
+
+    def build(self, request: dict, r: BinaryIO, w: BinaryIO):
+        name = request["name"]
+        pkg = self.get_pkg(name)
+        if not pkg:
+            raise Exception(f"{name} not found")
+        if recipe_fingerprint(pkg) != request["recipe"]:
+            raise Exception(f"{name}: recipe, prefix or platform differs")
+        check_key(request["key"])
+        deps: List[Tuple[str, Optional[Pkg], str]] = []
+        for dep, key in request["deps"]:
+            check_key(key)
+            dep_pkg = self.get_pkg(dep)
+            if not dep_pkg:
+                raise Exception(f"{dep} not found")
+            deps.append((dep, dep_pkg, key))
+
+        need = [dep for dep, _, key in deps if not self.cache.path(key).exists()]
+        send_json(w, {"need": need})
+        keys = {dep: key for dep, _, key in deps}
+        for _ in need:
+            header = recv_json(r)
+            recv_file(r, header["size"], self.cache.path(keys[header["name"]]))
+
+        with self.deps_lock:
+            for dep, dep_pkg, key in deps:
+                assert dep_pkg
+                self.cache.restore(dep_pkg, key)
+
+        path = self.cache.path(request["key"])
+        if request["clean"] or request["reconfigure"] or not path.exists():
+            from . import runner
+            from . import jobserver
+            from . import compiler_cache
+
+            LOGGER.info(f"worker: build {name}")
+            client = (
+                jobserver.JOBSERVER.client()
+                if jobserver.JOBSERVER
+                else contextlib.nullcontext()
+            )
+            self.cache.dir.mkdir(parents=True, exist_ok=True)
+            with client, runner.log(name), tempfile.TemporaryDirectory(
+                dir=artifact.get_stage_dir()
+            ) as dname:
+                stage = pathlib.Path(dname)
+                with runenv.setenv(DESTDIR=str(stage)), compiler_cache.measure(name):
+                    pkg.process(
+                        clean=request["clean"], reconfigure=request["reconfigure"]
+                    )
+                artifact.pack(stage, path)
+
+        if not path.exists():
+            # nothing staged
+            send_json(w, {"status": "ok", "size": 0})
+            return
+        send_json(w, {"status": "ok", "size": path.stat().st_size})
+        send_file(w, path)
+
+
+class Coordinator:
+    # install with workers. Pkg.process of scheduler.build
+    def __init__(
+        self,
+        addresses: List[str],
+        get_pkg: Callable[[str], Optional[Pkg]],
+        *,
+        cache: Optional[artifact.ArtifactCache] = None,
+        token: str = "",
+    ) -> None:
+        self.get_pkg = get_pkg
+        self.cache = cache or artifact.ArtifactCache()
+        self.token = token
+        # one entry per worker slot
+        self.idle: "queue.Queue[str]" = queue.Queue()
+        self.slots = 0
+        self.lock = threading.Lock()
+        for address in addresses:
+            try:
+                info = self.request(address, {"op": "info"})
+            except (OSError, ValueError) as e:
+                LOGGER.warning(f"worker: {address}: {e}")
+                continue
+            if info.get("status") == "error":
+                LOGGER.warning(f"worker: {address}: {info['error']}")
+                continue
+            if info["platform"] != artifact.get_platform() or info["prefix"] != str(
+                runenv.get_prefix()
+            ):
+                LOGGER.warning(
+                    f"worker: {address}: {info['platform']} {info['prefix']} differs"
+                )
+                continue
+            LOGGER.info(f"worker: {address} slots={info['slots']}")
+            for _ in range(info["slots"]):
+                self.idle.put(address)
+            self.slots += info["slots"]
+
+    def connect(self, address: str) -> socket.socket:
+        sock = socket.create_connection(parse_address(address), timeout=CONNECT_TIMEOUT)
+        # builds take long
+        sock.settimeout(None)
+        return sock
+
+    def request(self, address: str, data: dict) -> dict:
+        with self.connect(address) as sock, sock.makefile("rwb") as f:
+            send_json(f, {**data, "token": self.token})  # type: ignore
+            return recv_json(f)  # type: ignore
+
+    def all_deps(self, pkg: Pkg) -> List[str]:
+        # transitive, dependencies first
+        order: List[str] = []
+
+        def visit(name: str):
+            if name in order:
+                return
+            dep = self.get_pkg(name)
+            if dep:
+                for x in dep.deps:
+                    visit(x)
+            order.append(name)
+
+        for name in pkg.deps:
+            visit(name)
+        return order
+
+    def remote_build(
+        self, address: str, pkg: Pkg, key: str, *, clean: bool, reconfigure: bool
+    ):
+        name = pkg.source.name
+        # deps built in this session with something staged
+        deps = [
+            [dep, self.cache.keys[dep]]
+            for dep in self.all_deps(pkg)
+            if dep in self.cache.keys and self.cache.path(self.cache.keys[dep]).exists()
+        ]
+        LOGGER.info(f"worker: {name} => {address}")
+        with self.connect(address) as sock, sock.makefile("rwb") as f:
+            send_json(
+                f,  # type: ignore
+                {
+                    "op": "build",
+                    "token": self.token,
+                    "name": name,
+                    "key": key,
+                    "recipe": recipe_fingerprint(pkg),
+                    "build_type": builddir.get_build_type(),
+                    "deps": deps,
+                    "clean": clean,
+                    "reconfigure": reconfigure,
+                },
+            )
+            response = recv_json(f)  # type: ignore
+            if response.get("status") == "error":
+                raise Exception(f"{address}: {response['error']}")
+            keys = dict(deps)
+            for dep in response["need"]:
+                path = self.cache.path(keys[dep])
+                send_json(f, {"name": dep, "size": path.stat().st_size})  # type: ignore
+                send_file(f, path)  # type: ignore
+            response = recv_json(f)  # type: ignore
+            if response["status"] != "ok":
+                raise Exception(f"{address}: {response['error']}")
+            if response["size"]:
+                recv_file(f, response["size"], self.cache.path(key))  # type: ignore
+
+    def process(self, pkg: Pkg, *, clean: bool, reconfigure: bool):
+        name = pkg.source.name
+        pkg.source.fetch()
+        key = artifact.artifact_key(pkg, self.cache.keys)
+        self.cache.keys[name] = key
+        if not clean and not reconfigure and self.cache.restore(pkg, key):
+            return
+
+        while self.slots:
+            try:
+                address = self.idle.get(timeout=IDLE_POLL)
+            except queue.Empty:
+                continue
+            try:
+                with history.phase("remote"):
+                    self.remote_build(
+                        address, pkg, key, clean=clean, reconfigure=reconfigure
+                    )
+            except OSError as e:
+                # unreachable. the slot is not returned
+                LOGGER.warning(f"worker: {address}: {e}")
+                with self.lock:
+                    self.slots -= 1
+                continue
+            except Exception:
+                # build failed on the worker
+                self.idle.put(address)
+                raise
+            self.idle.put(address)
+            if not self.cache.restore(pkg, key):
+                LOGGER.info(f"artifact: {name} nothing staged")
+            return
+
+        LOGGER.info(f"worker: no worker. build {name} here")
+        self.cache.process(pkg, clean=clean, reconfigure=reconfigure)